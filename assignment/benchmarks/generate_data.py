@@ -0,0 +1,155 @@
+"""
+Fill the domain database with synthetic data at benchmark scale.
+
+    python -m benchmarks.generate_data --rows 10M --truncate
+
+--rows is the number of domain_flag rows to aim for, domains are derived from
+it and --mean-flags. Rows are generated server-side with generate_series, so
+nothing is shipped over the wire.
+"""
+import logging
+import time
+import click
+from cli.bulk_load import defer_state_triggers, resume_state_triggers, secondary_indexes
+from cli.db import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK = 500000
+
+# One registration per fqdn: about a fifth of the domains were unregistered
+# again, the rest is still registered. Registrations go back ten years. Ids
+# are drawn from the sequence here, fqdns are unique because they contain them.
+GENERATE_DOMAINS = """
+    INSERT INTO domain (id, fqdn, registered_at, unregistered_at)
+    SELECT r.id,
+           'bench-' || r.id || '.' || (ARRAY['cz', 'com', 'org', 'net', 'eu'])[1 + mod(r.id, 5)],
+           r.registered_at,
+           CASE WHEN random() < %(unregistered_ratio)s
+                THEN r.registered_at + interval '1 day' + random() * (now() - r.registered_at)
+           END
+    FROM (
+        SELECT nextval(pg_get_serial_sequence('domain', 'id')) AS id,
+               now() - random() * interval '10 years' AS registered_at
+        FROM generate_series(1, %(count)s)
+    ) r
+    RETURNING id, registered_at, unregistered_at
+"""
+
+# Flag counts per domain are exponentially distributed around mean_flags, so
+# most domains have a short history and a few have a long one. Periods start
+# anywhere in the registration, may overlap each other and about a third of
+# them are still open. The domains are the ones inserted by the same statement.
+GENERATE_FLAGS = """
+    INSERT INTO domain_flag (domain_id, flag, valid_from, valid_to)
+    SELECT d.id,
+           CASE WHEN p.pick < 0.5 THEN 'EXPIRED'
+                WHEN p.pick < 0.85 THEN 'OUTZONE'
+                ELSE 'DELETE_CANDIDATE' END,
+           p.valid_from,
+           CASE WHEN random() < %(open_ratio)s THEN NULL
+                ELSE p.valid_from + interval '1 hour' + random() * interval '180 days' END
+    FROM (
+        SELECT id, registered_at, unregistered_at,
+               floor(-ln(1 - random()) * %(mean_flags)s)::int AS history
+        FROM new_domains
+    ) d
+    CROSS JOIN LATERAL generate_series(1, d.history) f
+    CROSS JOIN LATERAL (
+        SELECT random() AS pick,
+               d.registered_at + random() * (COALESCE(d.unregistered_at, now()) - d.registered_at) AS valid_from
+    ) p
+"""
+
+GENERATE = f"WITH new_domains AS ({GENERATE_DOMAINS}) {GENERATE_FLAGS}"
+
+
+def parse_rows(value):
+    """Parse a row count like 50000, 1M or 2.5k"""
+    value = str(value).strip().upper()
+    multiplier = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def chunks(total, size):
+    """Yield inclusive (start, stop) ranges covering 1..total"""
+    for start in range(1, total + 1, size):
+        yield start, min(start + size - 1, total)
+
+
+def generate(db, domains, mean_flags, chunk=DEFAULT_CHUNK, unregistered_ratio=0.2, open_ratio=0.3,
+             truncate=False, rebuild_indexes=True):
+    """Generate domains and their flag history chunk by chunk, committing every chunk.
+
+    Like bulk-load, this runs with the domain_state triggers deferred for its
+    session and rebuilds domain_state once at the end.
+    """
+    indexes = secondary_indexes() if rebuild_indexes else []
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            if truncate:
+                cur.execute("TRUNCATE TABLE domain_flag, domain RESTART IDENTITY CASCADE")
+            for name, _ in indexes:
+                cur.execute(f"DROP INDEX IF EXISTS {name}")
+            defer_state_triggers(cur)
+        conn.commit()
+
+        try:
+            flags = 0
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                # New ids come from RETURNING, whatever else takes ids from the sequence meanwhile
+                for start, stop in chunks(domains, chunk):
+                    cur.execute(GENERATE, {'count': stop - start + 1, 'unregistered_ratio': unregistered_ratio,
+                                           'mean_flags': mean_flags, 'open_ratio': open_ratio})
+                    flags += cur.rowcount
+                    conn.commit()
+                    elapsed = time.monotonic() - started
+                    logger.info(f"domains: {stop}/{domains}, flags: {flags}, {(stop + flags) / elapsed:.0f} rows/s")
+        finally:
+            conn.rollback()
+            resume_state_triggers(conn)
+            if indexes:
+                logger.info("Rebuilding secondary indexes...")
+                with conn.cursor() as cur:
+                    for _, statement in indexes:
+                        cur.execute(statement)
+                conn.commit()
+            logger.info("Rebuilding domain_state...")
+            with conn.cursor() as cur:
+                cur.execute("SELECT rebuild_domain_state()")
+            conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE domain")
+            cur.execute("VACUUM ANALYZE domain_flag")
+            cur.execute("VACUUM ANALYZE domain_state")
+        conn.autocommit = False
+    return flags
+
+
+@click.command()
+@click.option('--rows', default='1M', show_default=True,
+              help='Target number of domain_flag rows, e.g. 1M, 10M or 50M.')
+@click.option('--mean-flags', type=click.FloatRange(min=0.1), default=2.5, show_default=True,
+              help='Average flag history length per domain.')
+@click.option('--chunk', type=click.IntRange(min=1), default=DEFAULT_CHUNK, show_default=True,
+              help='Domains generated (and committed) per statement.')
+@click.option('--truncate', is_flag=True, help='Remove all existing domains and flags first.')
+@click.option('--keep-indexes', is_flag=True, help='Maintain the secondary indexes while generating.')
+def main(rows, mean_flags, chunk, truncate, keep_indexes):
+    """Generate synthetic domains and flag history"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    domains = max(1, int(parse_rows(rows) / mean_flags))
+    db = DatabaseManager()
+    try:
+        flags = generate(db, domains, mean_flags, chunk, truncate=truncate, rebuild_indexes=not keep_indexes)
+        logger.info(f"Generated {domains} domains and {flags} flags")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
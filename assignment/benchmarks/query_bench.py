@@ -0,0 +1,169 @@
+"""
+Time the domain queries of cli/db.py and write a JSON report.
+
+    python -m benchmarks.query_bench --output report.json
+    python -m benchmarks.query_bench --baseline baseline.json --tolerance 0.2
+
+Every benchmark is run once on a connection of its own ("cold": new backend,
+empty plan and catalog caches) and then --repeat times on the warm pool. The
+report also holds EXPLAIN (ANALYZE, BUFFERS) of each query and the table
+sizes, so runs on different data sets are not compared by accident.
+"""
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+import click
+from cli.db import DatabaseManager
+
+# name -> (query name for EXPLAIN, callable running it through DatabaseManager)
+BENCHMARKS = {
+    'get_stats': ('stats', lambda db: db.get_stats()),
+    'get_stats_approximate': ('stats_estimate', lambda db: db.get_stats(approximate=True)),
+    'get_active_domains': ('active_domains', lambda db: db.get_active_domains()),
+    'get_flagged_domains': ('flagged_domains', lambda db: db.get_flagged_domains()),
+    'iter_active_domains': ('active_domains', lambda db: sum(1 for _ in db.iter_active_domains())),
+    'iter_flagged_domains': ('flagged_domains', lambda db: sum(1 for _ in db.iter_flagged_domains())),
+}
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def result_size(result):
+    """Rows returned: stats are a single row, the iterators return their count"""
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, int):
+        return result
+    return len(result)
+
+
+def private_url(db_url, name):
+    """db_url with its own application_name, so it gets a pool and backend of its own"""
+    return f"{db_url}{'&' if '?' in db_url else '?'}application_name={name}"
+
+
+def run_benchmark(db, name, run, repeat):
+    """Return cold and warm timings (seconds) of one benchmark.
+
+    The cold run connects through a private single-connection pool that is
+    closed afterwards, the warm runs reuse db's pooled connection.
+    """
+    cold_db = DatabaseManager(private_url(db.db_url, f'query_bench_{name}'), min_connections=1, max_connections=1)
+    try:
+        cold, result = timed(run, cold_db)
+    finally:
+        cold_db.close()
+    warm = [timed(run, db)[0] for _ in range(repeat)]
+    return {
+        'rows': result_size(result),
+        'cold': cold,
+        'warm': {
+            'min': min(warm),
+            'median': statistics.median(warm),
+            'max': max(warm),
+        },
+    }
+
+
+def summarize_plan(plan):
+    """Keep the headline numbers of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan"""
+    root = plan['Plan']
+    return {
+        'planning_ms': plan.get('Planning Time'),
+        'execution_ms': plan.get('Execution Time'),
+        'shared_hit_blocks': root.get('Shared Hit Blocks'),
+        'shared_read_blocks': root.get('Shared Read Blocks'),
+        'plan': plan,
+    }
+
+
+def table_sizes(db):
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT (SELECT COUNT(*) FROM domain), (SELECT COUNT(*) FROM domain_flag)")
+            domains, flags = cur.fetchone()
+            cur.execute("SHOW server_version")
+            version = cur.fetchone()[0]
+    return {'domain': domains, 'domain_flag': flags}, version
+
+
+def run(db_url, names, repeat):
+    """Run the named benchmarks and return the report dict"""
+    db = DatabaseManager(db_url)
+    try:
+        tables, server_version = table_sizes(db)
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'server_version': server_version,
+            'tables': tables,
+            'repeat': repeat,
+            'benchmarks': {},
+        }
+        for name in names:
+            query, func = BENCHMARKS[name]
+            result = run_benchmark(db, name, func, repeat)
+            result['explain'] = summarize_plan(db.explain(query, analyze=True))
+            report['benchmarks'][name] = result
+    finally:
+        db.close()
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of (name, baseline, current) warm medians slower than baseline by more than tolerance"""
+    regressions = []
+    for name, result in report['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None:
+            continue
+        before, now = previous['warm']['median'], result['warm']['median']
+        if now > before * (1 + tolerance):
+            regressions.append((name, before, now))
+    return regressions
+
+
+@click.command()
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default='-', show_default=True,
+              help='Where to write the JSON report.')
+@click.option('--repeat', type=click.IntRange(min=1), default=5, show_default=True,
+              help='Warm runs per benchmark.')
+@click.option('--only', 'names', multiple=True, type=click.Choice(list(BENCHMARKS)),
+              help='Run only these benchmarks (repeatable).')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Earlier report to compare warm medians against; exits with 1 on regression.')
+@click.option('--tolerance', type=click.FloatRange(min=0), default=0.2, show_default=True,
+              help='Allowed slowdown against the baseline, 0.2 = 20%.')
+def main(output, repeat, names, baseline, tolerance):
+    """Benchmark the domain database queries"""
+    report = run(None, names or list(BENCHMARKS), repeat)
+
+    text = json.dumps(report, indent=2, default=str)
+    if output == '-':
+        click.echo(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+    for name, result in report['benchmarks'].items():
+        click.echo(f"{name:<24} rows={result['rows']:<9} cold={result['cold'] * 1000:9.1f} ms  "
+                   f"warm median={result['warm']['median'] * 1000:9.1f} ms", err=True)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), tolerance)
+        for name, before, now in regressions:
+            click.echo(f"REGRESSION {name}: {before * 1000:.1f} ms -> {now * 1000:.1f} ms", err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
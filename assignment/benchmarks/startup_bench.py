@@ -0,0 +1,154 @@
+"""
+Time interpreter startup of the CLI entry points with python -X importtime.
+
+    python -m benchmarks.startup_bench --output startup.json
+    python -m benchmarks.startup_bench --baseline startup.json --tolerance 0.2
+
+Every scenario runs --repeat times in a fresh interpreter. The report holds the
+import time (summed over the top-level imports, so the interpreter's own site
+imports count too), the wall time of the process and the slowest imports. It
+exits with 1 when a scenario goes over its budget, imports a module it should
+never need or got slower than the baseline.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_CLIENT = os.path.join(ROOT, 'file-client')
+HEAVY_MODULES = ('requests', 'grpc', 'psycopg2', 'aiohttp', 'asyncpg')
+
+# name -> (python arguments, modules that must not be imported, import budget in ms)
+SCENARIOS = {
+    'file-client --help': ([FILE_CLIENT, '--help'], HEAVY_MODULES, 150),
+    'file-client rest client': (['-c', "from cli.client import FileClient; FileClient('rest').close()"],
+                                ('grpc', 'psycopg2', 'aiohttp', 'asyncpg'), 300),
+    'file-client grpc client': (['-c', "from cli.client import FileClient; FileClient('grpc').close()"],
+                                ('requests', 'psycopg2', 'aiohttp', 'asyncpg'), 300),
+    'domains --help': (['-m', 'cli.commands', '--help'], HEAVY_MODULES, 150),
+    'domains status --help': (['-m', 'cli.commands', 'status', '--help'], HEAVY_MODULES, 150),
+}
+
+
+def parse_importtime(stderr):
+    """Return {module: (self us, cumulative us, depth)} from python -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def import_total(modules):
+    """Import time in seconds, summed over the top-level imports"""
+    return sum(cumulative for _, cumulative, depth in modules.values() if depth == 0) / 1e6
+
+
+def run_once(args):
+    """Run one scenario in a fresh interpreter, returning (wall seconds, parsed imports)"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise click.ClickException(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+    return wall, parse_importtime(result.stderr)
+
+
+def timings(values):
+    return {'min': min(values), 'median': statistics.median(values), 'max': max(values)}
+
+
+def run_scenario(args, forbidden, repeat, top=10):
+    """Return import and wall timings of one scenario"""
+    runs = [run_once(args) for _ in range(repeat)]
+    modules = runs[-1][1]
+    slowest = sorted(((name, cumulative / 1000) for name, (_, cumulative, depth) in modules.items() if depth <= 1),
+                     key=lambda item: -item[1])[:top]
+    return {
+        'import': timings([import_total(parsed) for _, parsed in runs]),
+        'wall': timings([wall for wall, _ in runs]),
+        'modules': len(modules),
+        'forbidden': sorted(name for name in forbidden if name in modules),
+        'slowest_ms': dict(slowest),
+    }
+
+
+def run(names, repeat):
+    """Run the named scenarios and return the report dict"""
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'benchmarks': {},
+    }
+    for name in names:
+        args, forbidden, budget = SCENARIOS[name]
+        result = run_scenario(args, forbidden, repeat)
+        result['budget_ms'] = budget
+        report['benchmarks'][name] = result
+    return report
+
+
+def check(report, baseline=None, tolerance=0.2):
+    """Return a list of problems: budgets exceeded, forbidden imports and regressions against baseline"""
+    problems = []
+    for name, result in report['benchmarks'].items():
+        median = result['import']['median']
+        if median * 1000 > result['budget_ms']:
+            problems.append(f"{name}: imports took {median * 1000:.1f} ms, budget {result['budget_ms']} ms")
+        if result['forbidden']:
+            problems.append(f"{name}: imported {', '.join(result['forbidden'])}")
+        previous = (baseline or {}).get('benchmarks', {}).get(name)
+        if previous is not None and median > previous['import']['median'] * (1 + tolerance):
+            problems.append(f"{name}: {previous['import']['median'] * 1000:.1f} ms -> {median * 1000:.1f} ms")
+    return problems
+
+
+@click.command()
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default='-', show_default=True,
+              help='Where to write the JSON report.')
+@click.option('--repeat', type=click.IntRange(min=1), default=5, show_default=True,
+              help='Interpreter starts per scenario.')
+@click.option('--only', 'names', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help='Run only these scenarios (repeatable).')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Earlier report to compare import medians against.')
+@click.option('--tolerance', type=click.FloatRange(min=0), default=0.2, show_default=True,
+              help='Allowed slowdown against the baseline, 0.2 = 20%.')
+def main(output, repeat, names, baseline, tolerance):
+    """Benchmark interpreter startup of the CLI entry points"""
+    report = run(names or list(SCENARIOS), repeat)
+
+    text = json.dumps(report, indent=2)
+    if output == '-':
+        click.echo(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+    for name, result in report['benchmarks'].items():
+        click.echo(f"{name:<26} imports={result['import']['median'] * 1000:7.1f} ms  "
+                   f"wall={result['wall']['median'] * 1000:7.1f} ms  budget={result['budget_ms']} ms", err=True)
+
+    previous = None
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+    problems = check(report, previous, tolerance)
+    for problem in problems:
+        click.echo(f"REGRESSION {problem}", err=True)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
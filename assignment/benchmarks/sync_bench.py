@@ -0,0 +1,118 @@
+"""
+Time an initial and a no-change sync of many small files against the local reference server.
+
+    python -m benchmarks.sync_bench --files 100000 --backend grpc --output sync.json
+
+The files are written to a temporary directory and served by cli.file_server
+in its own process. The first sync downloads everything. The second one must
+not download anything or touch a mirrored file. Its time is the stat calls
+plus the manifest comparison, which is also reported on its own.
+"""
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+import click
+from cli.client import FileClient
+from cli.file_server import FileStore
+from cli.sync import MANIFEST_NAME, Manifest, content_changed, sync
+from benchmarks.transfer_bench import start_server
+
+
+def write_files(directory, count):
+    for i in range(count):
+        with open(os.path.join(directory, f'file-{i}.txt'), 'w') as f:
+            f.write(f'{i}\n')
+
+
+def mtimes(directory):
+    with os.scandir(directory) as entries:
+        return {entry.name: entry.stat().st_mtime_ns for entry in entries if not entry.name.startswith(MANIFEST_NAME)}
+
+
+def timed_sync(client, uuids, directory, workers, downloads):
+    started = time.perf_counter()
+    cpu = time.process_time()
+    counts = sync(client, uuids, directory, workers, downloads)
+    seconds = time.perf_counter() - started
+    return {
+        'seconds': seconds,
+        'client_cpu_seconds': time.process_time() - cpu,
+        'files_per_s': len(uuids) / seconds if seconds else 0.0,
+        **counts,
+    }
+
+
+def manifest_seconds(directory):
+    """Time loading the manifest and comparing every entry, without any stat calls"""
+    started = time.perf_counter()
+    with Manifest(os.path.join(directory, MANIFEST_NAME)) as manifest:
+        for entry in manifest.entries().values():
+            content_changed(entry, entry, directory)
+    return time.perf_counter() - started
+
+
+def run(backend, files, workers, downloads):
+    """Run both syncs and return the report dict"""
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'backend': backend,
+        'files': files,
+        'workers': workers,
+        'downloads': downloads,
+    }
+    with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as mirror:
+        write_files(served, files)
+        uuids = list(FileStore.from_directory(served).files)
+        server, rest_url, grpc_address = start_server(served)
+        try:
+            options = dict(base_url=rest_url) if backend == 'rest' else dict(grpc_server=grpc_address)
+            with FileClient(backend, pool_size=workers, **options) as client:
+                report['initial'] = timed_sync(client, uuids, mirror, workers, downloads)
+                before = mtimes(mirror)
+                report['unchanged'] = timed_sync(client, uuids, mirror, workers, downloads)
+                after = mtimes(mirror)
+        finally:
+            server.terminate()
+            server.wait()
+        report['unchanged']['content_touched'] = sum(before[name] != after.get(name) for name in before)
+        report['unchanged']['manifest_seconds'] = manifest_seconds(mirror)
+    return report
+
+
+@click.command()
+@click.option('--backend', type=click.Choice(['rest', 'grpc']), default='grpc', show_default=True)
+@click.option('--files', type=click.IntRange(min=1), default=10000, show_default=True,
+              help='Number of files to mirror.')
+@click.option('--workers', type=click.IntRange(min=1), default=16, show_default=True,
+              help='Concurrent stat calls.')
+@click.option('--downloads', type=click.IntRange(min=1), default=16, show_default=True,
+              help='Concurrent downloads of the initial sync.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default='-', show_default=True,
+              help='Where to write the JSON report.')
+def main(backend, files, workers, downloads, output):
+    """Benchmark an initial and a no-change sync"""
+    report = run(backend, files, workers, downloads)
+
+    text = json.dumps(report, indent=2)
+    if output == '-':
+        click.echo(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+    for phase in ('initial', 'unchanged'):
+        result = report[phase]
+        click.echo(f"{phase:<10} {result['seconds']:8.2f} s  {result['files_per_s']:8.0f} files/s  "
+                   f"downloaded={result['downloaded']}", err=True)
+    unchanged = report['unchanged']
+    click.echo(f"manifest   {unchanged['manifest_seconds']:8.2f} s  content touched={unchanged['content_touched']}",
+               err=True)
+
+
+if __name__ == '__main__':
+    main()
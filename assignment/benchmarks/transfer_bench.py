@@ -0,0 +1,279 @@
+"""
+Drive the file client against the local reference server and write a JSON report.
+
+    python -m benchmarks.transfer_bench --sizes 4K,1M,64M --concurrency 1 --concurrency 8
+    python -m benchmarks.transfer_bench --backend rest --reads 32 --output transfer.json
+    python -m benchmarks.transfer_bench --content csv --compression none --compression gzip
+
+Files of the given sizes are written to a temporary directory and served by
+cli.file_server in its own process. Every (backend, size, concurrency,
+compression) scenario then runs in a fresh client process, so its peak RSS
+is its own. It reports read throughput in MB/s and p50/p99 stat latency.
+One more read goes through a relay counting what the server sends, which
+gives the bytes on the wire (protocol overhead included) against the bytes
+written to the output.
+"""
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+import click
+from cli.client import DEFAULT_CHUNK_SIZE, FileClient
+from cli.compression import CHOICES
+from cli.file_server import FileStore
+
+SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*$', re.IGNORECASE)
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+WRITE_BLOCK = 4 * 1024 * 1024
+
+
+def parse_size(value):
+    """Parse a byte count like 4096, 4K, 1M or 1.5G (binary units)"""
+    match = SIZE.match(value)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def csv_block(size):
+    """Synthetic CSV rows, about as compressible as a domain export"""
+    rng = random.Random(0)
+    rows = []
+    length = 0
+    while length < size:
+        row = (f"{len(rows)},{rng.getrandbits(64):016x},domain-{rng.randrange(10 ** 6)}.cz,"
+               f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d},{rng.random():.6f}\n")
+        rows.append(row)
+        length += len(row)
+    return ''.join(rows).encode()[:size]
+
+
+def write_files(directory, sizes, content='random'):
+    """Write one file of random bytes or CSV text per size, returning {size: relative name}"""
+    names = {}
+    block_size = min(max(sizes), WRITE_BLOCK)
+    block = os.urandom(block_size) if content == 'random' else csv_block(block_size)
+    for size in sizes:
+        name = f"file-{size}.{'bin' if content == 'random' else 'csv'}"
+        with open(os.path.join(directory, name), 'wb') as f:
+            for offset in range(0, size, len(block)):
+                f.write(block[:min(len(block), size - offset)])
+        names[size] = name
+    return names
+
+
+def start_server(directory):
+    """Start cli.file_server on free ports, returning (process, REST base URL, gRPC address)"""
+    process = subprocess.Popen([sys.executable, '-m', 'cli.file_server', '--directory', directory,
+                                '--rest-port', '0', '--grpc-port', '0'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    addresses = {}
+    while len(addresses) < 2:
+        line = process.stdout.readline()
+        if not line:
+            raise click.ClickException("File server exited before listening")
+        kind, address = line.split()
+        addresses[kind] = address
+    return process, addresses['REST'], addresses['gRPC']
+
+
+class CountingRelay:
+    """TCP relay to address counting the bytes the server sends back"""
+
+    def __init__(self, address):
+        host, port = address.rsplit(':', 1)
+        self.upstream = (host, int(port))
+        self.received = 0
+        self._lock = threading.Lock()
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            server = socket.create_connection(self.upstream)
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._pump, args=(client, server, False), daemon=True).start()
+            threading.Thread(target=self._pump, args=(server, client, True), daemon=True).start()
+
+    def _pump(self, src, dst, count):
+        try:
+            while data := src.recv(256 * 1024):
+                if count:
+                    with self._lock:
+                        self.received += len(data)
+                dst.sendall(data)
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def reset(self):
+        with self._lock:
+            self.received = 0
+
+
+def client_options(backend, address):
+    return dict(base_url=address) if backend == 'rest' else dict(grpc_server=address)
+
+
+def wire_bytes(backend, address, uuid, chunk_size, compression):
+    """Read uuid once through a CountingRelay, returning (bytes received from the server, bytes written)"""
+    host_port = address.split('//')[-1].rstrip('/')
+    with CountingRelay(host_port) as relay:
+        relayed = f'http://127.0.0.1:{relay.port}/' if backend == 'rest' else f'127.0.0.1:{relay.port}'
+        with FileClient(backend, chunk_size=chunk_size, compression=compression,
+                        **client_options(backend, relayed)) as client:
+            # Connection set-up and the stat of auto are not part of the read
+            client.stat(uuid)
+            relay.reset()
+            with open(os.devnull, 'wb') as out:
+                written = client.read(uuid, out)
+            return relay.received, written
+
+
+def run_scenario(backend, address, uuid, concurrency, reads, stats, chunk_size, compression='none'):
+    """Measure one scenario in the current process (run in a fresh one by run())"""
+    with FileClient(backend, pool_size=concurrency, chunk_size=chunk_size, compression=compression,
+                    **client_options(backend, address)) as client:
+        client.stat(uuid)
+
+        def timed_stat(_):
+            started = time.perf_counter()
+            client.stat(uuid)
+            return time.perf_counter() - started
+
+        def read(_):
+            with open(os.devnull, 'wb') as out:
+                return client.read(uuid, out)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed_stat, range(stats)))
+            started = time.perf_counter()
+            transferred = sum(pool.map(read, range(reads)))
+            elapsed = time.perf_counter() - started
+
+    wire, output = wire_bytes(backend, address, uuid, chunk_size, compression)
+    return {
+        'reads': reads,
+        'bytes': transferred,
+        'seconds': elapsed,
+        'mb_per_s': transferred / elapsed / 1024 ** 2 if elapsed else 0.0,
+        'stat_ms': {
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+        },
+        'wire_bytes': wire,
+        'output_bytes': output,
+        'wire_ratio': wire / output if output else 0.0,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run(backends, sizes, concurrencies, reads, stats, chunk_size, compressions=('none',), content='random'):
+    """Run every scenario and return the report dict"""
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'content': content,
+        'reads': reads,
+        'stats': stats,
+        'chunk_size': chunk_size,
+        'benchmarks': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        names = write_files(directory, sizes, content)
+        store = FileStore.from_directory(directory)
+        uuids = {stored.name: uuid for uuid, stored in store.files.items()}
+        server, rest_url, grpc_address = start_server(directory)
+        try:
+            for backend in backends:
+                address = rest_url if backend == 'rest' else grpc_address
+                for size in sizes:
+                    for concurrency in concurrencies:
+                        for compression in compressions:
+                            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                                result = pool.submit(run_scenario, backend, address, uuids[names[size]],
+                                                     concurrency, max(reads, concurrency), stats, chunk_size,
+                                                     compression).result()
+                            result.update(backend=backend, size=size, concurrency=concurrency,
+                                          compression=compression)
+                            report['benchmarks'][f"{backend}/{size}/c{concurrency}/{compression}"] = result
+        finally:
+            server.terminate()
+            server.wait()
+    return report
+
+
+@click.command()
+@click.option('--backend', 'backends', multiple=True, type=click.Choice(['rest', 'grpc']),
+              help='Backends to benchmark (repeatable, default: both).')
+@click.option('--sizes', default='4K,1M,32M', show_default=True, help='Comma separated file sizes.')
+@click.option('--concurrency', 'concurrencies', multiple=True, type=click.IntRange(min=1),
+              help='Concurrent requests (repeatable, default: 1 and 8).')
+@click.option('--reads', type=click.IntRange(min=1), default=16, show_default=True,
+              help='Reads per scenario (at least the concurrency).')
+@click.option('--stats', type=click.IntRange(min=1), default=200, show_default=True,
+              help='Stat calls per scenario for the latency percentiles.')
+@click.option('--chunk-size', type=click.IntRange(min=0), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Client read chunk size.')
+@click.option('--compression', 'compressions', multiple=True, type=click.Choice(CHOICES),
+              help='Client --compression settings to compare (repeatable, default: none).')
+@click.option('--content', type=click.Choice(['random', 'csv']), default='random', show_default=True,
+              help='Incompressible random bytes or CSV text.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default='-', show_default=True,
+              help='Where to write the JSON report.')
+def main(backends, sizes, concurrencies, reads, stats, chunk_size, compressions, content, output):
+    """Benchmark REST and gRPC transfers against the local file server"""
+    try:
+        sizes = sorted({parse_size(size) for size in sizes.split(',')})
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--sizes')
+    report = run(backends or ('rest', 'grpc'), sizes, concurrencies or (1, 8), reads, stats, chunk_size,
+                 compressions or ('none',), content)
+
+    text = json.dumps(report, indent=2)
+    if output == '-':
+        click.echo(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+    for name, result in report['benchmarks'].items():
+        click.echo(f"{name:<26} {result['mb_per_s']:9.1f} MB/s  stat p50={result['stat_ms']['p50']:6.2f} ms  "
+                   f"p99={result['stat_ms']['p99']:6.2f} ms  rss={result['peak_rss_mb']:6.1f} MB  "
+                   f"wire/output={result['wire_ratio']:.3f}", err=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import click
+from .client import DEFAULT_RETRIES
+from .download import download
+from .errors import FileClientError
+from .file_client import validate_uuid
+
+
+def iter_uuids(uuids, uuid_file=None):
+    """Yield UUIDs from the command line and then from a file, one per line"""
+    yield from uuids
+    if uuid_file is not None:
+        for line in uuid_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def bounded_map(func, items, workers):
+    """Run func over items on a thread pool, yielding (item, result, error) as they finish.
+
+    At most 2 * workers items are in flight, so a huge (or endless) input
+    stream never turns into a huge queue of pending futures.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def drain(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
+
+        for item in items:
+            if len(pending) >= 2 * workers:
+                yield from drain(FIRST_COMPLETED)
+            pending[pool.submit(func, item)] = item
+        while pending:
+            yield from drain(FIRST_COMPLETED)
+
+
+def read_to_path(client, uuid, path):
+    """Download a file to path, removing the partial file when the read fails"""
+    out = open(path, 'wb')
+    try:
+        with out:
+            return client.read(uuid, out, regular_file=True)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+
+def run_batch(command, uuids, client, output, workers, resume=False, retries=DEFAULT_RETRIES):
+    """stat or read every UUID concurrently through one FileClient.
+
+    stat writes one JSON object per UUID (NDJSON) to output, read stores each
+    file as output/<uuid>. With resume, reads go through cli.download and
+    print the stat with the sha256 of every file as NDJSON on stdout. Each
+    failure is reported on its own. Returns the number of failed UUIDs.
+    """
+    if command == 'read':
+        if output == '-':
+            raise click.UsageError("Batch read needs --output set to a directory")
+        os.makedirs(output, exist_ok=True)
+
+    def task(uuid):
+        if not validate_uuid(uuid):
+            raise FileClientError("Invalid UUID format")
+        if command == 'stat':
+            return client.stat(uuid)
+        if resume:
+            return download(client, uuid, os.path.join(output, uuid), retries)
+        return read_to_path(client, uuid, os.path.join(output, uuid))
+
+    failed = 0
+    stat_out = open(output, 'w') if command == 'stat' and output != '-' else None
+    try:
+        for uuid, result, error in bounded_map(task, uuids, workers):
+            if error is not None and not isinstance(error, (FileClientError, OSError)):
+                raise error
+            failed += error is not None
+
+            if command == 'stat' or resume:
+                record = {'uuid': uuid, 'error': str(error)} if error else {'uuid': uuid, **result}
+                click.echo(json.dumps(record), file=stat_out)
+            elif error:
+                click.echo(f"Error: {uuid}: {error}", err=True)
+    finally:
+        if stat_out is not None:
+            stat_out.close()
+    return failed
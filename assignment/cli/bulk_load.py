@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+import logging
+import os
+import re
+import time
+import click
+from .db import get_db
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'schema.sql')
+DEFAULT_BATCH_SIZE = 100000
+
+DOMAIN_COLUMNS = ('fqdn', 'registered_at', 'unregistered_at')
+FLAG_COLUMNS = ('fqdn', 'flag', 'valid_from', 'valid_to')
+
+# Flags reference domains by fqdn. A fqdn can be registered several times, so
+# each flag goes to the latest registration that started before the flag did.
+# This is a set-based join (hash join on fqdn), so it stays fast even while
+# the secondary indexes are dropped.
+RESOLVE_FLAGS = """
+    INSERT INTO domain_flag (domain_id, flag, valid_from, valid_to)
+    SELECT DISTINCT ON (s.row_id) d.id, s.flag, s.valid_from, s.valid_to
+    FROM flag_staging s
+    JOIN domain d
+      ON d.fqdn = s.fqdn
+     AND d.registered_at <= s.valid_from
+    ORDER BY s.row_id, d.registered_at DESC
+"""
+
+
+# Indexes kept during a bulk load: the foreign key lookups of domain_flag
+# (ON DELETE CASCADE, domain_state refreshes) go through idx_flag_domain_id
+KEPT_INDEXES = ('idx_flag_domain_id',)
+
+
+def secondary_indexes(schema_file=SCHEMA_FILE):
+    """Return (name, CREATE INDEX statement) pairs defined in schema.sql, except KEPT_INDEXES"""
+    with open(schema_file) as f:
+        schema = f.read()
+    return [(m.group(1), m.group(0)) for m in re.finditer(r'CREATE INDEX (\w+) ON [^;]+;', schema)
+            if m.group(1) not in KEPT_INDEXES]
+
+
+def defer_state_triggers(cur):
+    """Make the domain_state and notify triggers skip this session's statements.
+
+    The setting only lives as long as the connection, so a load that is
+    killed halfway leaves the triggers working for everyone else. Commit it
+    before the load and end it with resume_state_triggers().
+    """
+    cur.execute("SET domain_state.deferred = on")
+
+
+def resume_state_triggers(conn):
+    """Undo defer_state_triggers() before the connection goes back to the pool"""
+    with conn.cursor() as cur:
+        cur.execute("RESET domain_state.deferred")
+    conn.commit()
+
+
+def read_rows(path, columns):
+    """Yield tuples of columns from a CSV (with header) or NDJSON file"""
+    with open(path, newline='') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(column) for column in columns)
+        else:
+            for record in csv.DictReader(f):
+                yield tuple(record.get(column) or None for column in columns)
+
+
+def batches(rows, batch_size):
+    """Group rows into lists of at most batch_size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(cur, table, columns, rows):
+    """COPY rows into table through an in-memory CSV buffer"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+class Progress:
+    """Log loaded rows and throughput after every batch"""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, rows):
+        self.rows += rows
+        elapsed = time.monotonic() - self.started
+        logger.info(f"{self.label}: {self.rows} rows, {self.rows / elapsed if elapsed else 0:.0f} rows/s")
+
+
+def load_domains(conn, path, batch_size=DEFAULT_BATCH_SIZE):
+    """COPY domains from path in batches, committing each one. Returns the row count."""
+    progress = Progress("domains")
+    with conn.cursor() as cur:
+        for batch in batches(read_rows(path, DOMAIN_COLUMNS), batch_size):
+            copy_rows(cur, 'domain', DOMAIN_COLUMNS, batch)
+            conn.commit()
+            progress.add(len(batch))
+    return progress.rows
+
+
+def load_flags(conn, path, batch_size=DEFAULT_BATCH_SIZE):
+    """COPY flags from path into a staging table and resolve fqdns in bulk, per batch.
+
+    Returns (loaded, unresolved) where unresolved counts flags whose fqdn had
+    no registration starting before the flag.
+    """
+    progress = Progress("flags")
+    unresolved = 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS flag_staging (
+                row_id BIGSERIAL,
+                fqdn VARCHAR(255),
+                flag VARCHAR(32),
+                valid_from TIMESTAMP WITH TIME ZONE,
+                valid_to TIMESTAMP WITH TIME ZONE
+            )
+        """)
+        for batch in batches(read_rows(path, FLAG_COLUMNS), batch_size):
+            copy_rows(cur, 'flag_staging', FLAG_COLUMNS, batch)
+            cur.execute(RESOLVE_FLAGS)
+            inserted = cur.rowcount
+            unresolved += len(batch) - inserted
+            cur.execute("TRUNCATE flag_staging")
+            conn.commit()
+            progress.add(inserted)
+        cur.execute("DROP TABLE flag_staging")
+    return progress.rows, unresolved
+
+
+def bulk_load(db, domains=None, flags=None, batch_size=DEFAULT_BATCH_SIZE, truncate=False, rebuild_indexes=False):
+    """Load domain and flag files, optionally dropping secondary indexes for the duration.
+
+    The domain_state triggers are deferred for this session while loading,
+    they would otherwise recompute every touched domain per batch, and
+    domain_state is rebuilt once at the end.
+    """
+    indexes = secondary_indexes() if rebuild_indexes else []
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            if truncate:
+                logger.info("Clearing existing data...")
+                cur.execute("TRUNCATE TABLE domain_flag, domain RESTART IDENTITY CASCADE")
+            for name, _ in indexes:
+                cur.execute(f"DROP INDEX IF EXISTS {name}")
+            defer_state_triggers(cur)
+        conn.commit()
+
+        try:
+            if domains:
+                load_domains(conn, domains, batch_size)
+            if flags:
+                _, unresolved = load_flags(conn, flags, batch_size)
+                if unresolved:
+                    logger.warning(f"{unresolved} flags skipped, no matching domain registration")
+        finally:
+            conn.rollback()
+            resume_state_triggers(conn)
+            if indexes:
+                logger.info("Rebuilding secondary indexes...")
+                started = time.monotonic()
+                with conn.cursor() as cur:
+                    for _, statement in indexes:
+                        cur.execute(statement)
+                    cur.execute("ANALYZE domain, domain_flag")
+                conn.commit()
+                logger.info(f"Indexes rebuilt in {time.monotonic() - started:.1f}s")
+            logger.info("Rebuilding domain_state...")
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute("SELECT rebuild_domain_state()")
+            conn.commit()
+            logger.info(f"domain_state rebuilt in {time.monotonic() - started:.1f}s")
+
+
+@click.command('bulk-load')
+@click.option('--domains', type=click.Path(exists=True, dir_okay=False),
+              help='CSV (fqdn,registered_at,unregistered_at) or NDJSON file of domains.')
+@click.option('--flags', type=click.Path(exists=True, dir_okay=False),
+              help='CSV (fqdn,flag,valid_from,valid_to) or NDJSON file of domain flags.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows per COPY batch, each batch is committed on its own.')
+@click.option('--truncate', is_flag=True, help='Remove all existing domains and flags first.')
+@click.option('--rebuild-indexes', is_flag=True,
+              help='Drop the secondary indexes from sql/schema.sql during the load and recreate them after.')
+def bulk_load_command(domains, flags, batch_size, truncate, rebuild_indexes):
+    """Bulk import domains and flag history with COPY"""
+    if not domains and not flags:
+        raise click.UsageError("Nothing to load, pass --domains and/or --flags")
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    bulk_load(get_db(), domains, flags, batch_size, truncate, rebuild_indexes)
+
+
+if __name__ == "__main__":
+    bulk_load_command()
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from .client import DEFAULT_CHUNK_SIZE
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+DEFAULT_STAT_TTL = 300
+
+
+def copy_to_output(path, out):
+    """Copy a cached file to out, in the kernel with sendfile when out has a file descriptor"""
+    with open(path, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        try:
+            out_fd = out.fileno()
+        except (AttributeError, OSError, ValueError):
+            out_fd = None
+
+        if out_fd is not None and hasattr(os, 'sendfile'):
+            out.flush()
+            offset = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(out_fd, src.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return offset
+            except OSError:
+                if offset:
+                    raise
+                # sendfile is not supported for this pair of descriptors
+
+        shutil.copyfileobj(src, out, DEFAULT_CHUNK_SIZE)
+        return size
+
+
+class HashingWriter:
+    """Write to several binary files at once while hashing the data"""
+
+    def __init__(self, *files, digest=None):
+        self.files = files
+        self.digest = digest or hashlib.sha256()
+        self.written = 0
+
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+        self.digest.update(data)
+        self.written += len(data)
+        return len(data)
+
+
+class FileCache:
+    """On-disk cache for file metadata and content.
+
+    Layout under the cache directory:
+      stat/<uuid>.json     cached stat reply with the time it was fetched
+      content/<uuid>.json  digest, size and create_datetime of the cached content
+      blobs/<sha256>       content, shared by all UUIDs with the same bytes
+
+    Stat entries expire after stat_ttl seconds. Content is only served when
+    its size and create_datetime match the current stat. Blobs are evicted
+    least recently used first (by mtime, bumped on every hit) once they take
+    more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE, stat_ttl=DEFAULT_STAT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stat_ttl = stat_ttl
+        self.hits = {'stat': 0, 'read': 0}
+        self.misses = {'stat': 0, 'read': 0}
+        self._lock = threading.Lock()
+        for name in ('stat', 'content', 'blobs', 'tmp'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, kind, name):
+        return os.path.join(self.directory, kind, name)
+
+    def _count(self, kind, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[kind] += 1
+
+    def _load_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store_json(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self._path('tmp', ''))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def get_stat(self, uuid):
+        """Return the cached stat for uuid, or None when missing or expired"""
+        entry = self._load_json(self._path('stat', f'{uuid}.json'))
+        hit = entry is not None and time.time() - entry['fetched_at'] < self.stat_ttl
+        self._count('stat', hit)
+        return entry['stat'] if hit else None
+
+    def put_stat(self, uuid, stat):
+        self._store_json(self._path('stat', f'{uuid}.json'), {'stat': stat, 'fetched_at': time.time()})
+
+    def get_content(self, uuid, stat):
+        """Return the blob path holding uuid's content if it matches stat, else None"""
+        entry = self._load_json(self._path('content', f'{uuid}.json'))
+        path = None
+        if (entry is not None and entry['size'] == stat.get('size')
+                and entry['create_datetime'] == stat.get('create_datetime')):
+            path = self._path('blobs', entry['digest'])
+            try:
+                if os.path.getsize(path) != entry['size']:
+                    path = None
+                else:
+                    os.utime(path)
+            except OSError:
+                path = None
+        self._count('read', path is not None)
+        return path
+
+    def open_content(self):
+        """Open a temporary file for content being downloaded into the cache"""
+        return tempfile.NamedTemporaryFile(dir=self._path('tmp', ''), delete=False)
+
+    def put_content(self, uuid, stat, tmp_path, digest):
+        """Move a downloaded temporary file into the cache as uuid's content"""
+        os.replace(tmp_path, self._path('blobs', digest))
+        self._store_json(self._path('content', f'{uuid}.json'), {
+            'digest': digest,
+            'size': stat.get('size'),
+            'create_datetime': stat.get('create_datetime'),
+        })
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used blobs until the cache fits into max_bytes"""
+        blobs = []
+        total = 0
+        with os.scandir(self._path('blobs', '')) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class CachingClient:
+    """FileClient wrapper answering stat/read from a FileCache first"""
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    def stat(self, uuid):
+        stat = self.cache.get_stat(uuid)
+        if stat is None:
+            stat = self.client.stat(uuid)
+            self.cache.put_stat(uuid, stat)
+        else:
+            self.client.remember_stat(uuid, stat)
+        return stat
+
+    def read(self, uuid, out, regular_file=False, offset=0):
+        if offset:
+            # The rest of a resumed download, not worth caching on its own
+            return self.client.read(uuid, out, regular_file, offset)
+        stat = self.stat(uuid)
+        path = self.cache.get_content(uuid, stat)
+        if path is not None:
+            return copy_to_output(path, out)
+
+        tmp = self.cache.open_content()
+        try:
+            with tmp:
+                if regular_file:
+                    # Downloaded into the cache file itself, which keeps preallocation and
+                    # ranged downloads, then hashed and copied to out
+                    written = self.client.read(uuid, tmp, regular_file)
+                    tmp.seek(0)
+                    digest = hashlib.file_digest(tmp, 'sha256').hexdigest()
+                else:
+                    writer = HashingWriter(out, tmp)
+                    written = self.client.read(uuid, writer)
+                    digest = writer.digest.hexdigest()
+            if regular_file:
+                copy_to_output(tmp.name, out)
+            if written == stat.get('size'):
+                self.cache.put_content(uuid, stat, tmp.name, digest)
+        finally:
+            if os.path.exists(tmp.name):
+                os.unlink(tmp.name)
+        return written
@@ -0,0 +1,447 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from . import compression as compression_lib
+from . import metrics
+from .errors import FileClientError
+
+PROTO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'protos')
+STUB_DIR = os.path.join(PROTO_DIR, 'generated')
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RANGES = 1
+RANGE_MIN_SIZE = 8 * 1024 * 1024
+GRPC_MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+GRPC_KEEPALIVE_TIME_MS = 30000
+GRPC_KEEPALIVE_TIMEOUT_MS = 10000
+# Mimetypes remembered from stat for --compression auto
+MAX_MIMETYPES = 10000
+
+
+def check_response(response):
+    """Raise FileClientError for a non-successful HTTP response"""
+    if response.status_code == 404:
+        raise FileClientError("File not found")
+    if response.status_code >= 400:
+        raise FileClientError(f"HTTP {response.status_code} {response.reason}")
+
+
+def content_length(response):
+    """Return the Content-Length of a response, or None when it is unknown"""
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def content_encoded(response):
+    """Whether the response body is compressed on the wire"""
+    return response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+
+
+def utc_datetime(value):
+    """Format a create_datetime (datetime or ISO 8601 string) as UTC ending in Z.
+
+    Both backends report it like this, so cached and synced files stay valid
+    when the backend changes. Naive values are taken as UTC, strings that are
+    not ISO 8601 are returned unchanged.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + 'Z'
+
+
+def preallocate(f, size):
+    """Reserve disk space for a download of a known size"""
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError:
+        # Not supported by the file system, the file simply grows as it is written
+        pass
+
+
+@lru_cache(maxsize=None)
+def load_grpc_modules():
+    """Import grpc and the file_service stubs, returning the grpc, pb2 and pb2_grpc modules.
+
+    The stubs are precompiled into protos/generated/, they need the grpcio and
+    protobuf versions of requirements.txt.
+    """
+    import grpc
+    if STUB_DIR not in sys.path:
+        sys.path.append(STUB_DIR)
+    import file_service_pb2 as pb2
+    import file_service_pb2_grpc as pb2_grpc
+    return grpc, pb2, pb2_grpc
+
+
+def grpc_error(grpc, error):
+    """Translate a failed gRPC call into a FileClientError"""
+    if error.code() == grpc.StatusCode.NOT_FOUND:
+        return FileClientError("File not found")
+    if error.code() == grpc.StatusCode.INVALID_ARGUMENT:
+        return FileClientError("Invalid UUID format")
+    return FileClientError(f"{error.code().name}: {error.details()}")
+
+
+class StallWatchdog:
+    """Cancel a streaming gRPC call that goes timeout seconds without a message.
+
+    A call deadline would bound the whole transfer, this bounds each wait,
+    like the read timeout of requests. progress() is called per message.
+    """
+
+    def __init__(self, call, timeout):
+        self.call = call
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.stalled = False
+        self._done = threading.Event()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+
+    def progress(self):
+        self.deadline = time.monotonic() + self.timeout
+
+    def _watch(self):
+        while not self._done.wait(max(self.deadline - time.monotonic(), 0)):
+            if time.monotonic() >= self.deadline:
+                self.stalled = True
+                self.call.cancel()
+                return
+
+
+class FileClient:
+    """Long-lived REST/gRPC file service client.
+
+    Owns one pooled keep-alive HTTP session (REST) or one gRPC channel, so
+    every stat/read made through the same client reuses its connections.
+    The connect timeout bounds how long a dead server can stall a call, the
+    read timeout bounds a single wait for data, not a whole transfer.
+
+    compression is one of compression.CHOICES, or None to leave the
+    transport's defaults. Reads then ask for gzip or zstd content, REST with
+    Accept-Encoding, gRPC with accept-encoding metadata for the reply
+    messages (gRPC has no zstd, gzip is asked for instead). auto decides by
+    the mimetype from stat, stat'ing first when the file was not stat'ed yet.
+    """
+
+    def __init__(self, backend='grpc', base_url='http://localhost/', grpc_server='localhost:50051',
+                 chunk_size=DEFAULT_CHUNK_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES, pool_size=DEFAULT_POOL_SIZE,
+                 ranges=DEFAULT_RANGES, compression=None):
+        self.backend = backend
+        self.base_url = base_url.rstrip('/')
+        self.grpc_server = grpc_server
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.ranges = ranges
+        self.compression = compression
+        self._mimetypes = {}
+        self.session = None
+        self.channel = None
+        self._channel_ready = False
+
+        if backend == 'rest':
+            self.session = self._create_session(retries, max(pool_size, ranges))
+        else:
+            grpc, _, pb2_grpc = load_grpc_modules()
+            self.channel = grpc.insecure_channel(grpc_server, options=[
+                ('grpc.keepalive_time_ms', GRPC_KEEPALIVE_TIME_MS),
+                ('grpc.keepalive_timeout_ms', GRPC_KEEPALIVE_TIMEOUT_MS),
+                ('grpc.keepalive_permit_without_calls', 1),
+                ('grpc.max_receive_message_length', GRPC_MAX_MESSAGE_SIZE),
+                ('grpc.max_send_message_length', GRPC_MAX_MESSAGE_SIZE),
+                ('grpc.enable_retries', 1 if retries else 0),
+            ])
+            self.stub = pb2_grpc.FileStub(self.channel)
+
+    @staticmethod
+    def _create_session(retries, pool_size):
+        import requests
+        from urllib3.util.retry import Retry
+        from .timed_http import TimedHTTPAdapter
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def timeout(self):
+        """(connect, read) timeout pair as understood by requests"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+        if self.channel is not None:
+            self.channel.close()
+
+    def stat(self, uuid):
+        """Return file metadata as a dict"""
+        with metrics.transfer(self.backend, 'stat', uuid) as transfer:
+            if self.backend == 'rest':
+                data = self._stat_rest(uuid, transfer)
+            else:
+                data = self._stat_grpc(uuid, transfer)
+        self.remember_stat(uuid, data)
+        return data
+
+    def remember_stat(self, uuid, stat):
+        """Note a stat of uuid obtained elsewhere, e.g. from a cache, so --compression auto does not stat again"""
+        if self.compression == 'auto':
+            if len(self._mimetypes) >= MAX_MIMETYPES:
+                self._mimetypes.pop(next(iter(self._mimetypes)), None)
+            self._mimetypes[uuid] = stat.get('mimetype')
+
+    def _encoding(self, uuid):
+        """Content coding to ask for when reading uuid: 'gzip', 'zstd' or None"""
+        if self.compression == 'auto' and uuid not in self._mimetypes:
+            self.stat(uuid)
+        encoding = compression_lib.choose(self.compression, self._mimetypes.get(uuid))
+        if self.backend == 'grpc' and encoding == 'zstd':
+            return 'gzip'
+        return encoding
+
+    def read(self, uuid, out, regular_file=False, offset=0):
+        """Stream file content into a binary file object, returning the bytes written.
+
+        When out is a freshly opened regular file, REST downloads preallocate
+        its space from the Content-Length header, and with ranges > 1 large
+        files are fetched as concurrent byte ranges.
+
+        With an offset only the content from that byte on is written. REST asks
+        for it with a Range request, gRPC (ReadRequest has no offset) and servers
+        ignoring Range send the whole file and the first offset bytes are dropped.
+        """
+        if self.compression == 'auto' and uuid not in self._mimetypes and not (offset and self.backend == 'rest'):
+            # The mimetype comes from a stat, measured on its own rather than as part of the read
+            self.stat(uuid)
+        with metrics.transfer(self.backend, 'read', uuid) as transfer:
+            if self.backend == 'rest':
+                return self._read_rest(uuid, out, regular_file, transfer, offset)
+            return self._read_grpc(uuid, out, transfer, offset)
+
+    def _stat_rest(self, uuid, transfer=metrics.NO_TRANSFER):
+        import requests
+        try:
+            response = self.session.get(f"{self.base_url}/file/{uuid}/stat/", timeout=self.timeout)
+            transfer.http_response(response)
+            check_response(response)
+            transfer.chunk(len(response.content))
+            data = response.json()
+        except requests.RequestException as e:
+            raise FileClientError(str(e)) from e
+        if isinstance(data.get('create_datetime'), str):
+            data['create_datetime'] = utc_datetime(data['create_datetime'])
+        return data
+
+    def _copy_response(self, response, out, regular_file, transfer=metrics.NO_TRANSFER, skip=0):
+        """Stream a response body into out, dropping its first skip bytes, checking it against Content-Length"""
+        expected = content_length(response)
+        encoded = content_encoded(response)
+        if expected is not None and not encoded:
+            expected -= skip
+        if regular_file and not encoded:
+            preallocate(out, expected)
+        written = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size or DEFAULT_CHUNK_SIZE):
+            transfer.chunk(len(chunk))
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk, skip = memoryview(chunk)[skip:], 0
+            out.write(chunk)
+            written += len(chunk)
+        if regular_file:
+            out.truncate()
+
+        # Content-Length counts the compressed bytes, urllib3 decodes them a chunk at a time
+        received = response.raw.tell() if encoded else written
+        if expected is not None and received != expected:
+            raise FileClientError(f"Incomplete download, got {received} of {expected} bytes")
+        return written
+
+    def _read_rest(self, uuid, out, regular_file, transfer=metrics.NO_TRANSFER, offset=0):
+        import requests
+        if regular_file and self.ranges > 1 and not offset:
+            size = self._stat_rest(uuid).get('size') or 0
+            if size >= RANGE_MIN_SIZE:
+                return self._read_rest_ranged(uuid, out, size, transfer)
+
+        try:
+            if offset:
+                # A range of compressed content is not a range of the file, resumed reads are not compressed
+                headers = {'Range': f'bytes={offset}-', 'Accept-Encoding': 'identity'}
+            elif self.compression is not None:
+                headers = {'Accept-Encoding': self._encoding(uuid) or 'identity'}
+            else:
+                headers = {}
+            options = {'headers': headers} if headers else {}
+            response = self.session.get(f"{self.base_url}/file/{uuid}/read/", timeout=self.timeout,
+                                        stream=True, **options)
+            try:
+                transfer.http_response(response)
+                check_response(response)
+                skip = 0
+                if offset and response.status_code != 206:
+                    # Range ignored, the whole file follows
+                    skip = offset
+                elif offset and not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                    raise FileClientError(f"Server did not honour range {offset}-")
+                return self._copy_response(response, out, regular_file, transfer, skip)
+            finally:
+                response.close()
+        except requests.RequestException as e:
+            raise FileClientError(str(e)) from e
+
+    def _get_range(self, url, start, end):
+        headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+        return self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+
+    def _write_range(self, response, fd, start, end, transfer=metrics.NO_TRANSFER):
+        """Write a 206 response body at its offset in fd"""
+        try:
+            transfer.http_response(response)
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code != 206 or not content_range.startswith(f'bytes {start}-{end}/'):
+                raise FileClientError(f"Server did not honour range {start}-{end}")
+            offset = start
+            for chunk in response.iter_content(chunk_size=self.chunk_size or DEFAULT_CHUNK_SIZE):
+                offset += os.pwrite(fd, chunk, offset)
+                transfer.chunk(len(chunk))
+        finally:
+            response.close()
+        if offset != end + 1:
+            raise FileClientError(f"Incomplete range {start}-{end}, got {offset - start} bytes")
+        return offset - start
+
+    def _read_rest_ranged(self, uuid, out, size, transfer=metrics.NO_TRANSFER):
+        """Download size bytes as concurrent byte ranges written in place with pwrite.
+
+        The first range request doubles as the capability probe: a server that
+        ignores Range answers 200 with the whole body, which is then streamed
+        as usual.
+        """
+        import contextvars
+        import requests
+        from concurrent.futures import ThreadPoolExecutor
+        url = f"{self.base_url}/file/{uuid}/read/"
+        step = -(-size // self.ranges)
+        bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+        try:
+            first = self._get_range(url, *bounds[0])
+            if first.status_code != 206:
+                try:
+                    transfer.http_response(first)
+                    check_response(first)
+                    return self._copy_response(first, out, True, transfer)
+                finally:
+                    first.close()
+
+            out.flush()
+            fd = out.fileno()
+            preallocate(out, size)
+            with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+                # Each range runs in a copy of this context, so its connect time counts towards transfer
+                futures = [pool.submit(self._write_range, first, fd, *bounds[0], transfer)]
+                futures += [pool.submit(contextvars.copy_context().run,
+                                        lambda b: self._write_range(self._get_range(url, *b), fd, *b, transfer), b)
+                            for b in bounds[1:]]
+                written = sum(future.result() for future in futures)
+        except requests.RequestException as e:
+            raise FileClientError(str(e)) from e
+
+        os.ftruncate(fd, size)
+        if written != size:
+            raise FileClientError(f"Incomplete download, got {written} of {size} bytes")
+        return written
+
+    def _wait_for_channel(self, grpc, transfer=metrics.NO_TRANSFER):
+        """Fail fast when the gRPC server cannot be reached within the connect timeout"""
+        if self._channel_ready:
+            return
+        started = time.perf_counter()
+        try:
+            grpc.channel_ready_future(self.channel).result(timeout=self.connect_timeout)
+        except grpc.FutureTimeoutError:
+            raise FileClientError(f"Could not connect to gRPC server {self.grpc_server}") from None
+        transfer.connected(time.perf_counter() - started)
+        self._channel_ready = True
+
+    def _stat_grpc(self, uuid, transfer=metrics.NO_TRANSFER):
+        grpc, pb2, _ = load_grpc_modules()
+        self._wait_for_channel(grpc, transfer)
+        try:
+            reply = self.stub.stat(pb2.StatRequest(uuid=pb2.Uuid(value=uuid)), timeout=self.read_timeout)
+        except grpc.RpcError as e:
+            raise grpc_error(grpc, e) from e
+        transfer.chunk(reply.ByteSize())
+
+        return {
+            'name': reply.data.name,
+            'size': reply.data.size,
+            'mimetype': reply.data.mimetype,
+            'create_datetime': utc_datetime(reply.data.create_datetime.ToDatetime()),
+        }
+
+    def _read_grpc(self, uuid, out, transfer=metrics.NO_TRANSFER, offset=0):
+        grpc, pb2, _ = load_grpc_modules()
+        self._wait_for_channel(grpc, transfer)
+        written = 0
+        skip = offset
+        try:
+            request = pb2.ReadRequest(uuid=pb2.Uuid(value=uuid), size=self.chunk_size)
+            options = {}
+            if self.compression is not None:
+                # Each reply is compressed on its own, so decoding stays bounded by the chunk size
+                options['metadata'] = [('accept-encoding', self._encoding(uuid) or 'identity')]
+            call = self.stub.read(request, **options)
+            # Pull replies one at a time so only a single chunk is held in memory
+            with StallWatchdog(call, self.read_timeout) as watchdog:
+                for reply in call:
+                    watchdog.progress()
+                    data = reply.data.data
+                    transfer.chunk(len(data))
+                    if skip:
+                        if len(data) <= skip:
+                            skip -= len(data)
+                            continue
+                        data, skip = memoryview(data)[skip:], 0
+                    out.write(data)
+                    written += len(data)
+        except grpc.RpcError as e:
+            if watchdog.stalled:
+                raise FileClientError(f"No data from {self.grpc_server} for {self.read_timeout:g}s") from e
+            raise grpc_error(grpc, e) from e
+        return written
@@ -1,42 +1,158 @@
+import importlib
+import sys
 import click
 from datetime import datetime
-from .database import DatabaseManager
+from . import metrics
+from .bulk_load import bulk_load_command
+from .db import DEFAULT_ITERSIZE, get_db, parse_timestamp
+from .partitions import partitions_command
+from .state import state_check_command
+from .sweeper import sweep_command
+from .watch import ActiveDomainWatcher, delta_lines
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """Group whose heavy subcommands are imported only when they are run.
+
+    lazy_commands maps a command name to (module, attribute, short help), the
+    short help being what --help lists without importing the module.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+        self._listing = False
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.commands or name not in self.lazy_commands:
+            return super().get_command(ctx, name)
+        module, attribute, short_help = self.lazy_commands[name]
+        if self._listing:
+            return click.Command(name, short_help=short_help)
+        command = getattr(importlib.import_module(module, __package__), attribute)
+        self.add_command(command, name)
+        return command
+
+    def format_commands(self, ctx, formatter):
+        self._listing = True
+        try:
+            super().format_commands(ctx, formatter)
+        finally:
+            self._listing = False
+
+
+@click.group(cls=LazyGroup, lazy_commands={
+    # aiohttp and asyncpg cost more to import than the rest of the CLI together
+    'serve': ('.service', 'serve_command', 'Serve status, active-domains and flagged-domains over HTTP'),
+})
 @click.version_option(version='1.0.0')
-def cli():
+@click.option('--metrics', 'metrics_format', type=click.Choice(metrics.FORMATS),
+              help='Report the time and row count of every query to stderr, as JSON lines or as Prometheus text '
+                   'when done.')
+@click.pass_context
+def cli(ctx, metrics_format):
     """Domain Management CLI by michal"""
-    pass
+    if metrics_format:
+        ctx.call_on_close(metrics.start(metrics_format, sys.stderr))
+
+
+class Timestamp(click.ParamType):
+    """ISO 8601 date or timestamp, UTC unless it carries an offset"""
+
+    name = 'timestamp'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, datetime):
+            return value
+        try:
+            return parse_timestamp(value)
+        except ValueError:
+            self.fail(f"{value!r} is not an ISO 8601 timestamp, e.g. 2024-02-20 or 2024-02-20T12:00:00+01:00",
+                      param, ctx)
+
+
+def as_of_option(command):
+    return click.option('--as-of', type=Timestamp(),
+                        help='Answer for this point in time instead of now (ISO 8601, UTC by default).')(command)
+
+
+def as_of_title(title, as_of):
+    return f"{title} as of {as_of.isoformat()}" if as_of else title
 
 
 @cli.command()
-def status():
+@click.option('--fast', is_flag=True, help='Show approximate counts from planner statistics instead of counting rows.')
+@as_of_option
+def status(fast, as_of):
     """Show database status"""
+    if fast and as_of:
+        raise click.UsageError("--fast cannot be combined with --as-of")
     click.echo(f"[{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC] Database Status")
     click.echo("Author: michal")
     
     try:
-        db = DatabaseManager()
-        stats = db.get_stats()
+        db = get_db()
+        stats = db.get_stats(approximate=fast, as_of=as_of)
+        approx = "~" if fast else ""
         
         click.echo("Database connected")
-        click.echo(f"  Domains: {stats['total_domains']} total, {stats['active_domains']} active")
-        click.echo(f"  Flags: {stats['total_flags']} total")
+        if as_of:
+            click.echo(f"  As of: {as_of.isoformat()}")
+        click.echo(f"  Domains: {approx}{stats['total_domains']} total, {approx}{stats['active_domains']} active")
+        click.echo(f"  Flags: {approx}{stats['total_flags']} total")
         
     except Exception as e:
         click.echo(f"✗ Database error: {e}")
 
 
+def stream_options(command):
+    """Options shared by the domain listing commands"""
+    command = click.option('--no-count', is_flag=True,
+                           help='With --stream, do not print the number of domains at the end.')(command)
+    command = click.option('--itersize', type=click.IntRange(min=1), default=DEFAULT_ITERSIZE, show_default=True,
+                           help='Rows fetched from the server and written to stdout per batch with --stream.')(command)
+    command = click.option('--stream', is_flag=True,
+                           help='Stream rows from a server-side cursor instead of loading them all first.')(command)
+    return command
+
+
+def echo_domain_stream(title, domains, batch_size, show_count):
+    """Write domains as they arrive in batches of lines, counting them on the way"""
+    click.echo(f"{title}:")
+    count = 0
+    batch = []
+    for domain in domains:
+        batch.append(f"  {domain}")
+        if len(batch) >= batch_size:
+            click.echo("\n".join(batch))
+            count += len(batch)
+            batch = []
+    if batch:
+        click.echo("\n".join(batch))
+        count += len(batch)
+    if show_count:
+        click.echo(f"Total: {count}")
+
+
 @cli.command()
-def active_domains():
+@stream_options
+@as_of_option
+def active_domains(stream, itersize, no_count, as_of):
     """List active domains (registered, not expired)"""
+    title = as_of_title("Active domains", as_of)
     try:
-        db = DatabaseManager()
-        domains = db.get_active_domains()
+        db = get_db()
+        if stream:
+            echo_domain_stream(title, db.iter_active_domains(itersize, as_of=as_of), itersize, not no_count)
+            return
+
+        domains = db.get_active_domains(as_of=as_of)
         
         if domains:
-            click.echo(f"Active domains ({len(domains)}):")
+            click.echo(f"{title} ({len(domains)}):")
             for domain in domains:
                 click.echo(f"  {domain}")
         else:
@@ -47,14 +163,21 @@ def active_domains():
 
 
 @cli.command()
-def flagged_domains():
+@stream_options
+@as_of_option
+def flagged_domains(stream, itersize, no_count, as_of):
     """List domains that had both EXPIRED and OUTZONE flags"""
+    title = as_of_title("Flagged domains", as_of)
     try:
-        db = DatabaseManager()
-        domains = db.get_flagged_domains()
+        db = get_db()
+        if stream:
+            echo_domain_stream(title, db.iter_flagged_domains(itersize, as_of=as_of), itersize, not no_count)
+            return
+
+        domains = db.get_flagged_domains(as_of=as_of)
         
         if domains:
-            click.echo(f"Flagged domains ({len(domains)}):")
+            click.echo(f"{title} ({len(domains)}):")
             for domain in domains:
                 click.echo(f"  {domain}")
         else:
@@ -64,5 +187,36 @@ def flagged_domains():
         click.echo(f"Error: {e}")
 
 
+@cli.command()
+@click.option('--initial', is_flag=True, help='Emit the current active domains as "added" events first.')
+@click.option('--duration', type=click.FloatRange(min=0),
+              help='Stop after this many seconds (default: run until interrupted).')
+def watch(initial, duration):
+    """Stream changes of the active domain set as NDJSON"""
+    def emit(added, removed):
+        lines = delta_lines(added, removed)
+        if lines:
+            click.echo("\n".join(lines))
+
+    try:
+        with ActiveDomainWatcher(get_db()) as watcher:
+            added, removed = watcher.start()
+            if initial:
+                emit(added, removed)
+            for added, removed in watcher.watch(duration):
+                emit(added, removed)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+cli.add_command(bulk_load_command)
+cli.add_command(partitions_command)
+cli.add_command(state_check_command)
+cli.add_command(sweep_command)
+
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,32 @@
+import importlib.util
+
+CHOICES = ('auto', 'gzip', 'zstd', 'none')
+# Besides text/*, the types worth compressing. Images, archives, video and
+# other binary formats are usually compressed already.
+COMPRESSIBLE_TYPES = frozenset([
+    'application/json', 'application/x-ndjson', 'application/xml', 'application/javascript',
+    'application/x-javascript', 'application/sql', 'application/yaml', 'application/x-yaml',
+    'application/csv', 'application/x-sh', 'application/rtf', 'image/svg+xml', 'image/bmp',
+])
+
+
+def zstd_available():
+    """Whether zstd can be decoded here (urllib3 uses the zstandard package for it)"""
+    return importlib.util.find_spec('zstandard') is not None
+
+
+def compressible(mimetype):
+    """Whether content of mimetype is likely to shrink when compressed"""
+    if not mimetype:
+        return False
+    mimetype = mimetype.split(';', 1)[0].strip().lower()
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES or mimetype.endswith(('+json', '+xml'))
+
+
+def choose(compression, mimetype):
+    """Resolve a --compression choice for a file of mimetype to 'gzip', 'zstd' or None"""
+    if compression == 'auto':
+        if not compressible(mimetype):
+            return None
+        return 'zstd' if zstd_available() else 'gzip'
+    return None if compression == 'none' else compression
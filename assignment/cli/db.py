@@ -1,72 +1,337 @@
 import os
-import psycopg2
-from typing import List, Dict
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Iterator
+import click
+from . import metrics
 from .errors import handle_error
 
+# Fixed queries, kept by name so they can be prepared once per pooled connection
+QUERIES = {
+    'stats': """
+        SELECT d.total_domains, d.active_domains, f.total_flags
+        FROM (
+            SELECT COUNT(*) AS total_domains,
+                   COUNT(*) FILTER (WHERE unregistered_at IS NULL) AS active_domains
+            FROM domain
+        ) d
+        CROSS JOIN (SELECT COUNT(*) AS total_flags FROM domain_flag) f
+    """,
+    # Planner estimates maintained by (auto)ANALYZE: no table scans, no long snapshot.
+    # reltuples is -1 for a table that was never analyzed. Autovacuum only
+    # analyzes the leaf partitions of domain_flag, so their estimates are summed.
+    'stats_estimate': """
+        SELECT GREATEST(d.reltuples, 0)::bigint,
+               (GREATEST(d.reltuples, 0) * COALESCE(s.null_frac, 1))::bigint,
+               f.reltuples::bigint
+        FROM pg_class d
+        CROSS JOIN (
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0) AS reltuples
+            FROM pg_partition_tree('domain_flag') t
+            JOIN pg_class c ON c.oid = t.relid
+            WHERE t.isleaf
+        ) f
+        LEFT JOIN pg_stats s
+          ON s.schemaname = current_schema()
+         AND s.tablename = 'domain'
+         AND s.attname = 'unregistered_at'
+        WHERE d.oid = 'domain'::regclass
+    """,
+    # NOT EXISTS plans as an anti-join on idx_flag_open_expired. NOT IN cannot,
+    # because a NULL from the subquery would have to make the whole predicate unknown.
+    # flag = 'EXPIRED' prunes the other flags' sub-partitions of domain_flag.
+    'active_domains': """
+        SELECT d.fqdn
+        FROM domain d
+        WHERE d.unregistered_at IS NULL
+          AND NOT EXISTS (
+            SELECT 1
+            FROM domain_flag df
+            WHERE df.domain_id = d.id
+              AND df.flag = 'EXPIRED'
+              AND df.valid_to IS NULL
+          )
+        ORDER BY d.fqdn
+    """,
+    # Two semi-joins on idx_flag_type_domain: each domain row is checked once
+    # instead of joining every EXPIRED row with every OUTZONE row. Each side
+    # only visits its own flag's sub-partitions.
+    'flagged_domains': """
+        SELECT DISTINCT d.fqdn
+        FROM domain d
+        WHERE EXISTS (
+            SELECT 1 FROM domain_flag df
+            WHERE df.domain_id = d.id AND df.flag = 'EXPIRED'
+          )
+          AND EXISTS (
+            SELECT 1 FROM domain_flag df
+            WHERE df.domain_id = d.id AND df.flag = 'OUTZONE'
+          )
+        ORDER BY d.fqdn
+    """,
+    # Point-in-time variants of the queries above for a timestamp %(as_of)s.
+    # Registrations and flag periods are matched as tstzrange containment or
+    # overlap with (-infinity, as_of] so they can use the GiST range indexes,
+    # valid_from <= as_of lets the planner prune later domain_flag partitions.
+    'stats_as_of': """
+        SELECT (SELECT COUNT(*) FROM domain
+                WHERE tstzrange(registered_at, unregistered_at) && tstzrange(NULL, %(as_of)s, '(]')),
+               (SELECT COUNT(*) FROM domain
+                WHERE tstzrange(registered_at, unregistered_at) @> %(as_of)s::timestamptz),
+               (SELECT COUNT(*) FROM domain_flag
+                WHERE valid_from <= %(as_of)s
+                  AND tstzrange(valid_from, valid_to) && tstzrange(NULL, %(as_of)s, '(]'))
+    """,
+    'active_domains_as_of': """
+        SELECT d.fqdn
+        FROM domain d
+        WHERE tstzrange(d.registered_at, d.unregistered_at) @> %(as_of)s::timestamptz
+          AND NOT EXISTS (
+            SELECT 1
+            FROM domain_flag df
+            WHERE df.domain_id = d.id
+              AND df.flag = 'EXPIRED'
+              AND df.valid_from <= %(as_of)s
+              AND tstzrange(df.valid_from, df.valid_to) @> %(as_of)s::timestamptz
+          )
+        ORDER BY d.fqdn
+    """,
+    'flagged_domains_as_of': """
+        SELECT DISTINCT d.fqdn
+        FROM domain d
+        WHERE tstzrange(d.registered_at, d.unregistered_at) && tstzrange(NULL, %(as_of)s, '(]')
+          AND EXISTS (
+            SELECT 1 FROM domain_flag df
+            WHERE df.domain_id = d.id AND df.flag = 'EXPIRED' AND df.valid_from <= %(as_of)s
+          )
+          AND EXISTS (
+            SELECT 1 FROM domain_flag df
+            WHERE df.domain_id = d.id AND df.flag = 'OUTZONE' AND df.valid_from <= %(as_of)s
+          )
+        ORDER BY d.fqdn
+    """,
+    # Same answers from the trigger-maintained domain_state table, each a
+    # scan of one partial index proportional to the result
+    'active_domains_state': """
+        SELECT fqdn
+        FROM domain_state
+        WHERE registered AND NOT expired
+        ORDER BY fqdn
+    """,
+    'flagged_domains_state': """
+        SELECT DISTINCT fqdn
+        FROM domain_state
+        WHERE ever_expired AND ever_outzone
+        ORDER BY fqdn
+    """,
+}
+
+DEFAULT_ITERSIZE = 10000
+
+
+def env_flag(name, default=False):
+    """Read a boolean environment variable"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date or timestamp, UTC unless it carries an offset"""
+    text = value.strip()
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def domain_query(name, as_of=None, use_state=False):
+    """Name of the query answering a domain lookup (active_domains, flagged_domains).
+
+    domain_state only knows the current state, so as_of always goes to history.
+    """
+    if as_of is not None:
+        return f"{name}_as_of"
+    return f"{name}_state" if use_state else name
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_url = os.getenv("DATABASE_URL")
+    """Domain database access backed by a shared connection pool.
+
+    Pool sizes come from DB_POOL_MIN/DB_POOL_MAX, connections idle for more
+    than DB_POOL_PING_INTERVAL seconds are health-checked on checkout, a
+    checkout waits up to DB_POOL_TIMEOUT seconds while all are in use,
+    DB_PREPARE_STATEMENTS=1 prepares the fixed queries once per connection and
+    DB_USE_STATE_TABLE=1 answers active/flagged lookups from domain_state.
+    """
+
+    def __init__(self, db_url=None, min_connections=None, max_connections=None, prepare=None, use_state=None):
+        self.db_url = db_url or os.getenv("DATABASE_URL")
         if not self.db_url:
             handle_error("DATABASE_URL environment variable not set")
+        self.max_connections = max_connections or int(os.getenv("DB_POOL_MAX", "5"))
+        # A pool capped below DB_POOL_MIN (e.g. sweep --workers 2) opens no more than its cap
+        self.min_connections = min(min_connections or int(os.getenv("DB_POOL_MIN", "1")), self.max_connections)
+        self.ping_interval = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.prepare = env_flag("DB_PREPARE_STATEMENTS") if prepare is None else prepare
+        self.use_state = env_flag("DB_USE_STATE_TABLE") if use_state is None else use_state
+        self._pool = None
 
+    @property
+    def pool(self):
+        if self._pool is None or self._pool.closed:
+            # psycopg2 is only imported once a connection is actually needed
+            from .pool import get_pool
+            try:
+                self._pool = get_pool(self.db_url, self.min_connections, self.max_connections,
+                                      self.ping_interval, self.pool_timeout)
+            except Exception as e:
+                handle_error(f"Failed to connect to database: {e}")
+        return self._pool
+
+    @contextmanager
     def get_connection(self):
+        """Check a connection out of the pool, committing or rolling back on return"""
+        pool = self.pool
         try:
-            return psycopg2.connect(self.db_url)
+            conn = pool.checkout()
         except Exception as e:
             handle_error(f"Failed to connect to database: {e}")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.checkin(conn)
+
+    def close(self):
+        """Stop using the shared pool, which is closed when no other manager uses it"""
+        if self._pool is not None:
+            from .pool import release_pool
+            release_pool(self._pool)
+        self._pool = None
+
+    def domain_query(self, name, as_of=None):
+        """Name of the query answering a domain lookup, from domain_state when enabled"""
+        return domain_query(name, as_of, self.use_state)
+
+    @staticmethod
+    def params(as_of):
+        return None if as_of is None else {'as_of': as_of}
+
+    def execute(self, cur, name, params=None):
+        """Run one of the fixed QUERIES, as a prepared statement when enabled.
 
-    def get_stats(self) -> Dict[str, int]:
-        """Get database statistics."""
+        Queries with parameters are point-in-time lookups, run rarely enough
+        that they are never prepared. With metrics subscribers, a 'query' event
+        with the time and row count is emitted.
+        """
+        started = time.perf_counter() if metrics.enabled() else None
+        if not self.prepare or params:
+            cur.execute(QUERIES[name], params)
+        else:
+            prepared = self.pool.prepared.setdefault(id(cur.connection), set())
+            if name not in prepared:
+                cur.execute(f"PREPARE {name} AS {QUERIES[name]}")
+                prepared.add(name)
+            cur.execute(f"EXECUTE {name}")
+        if started is not None:
+            metrics.emit('query', query=name, seconds=time.perf_counter() - started, rows=cur.rowcount,
+                         streamed=False)
+
+    def explain(self, name, analyze=False, settings=None, params=None):
+        """Return the JSON plan of one of the fixed QUERIES.
+
+        settings are applied with SET LOCAL for this transaction only, e.g.
+        {'enable_seqscan': 'off'} to see the index plan on a tiny table.
+        """
+        options = "FORMAT JSON, ANALYZE, BUFFERS" if analyze else "FORMAT JSON"
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                for setting, value in (settings or {}).items():
+                    cur.execute("SELECT set_config(%s, %s, true)", (setting, str(value)))
+                cur.execute(f"EXPLAIN ({options}) {QUERIES[name]}", params)
+                plan = cur.fetchone()[0]
+            conn.rollback()
+        return plan[0]
+
+    def get_stats(self, approximate=False, as_of=None) -> Dict[str, int]:
+        """Get database statistics in a single round trip.
+
+        With approximate=True the counts are planner estimates from pg_class
+        and pg_stats instead of exact COUNT(*) scans. With as_of the counts
+        are domains registered by, active at and flags started by that time.
+        """
+        if as_of is not None:
+            name = 'stats_as_of'
+        else:
+            name = 'stats_estimate' if approximate else 'stats'
         with self.get_connection() as conn:
             with conn.cursor() as cur:
-                # Total domains
-                cur.execute("SELECT COUNT(*) FROM domain")
-                total_domains = cur.fetchone()[0]
-                
-                # Active domains (not unregistered)
-                cur.execute("SELECT COUNT(*) FROM domain WHERE unregistered_at IS NULL")
-                active_domains = cur.fetchone()[0]
-                
-                # Total flags
-                cur.execute("SELECT COUNT(*) FROM domain_flag")
-                total_flags = cur.fetchone()[0]
-                
+                self.execute(cur, name, self.params(as_of))
+                total_domains, active_domains, total_flags = cur.fetchone()
+
                 return {
                     'total_domains': total_domains,
                     'active_domains': active_domains,
                     'total_flags': total_flags
                 }
 
-    def get_active_domains(self) -> List[str]:
-        """Get list of active domains (registered, not expired)."""
+    def get_active_domains(self, as_of=None) -> List[str]:
+        """Get list of active domains (registered, not expired), now or at as_of."""
         with self.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT d.fqdn
-                    FROM domain d
-                    WHERE d.unregistered_at IS NULL
-                      AND d.id NOT IN (
-                        SELECT df.domain_id 
-                        FROM domain_flag df 
-                        WHERE df.flag = 'EXPIRED' 
-                            AND df.valid_to IS NULL
-                      )
-                    ORDER BY d.fqdn
-                """)
+                self.execute(cur, self.domain_query('active_domains', as_of), self.params(as_of))
                 return [row[0] for row in cur.fetchall()]
 
-    def get_flagged_domains(self) -> List[str]:
-        """Get domains that had both EXPIRED and OUTZONE flags."""
+    def get_flagged_domains(self, as_of=None) -> List[str]:
+        """Get domains that had both EXPIRED and OUTZONE flags, by now or by as_of."""
         with self.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT DISTINCT d.fqdn
-                    FROM domain d
-                    JOIN domain_flag df1 ON d.id = df1.domain_id
-                    JOIN domain_flag df2 ON d.id = df2.domain_id
-                    WHERE df1.flag = 'EXPIRED'
-                      AND df2.flag = 'OUTZONE'
-                    ORDER BY d.fqdn
-                """)
-                return [row[0] for row in cur.fetchall()]
\ No newline at end of file
+                self.execute(cur, self.domain_query('flagged_domains', as_of), self.params(as_of))
+                return [row[0] for row in cur.fetchall()]
+
+    def iter_query(self, name, itersize=DEFAULT_ITERSIZE, params=None) -> Iterator[str]:
+        """Yield the first column of one of the fixed QUERIES through a server-side cursor.
+
+        Rows are fetched itersize at a time, so memory stays flat and the
+        first rows are available before the query has finished.
+        """
+        started = time.perf_counter() if metrics.enabled() else None
+        rows = 0
+        with self.get_connection() as conn:
+            with conn.cursor(name=f"{name}_cursor") as cur:
+                cur.itersize = itersize
+                cur.execute(QUERIES[name], params)
+                for row in cur:
+                    rows += 1
+                    yield row[0]
+        if started is not None:
+            metrics.emit('query', query=name, seconds=time.perf_counter() - started, rows=rows, streamed=True)
+
+    def iter_active_domains(self, itersize=DEFAULT_ITERSIZE, as_of=None) -> Iterator[str]:
+        """Stream active domains (registered, not expired)."""
+        return self.iter_query(self.domain_query('active_domains', as_of), itersize, self.params(as_of))
+
+    def iter_flagged_domains(self, itersize=DEFAULT_ITERSIZE, as_of=None) -> Iterator[str]:
+        """Stream domains that had both EXPIRED and OUTZONE flags."""
+        return self.iter_query(self.domain_query('flagged_domains', as_of), itersize, self.params(as_of))
+
+
+def get_db(**options):
+    """Return the DatabaseManager shared by everything run in this CLI invocation.
+
+    options (e.g. max_connections) are passed to DatabaseManager by the first
+    call, which creates it.
+    """
+    ctx = click.get_current_context().find_root()
+    if ctx.obj is None:
+        ctx.obj = DatabaseManager(**options)
+        ctx.call_on_close(ctx.obj.close)
+    return ctx.obj
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import time
+from .cache import HashingWriter
+from .client import DEFAULT_RETRIES
+from .errors import FileClientError
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+HASH_BLOCK = 1024 * 1024
+BACKOFF = 0.5
+MAX_BACKOFF = 10
+
+
+def part_paths(path):
+    """(partial content, partial state) paths of a download to path"""
+    return path + PART_SUFFIX, path + PART_SUFFIX + '.json'
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def hash_prefix(f, writer, size):
+    """Feed the content already in f to writer's digest, returning where to continue.
+
+    A partial file longer than the file being downloaded cannot be a prefix of
+    it and is emptied.
+    """
+    length = os.fstat(f.fileno()).st_size
+    if size is not None and length > size:
+        f.truncate(0)
+        return 0
+    block = bytearray(HASH_BLOCK)
+    view = memoryview(block)
+    offset = 0
+    while True:
+        n = f.readinto(block)
+        if not n:
+            return offset
+        writer.digest.update(view[:n])
+        offset += n
+
+
+def download(client, uuid, path, retries=DEFAULT_RETRIES, stat=None):
+    """Download uuid to path through path.part, returning its stat with the content's sha256.
+
+    The stat (size and create_datetime) is kept in path.part.json, and a later
+    call continues an existing path.part if it still matches. The content
+    is hashed as it is written, resumed parts are read once to hash their
+    prefix. A failed read is continued from the last byte written, up to
+    retries times in a row without progress. Once all stat size bytes are in,
+    the file is synced and renamed to path, so path is never partial. stat is
+    fetched first unless the caller already has it.
+    """
+    if stat is None:
+        stat = client.stat(uuid)
+    size = stat.get('size')
+    identity = {'size': size, 'create_datetime': stat.get('create_datetime')}
+    part, state = part_paths(path)
+
+    resuming = os.path.isfile(part) and load_state(state) == identity
+    if not resuming:
+        with open(state, 'w') as f:
+            json.dump(identity, f)
+
+    with open(part, 'r+b' if resuming else 'wb') as f:
+        writer = HashingWriter(f)
+        offset = hash_prefix(f, writer, size) if resuming else 0
+        if offset:
+            logger.info(f"{uuid}: resuming at byte {offset}")
+
+        failures = 0
+        while size is None or offset + writer.written < size:
+            before = writer.written
+            try:
+                client.read(uuid, writer, offset=offset + writer.written)
+                if size is None or offset + writer.written >= size:
+                    break
+                error = FileClientError(f"Incomplete download, got {offset + writer.written} of {size} bytes")
+            except FileClientError as e:
+                if str(e) == "File not found":
+                    raise
+                error = e
+            failures = failures + 1 if writer.written == before else 1
+            if failures > retries:
+                raise error
+            delay = min(BACKOFF * 2 ** (failures - 1), MAX_BACKOFF)
+            logger.warning(f"{uuid}: {error}, retrying from byte {offset + writer.written} in {delay:g}s")
+            time.sleep(delay)
+
+        if size is not None and offset + writer.written > size:
+            raise FileClientError(f"Got {offset + writer.written} bytes, expected {size}")
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(part, path)
+    os.unlink(state)
+    return {**stat, 'sha256': writer.digest.hexdigest()}
@@ -4,6 +4,11 @@ import click
 
 logger = logging.getLogger(__name__)
 
+
+class FileClientError(Exception):
+    """A file client request failed (not found, HTTP/gRPC error, ...)"""
+
+
 def handle_error(message, exit_code=1):
     """Handle errors with logging and exit"""
     logger.error(message)
@@ -1,7 +1,18 @@
 import click
-import requests
 import sys
 import uuid as uuid_lib
+from contextlib import contextmanager
+from .client import (
+    FileClient, DEFAULT_CHUNK_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_RETRIES,
+    DEFAULT_RANGES,
+)
+from . import compression as compression_lib
+from . import metrics
+from .cache import FileCache, CachingClient, DEFAULT_CACHE_SIZE, DEFAULT_STAT_TTL
+from .errors import FileClientError
+
+DEFAULT_WORKERS = 16
+DEFAULT_DOWNLOADS = 4
 
 
 def validate_uuid(uuid_str):
@@ -9,7 +20,7 @@ def validate_uuid(uuid_str):
     try:
         uuid_lib.UUID(uuid_str)
         return True
-    except ValueError:
+    except (ValueError, TypeError, AttributeError):
         return False
 
 
@@ -22,6 +33,28 @@ def write_output(content, output_file):
             f.write(content)
 
 
+@contextmanager
+def open_output(output_file):
+    """Open a binary stream for file content (stdout when output is -)"""
+    if output_file == '-':
+        stream = click.get_binary_stream('stdout')
+        try:
+            yield stream
+        finally:
+            stream.flush()
+    else:
+        with open(output_file, 'wb') as f:
+            yield f
+
+
+def format_stat(data):
+    """Format file metadata as human-readable text"""
+    return f"""Name: {data.get('name', 'Unknown')}
+Size: {data.get('size', 0)} bytes
+MIME Type: {data.get('mimetype', 'Unknown')}
+Created: {data.get('create_datetime', 'Unknown')}""" + (f"\nSHA-256: {data['sha256']}" if 'sha256' in data else '')
+
+
 @click.command()
 @click.option('--backend', type=click.Choice(['rest', 'grpc']), default='grpc',
               help='Set a backend to be used, choices are grpc and rest. Default is grpc.')
@@ -30,96 +63,177 @@ def write_output(content, output_file):
 @click.option('--base-url', default='http://localhost/',
               help='Set a base URL for a REST server. Default is http://localhost/.')
 @click.option('--output', default='-',
-              help='Set the file where to store the output. Default is -, i.e. the stdout.')
-@click.argument('command', type=click.Choice(['stat', 'read']))
-@click.argument('uuid')
-def file_client(backend, grpc_server, base_url, output, command, uuid):
+              help='Set the file where to store the output. Default is -, i.e. the stdout. '
+                   'In batch read mode this is the directory the files are stored in.')
+@click.option('--chunk-size', type=click.IntRange(min=0), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Maximum size of a read chunk. For gRPC, 0 asks for the whole file in one reply.')
+@click.option('--connect-timeout', type=click.FloatRange(min=0, min_open=True), default=DEFAULT_CONNECT_TIMEOUT,
+              show_default=True, help='Seconds to wait for a connection to the server.')
+@click.option('--read-timeout', type=click.FloatRange(min=0, min_open=True), default=DEFAULT_READ_TIMEOUT,
+              show_default=True, help='Seconds to wait for a response or the next piece of a stream.')
+@click.option('--retries', type=click.IntRange(min=0), default=DEFAULT_RETRIES, show_default=True,
+              help='Retries with backoff for failed connections and 502/503/504 responses.')
+@click.option('--ranges', type=click.IntRange(min=1), default=DEFAULT_RANGES, show_default=True,
+              help='Download large REST files to --output as this many concurrent byte ranges.')
+@click.option('--cache-dir', envvar='FILE_CLIENT_CACHE_DIR', type=click.Path(file_okay=False),
+              help='Cache metadata and content in this directory (env FILE_CLIENT_CACHE_DIR).')
+@click.option('--no-cache', is_flag=True, help='Bypass the cache even if a cache directory is set.')
+@click.option('--cache-size', type=click.IntRange(min=0), default=DEFAULT_CACHE_SIZE, show_default=True,
+              help='Byte budget for cached content, least recently used files are evicted first.')
+@click.option('--cache-ttl', type=click.FloatRange(min=0), default=DEFAULT_STAT_TTL, show_default=True,
+              help='Seconds a cached stat result stays valid.')
+@click.option('--cache-stats', is_flag=True, help='Print cache hit/miss counters to stderr when done.')
+@click.option('--metrics', 'metrics_format', type=click.Choice(metrics.FORMATS),
+              help='Report connect time, time to first byte, bytes, chunks, throughput and retries of every '
+                   'call to stderr, as JSON lines or as Prometheus text when done.')
+@click.option('--compression', type=click.Choice(compression_lib.CHOICES),
+              help='Ask for compressed content: gzip, zstd, none, or auto to compress only text-like mimetypes '
+                   '(known from stat). Without it the transport defaults apply.')
+@click.option('--resume', is_flag=True,
+              help='Read into <output>.part and continue an existing one, retrying failed transfers from the last '
+                   'byte written. Prints the stat with the SHA-256 of the content once it is renamed into place.')
+@click.option('--uuid-file', type=click.File('r'),
+              help='Read UUIDs from a file, one per line (- for stdin). Enables batch mode.')
+@click.option('--workers', type=click.IntRange(min=1), default=DEFAULT_WORKERS, show_default=True,
+              help='Number of concurrent requests in batch mode.')
+@click.option('--downloads', type=click.IntRange(min=1), default=DEFAULT_DOWNLOADS, show_default=True,
+              help='Number of concurrent downloads of sync.')
+@click.argument('command', type=click.Choice(['stat', 'read', 'sync']))
+@click.argument('uuids', metavar='UUID...', nargs=-1)
+def file_client(backend, grpc_server, base_url, output, chunk_size, connect_timeout, read_timeout, retries,
+                ranges, cache_dir, no_cache, cache_size, cache_ttl, cache_stats, metrics_format, compression, resume,
+                uuid_file, workers, downloads, command, uuids):
     """File client for REST/gRPC operations
-    
+
     Commands:
       stat    Prints the file metadata in a human-readable manner.
       read    Outputs the file content.
+      sync    Mirrors the UUIDs into the --output directory.
+
+    Passing more than one UUID or --uuid-file switches to batch mode:
+    stat prints one JSON object per line, read stores one file per UUID
+    in the --output directory.
+
+    sync stats every UUID and downloads only new and changed files, deleting
+    the ones no longer listed, using a SQLite manifest in the directory.
     """
-    
-    # Validate UUID
-    if not validate_uuid(uuid):
-        click.echo("Error: Invalid UUID format", err=True)
-        sys.exit(1)
-    
-    if backend == 'rest':
-        if command == 'stat':
-            stat_rest(uuid, base_url, output)
-        else:  # read
-            read_rest(uuid, base_url, output)
-    else:  # grpc
-        if command == 'stat':
-            stat_grpc(uuid, grpc_server, output)
-        else:  # read
-            read_grpc(uuid, grpc_server, output)
-
-
-def stat_rest(uuid, base_url, output):
-    """Get file metadata via REST API"""
+    if not uuids and uuid_file is None:
+        raise click.UsageError("Missing argument 'UUID...'.")
+    if resume and command == 'read' and output == '-':
+        raise click.UsageError("--resume needs --output set to a file")
+    if command == 'sync' and output == '-':
+        raise click.UsageError("sync needs --output set to a directory")
+    if compression == 'zstd' and backend == 'rest' and not compression_lib.zstd_available():
+        raise click.BadParameter("zstd needs the zstandard package", param_hint="'--compression'")
+
+    options = dict(chunk_size=chunk_size, connect_timeout=connect_timeout, read_timeout=read_timeout,
+                   retries=retries, ranges=ranges, compression=compression)
+    cache = None
+    if cache_dir and not no_cache:
+        cache = FileCache(cache_dir, max_bytes=cache_size, stat_ttl=cache_ttl)
+
+    finish_metrics = metrics.start(metrics_format, sys.stderr) if metrics_format else None
+
+    def make_client(**extra):
+        client = FileClient(backend, base_url, grpc_server, **options, **extra)
+        return client if cache is None else CachingClient(client, cache)
+
     try:
-        url = f"{base_url.rstrip('/')}/file/{uuid}/stat/"
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 404:
-            click.echo("Error: File not found", err=True)
+        if command == 'sync':
+            from .batch import iter_uuids
+            from .sync import sync
+            with make_client(pool_size=workers) as client:
+                counts = sync(client, iter_uuids(uuids, uuid_file), output, workers, downloads, retries,
+                              on_error=lambda uuid, error: click.echo(f"Error: {uuid}: {error}", err=True))
+            click.echo(', '.join(f"{count} {name}" for name, count in counts.items()), err=True)
+            sys.exit(1 if counts['failed'] else 0)
+
+        if len(uuids) > 1 or uuid_file is not None:
+            from .batch import iter_uuids, run_batch
+            with make_client(pool_size=workers) as client:
+                failed = run_batch(command, iter_uuids(uuids, uuid_file), client, output, workers,
+                                   resume=resume, retries=retries)
+            sys.exit(1 if failed else 0)
+
+        uuid = uuids[0]
+
+        # Validate UUID
+        if not validate_uuid(uuid):
+            click.echo("Error: Invalid UUID format", err=True)
             sys.exit(1)
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        # Format as human-readable text
-        output_text = f"""Name: {data.get('name', 'Unknown')}
-Size: {data.get('size', 0)} bytes
-MIME Type: {data.get('mimetype', 'Unknown')}
-Created: {data.get('create_datetime', 'Unknown')}"""
-        
-        write_output(output_text, output)
-        
-    except requests.RequestException as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+
+        with make_client() as client:
+            if command == 'stat':
+                stat_file(client, uuid, output)
+            elif resume:
+                download_file(client, uuid, output, retries)
+            else:  # read
+                read_file(client, uuid, output)
+    finally:
+        if finish_metrics is not None:
+            finish_metrics()
+        if cache is not None and cache_stats:
+            click.echo(f"Cache: stat {cache.hits['stat']} hits/{cache.misses['stat']} misses, "
+                       f"read {cache.hits['read']} hits/{cache.misses['read']} misses", err=True)
+
+
+def fail(error):
+    """Report a file client error and exit"""
+    click.echo(f"Error: {error}", err=True)
+    sys.exit(1)
 
 
-def read_rest(uuid, base_url, output):
-    """Read file content via REST API"""
+def stat_file(client, uuid, output='-'):
+    """Print file metadata fetched through a FileClient"""
     try:
-        url = f"{base_url.rstrip('/')}/file/{uuid}/read/"
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 404:
-            click.echo("Error: File not found", err=True)
-            sys.exit(1)
-        
-        response.raise_for_status()
-        
-        if output == '-':
-            # Output to stdout as text
-            click.echo(response.text)
-        else:
-            # Save to file as binary to preserve exact content
-            with open(output, 'wb') as f:
-                f.write(response.content)
-        
-    except requests.RequestException as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
-
-
-def stat_grpc(uuid, grpc_server, output):
-    """Get file metadata via gRPC (not implemented)"""
-    click.echo("Error: gRPC backend not implemented", err=True)
-    sys.exit(1)
+        data = client.stat(uuid)
+    except FileClientError as e:
+        fail(e)
+    write_output(format_stat(data), output)
 
 
-def read_grpc(uuid, grpc_server, output):
-    """Read file content via gRPC (not implemented)"""
-    click.echo("Error: gRPC backend not implemented", err=True)
-    sys.exit(1)
+def read_file(client, uuid, output='-'):
+    """Stream file content fetched through a FileClient to the output"""
+    try:
+        with open_output(output) as out:
+            client.read(uuid, out, regular_file=output != '-')
+    except FileClientError as e:
+        fail(e)
+
+
+def download_file(client, uuid, output, retries=DEFAULT_RETRIES):
+    """Download to output resumably and print the stat with the content's SHA-256"""
+    from .download import download
+    try:
+        data = download(client, uuid, output, retries)
+    except FileClientError as e:
+        fail(e)
+    click.echo(format_stat(data))
+
+
+def stat_rest(uuid, base_url, output='-', **options):
+    """Get file metadata via REST API"""
+    with FileClient('rest', base_url=base_url, **options) as client:
+        stat_file(client, uuid, output)
+
+
+def read_rest(uuid, base_url, output='-', chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    """Read file content via REST API, streaming the body in fixed-size chunks"""
+    with FileClient('rest', base_url=base_url, chunk_size=chunk_size, **options) as client:
+        read_file(client, uuid, output)
+
+
+def stat_grpc(uuid, grpc_server, output='-', **options):
+    """Get file metadata via gRPC"""
+    with FileClient('grpc', grpc_server=grpc_server, **options) as client:
+        stat_file(client, uuid, output)
+
+
+def read_grpc(uuid, grpc_server, output='-', chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    """Read file content via gRPC, writing each streamed chunk as it arrives"""
+    with FileClient('grpc', grpc_server=grpc_server, chunk_size=chunk_size, **options) as client:
+        read_file(client, uuid, output)
 
 
 if __name__ == '__main__':
-    file_client()
\ No newline at end of file
+    file_client()
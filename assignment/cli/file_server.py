@@ -0,0 +1,367 @@
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import re
+import sys
+import threading
+import uuid as uuid_lib
+import zlib
+from concurrent import futures
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import click
+from .client import GRPC_MAX_MESSAGE_SIZE, load_grpc_modules, utc_datetime
+from .compression import zstd_available
+from .file_client import validate_uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_REST_PORT = 8000
+DEFAULT_GRPC_PORT = 50051
+DEFAULT_GRPC_WORKERS = 16
+# Largest gRPC reply payload, leaving room for the message framing
+MAX_GRPC_CHUNK = GRPC_MAX_MESSAGE_SIZE - 1024
+FILE_PATH = re.compile(r'^/file/([^/]+)/(stat|read)/?$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+COMPRESS_BLOCK = 256 * 1024
+
+
+class StoredFile:
+    """A served file: display name, path on disk and MIME type"""
+
+    def __init__(self, name, path, mimetype):
+        self.name = name
+        self.path = path
+        self.mimetype = mimetype
+
+    def stat(self):
+        """Metadata as in the REST stat response, read from the file itself"""
+        st = os.stat(self.path)
+        return {
+            'create_datetime': utc_datetime(datetime.fromtimestamp(st.st_mtime, timezone.utc)),
+            'size': st.st_size,
+            'mimetype': self.mimetype,
+            'name': self.name,
+        }
+
+
+class FileStore:
+    """Files served by UUID, from a mapping file or a directory"""
+
+    def __init__(self, files):
+        self.files = files
+
+    def get(self, uuid):
+        return self.files.get(uuid.lower())
+
+    @classmethod
+    def from_mapping(cls, path):
+        """Load a mapping like test_files/file_mapping.json.
+
+        Relative file paths are looked up next to the mapping first and then
+        in its parent directory.
+        """
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path) as f:
+            mapping = json.load(f)
+        files = {}
+        for uuid, entry in mapping.items():
+            filepath = entry['filepath']
+            candidates = [filepath] if os.path.isabs(filepath) else [
+                os.path.join(base, filepath), os.path.join(os.path.dirname(base), filepath)]
+            resolved = next((c for c in candidates if os.path.isfile(c)), candidates[0])
+            files[uuid.lower()] = StoredFile(entry.get('filename', os.path.basename(filepath)), resolved,
+                                             entry.get('mimetype') or guess_mimetype(filepath))
+        return cls(files)
+
+    @classmethod
+    def from_directory(cls, path):
+        """Serve every file below path under uuid5 of its relative path, which stays stable across runs"""
+        files = {}
+        for root, _, names in os.walk(path):
+            for name in names:
+                full = os.path.join(root, name)
+                relative = os.path.relpath(full, path)
+                uuid = str(uuid_lib.uuid5(uuid_lib.NAMESPACE_URL, relative))
+                files[uuid] = StoredFile(name, full, guess_mimetype(name))
+        return cls(files)
+
+
+def guess_mimetype(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows, without the ones given q=0"""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        key, _, value = params.strip().partition('=')
+        try:
+            quality = float(value) if key.strip().lower() == 'q' else 1.0
+        except ValueError:
+            quality = 1.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def content_coding(header):
+    """The coding to compress a response with for an Accept-Encoding header, zstd first, None for identity"""
+    accepted = accepted_encodings(header)
+    if 'zstd' in accepted and zstd_available():
+        return 'zstd'
+    return 'gzip' if 'gzip' in accepted else None
+
+
+def compressor(coding):
+    if coding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    # Level 1 like nginx's default: most of the size win for a fraction of the CPU
+    return zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def parse_range(header, size):
+    """(start, end) of a single-range Range header, None without one, ValueError when unsatisfiable"""
+    match = RANGE.match(header or '')
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if not match.group(1):
+        # Suffix range: the last n bytes
+        length = int(match.group(2))
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """REST file API of python/python23/rest_file.rst.
+
+    File bodies are sent with sendfile, or compressed on the fly when the
+    client accepts gzip or zstd and asked for the whole file.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, Nagle would hold the body back on keep-alive connections
+    disable_nagle_algorithm = True
+    store = None
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        match = FILE_PATH.match(self.path.split('?', 1)[0])
+        if not match:
+            self.send_json(404, {'error': 'Not found'})
+            return
+        uuid, action = match.groups()
+        stored = self.store.get(uuid) if validate_uuid(uuid) else None
+        try:
+            if stored is None:
+                self.send_json(404, {'error': 'File not found'})
+            elif action == 'stat':
+                self.send_json(200, stored.stat())
+            else:
+                self.send_file(stored)
+        except FileNotFoundError:
+            self.send_json(404, {'error': 'File not found'})
+
+    def send_file(self, stored):
+        with open(stored.path, 'rb') as f:
+            coding = content_coding(self.headers.get('Accept-Encoding'))
+            if coding and not self.headers.get('Range'):
+                self.send_compressed(f, stored, coding)
+                return
+            size = os.fstat(f.fileno()).st_size
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', stored.mimetype)
+            self.send_header('Content-Disposition', f'attachment; filename="{stored.name}"')
+            self.send_header('Accept-Ranges', 'bytes')
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            if end >= start:
+                # socket.sendfile uses os.sendfile: the kernel copies from the page cache to the socket
+                self.connection.sendfile(f, start, end - start + 1)
+
+    def send_compressed(self, f, stored, coding):
+        """Send the file compressed as it is read, in chunked transfer encoding as its length is unknown"""
+        self.send_response(200)
+        self.send_header('Content-Type', stored.mimetype)
+        self.send_header('Content-Disposition', f'attachment; filename="{stored.name}"')
+        self.send_header('Content-Encoding', coding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        encoder = compressor(coding)
+        while block := f.read(COMPRESS_BLOCK):
+            self.write_chunk(encoder.compress(block))
+        self.write_chunk(encoder.flush())
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n%b\r\n' % (len(data), data))
+
+
+class FileHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer logging clients that hang up (mid-body or between requests) at debug level"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_info()[1]
+        if isinstance(error, ConnectionError):
+            logger.debug(f"{client_address[0]}:{client_address[1]} disconnected: {error}")
+        else:
+            super().handle_error(request, client_address)
+
+
+def start_rest_server(store, host=DEFAULT_HOST, port=DEFAULT_REST_PORT):
+    """Serve the REST API on a background thread, returning the server (server_address holds the port)"""
+    handler = type('Handler', (FileRequestHandler,), {'store': store})
+    server = FileHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def file_servicer(store):
+    """Build a File servicer for store (the generated base class is only importable once grpc is loaded)"""
+    grpc, pb2, pb2_grpc = load_grpc_modules()
+
+    class FileServicer(pb2_grpc.FileServicer):
+        def lookup(self, request, context):
+            if not validate_uuid(request.uuid.value):
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Invalid UUID format')
+            stored = store.get(request.uuid.value)
+            if stored is None or not os.path.isfile(stored.path):
+                context.abort(grpc.StatusCode.NOT_FOUND, 'File not found')
+            return stored
+
+        def stat(self, request, context):
+            stored = self.lookup(request, context)
+            try:
+                st = os.stat(stored.path)
+            except OSError as e:
+                context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+            reply = pb2.StatReply()
+            reply.data.name = stored.name
+            reply.data.size = st.st_size
+            reply.data.mimetype = stored.mimetype
+            reply.data.create_datetime.FromDatetime(datetime.fromtimestamp(st.st_mtime, timezone.utc))
+            return reply
+
+        def read(self, request, context):
+            """Stream the file in replies of at most request.size bytes, sliced from an mmap.
+
+            Replies are gzip compressed when the accept-encoding metadata allows it.
+            """
+            stored = self.lookup(request, context)
+            metadata = dict(context.invocation_metadata())
+            if 'gzip' in accepted_encodings(metadata.get('accept-encoding')):
+                context.set_compression(grpc.Compression.Gzip)
+            try:
+                f = open(stored.path, 'rb')
+            except OSError as e:
+                context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                if not size:
+                    yield pb2.ReadReply()
+                    return
+                chunk = min(request.size or size, MAX_GRPC_CHUNK)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    for offset in range(0, size, chunk):
+                        yield pb2.ReadReply(data=pb2.ReadReply.Data(data=mapped[offset:offset + chunk]))
+
+    return FileServicer()
+
+
+def start_grpc_server(store, host=DEFAULT_HOST, port=DEFAULT_GRPC_PORT, workers=DEFAULT_GRPC_WORKERS):
+    """Serve the File service, returning (server, bound port)"""
+    grpc, _, pb2_grpc = load_grpc_modules()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers), options=[
+        ('grpc.max_send_message_length', GRPC_MAX_MESSAGE_SIZE),
+        ('grpc.max_receive_message_length', GRPC_MAX_MESSAGE_SIZE),
+    ])
+    pb2_grpc.add_FileServicer_to_server(file_servicer(store), server)
+    bound = server.add_insecure_port(f'{host}:{port}')
+    server.start()
+    return server, bound
+
+
+@click.command()
+@click.option('--mapping', type=click.Path(exists=True, dir_okay=False),
+              help='JSON mapping of UUID to filename, filepath and mimetype (like test_files/file_mapping.json).')
+@click.option('--directory', type=click.Path(exists=True, file_okay=False),
+              help='Serve every file of a directory instead, under uuid5 of its relative path.')
+@click.option('--host', default=DEFAULT_HOST, show_default=True, help='Address to listen on.')
+@click.option('--rest-port', type=click.IntRange(0, 65535), default=DEFAULT_REST_PORT, show_default=True,
+              help='Port of the REST API, 0 picks a free one.')
+@click.option('--grpc-port', type=click.IntRange(0, 65535), default=DEFAULT_GRPC_PORT, show_default=True,
+              help='Port of the gRPC File service, 0 picks a free one.')
+@click.option('--no-rest', is_flag=True, help='Do not serve the REST API.')
+@click.option('--no-grpc', is_flag=True, help='Do not serve gRPC.')
+@click.option('--grpc-workers', type=click.IntRange(min=1), default=DEFAULT_GRPC_WORKERS, show_default=True,
+              help='Threads handling gRPC calls.')
+def file_server(mapping, directory, host, rest_port, grpc_port, no_rest, no_grpc, grpc_workers):
+    """Local reference server for the REST file API and the gRPC File service"""
+    if bool(mapping) == bool(directory):
+        raise click.UsageError("Pass exactly one of --mapping and --directory")
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = FileStore.from_mapping(mapping) if mapping else FileStore.from_directory(directory)
+
+    rest = grpc_server = None
+    if not no_rest:
+        rest = start_rest_server(store, host, rest_port)
+        # Printed on stdout so scripts starting the server on port 0 can read the ports
+        click.echo(f"REST http://{host}:{rest.server_address[1]}/")
+    if not no_grpc:
+        grpc_server, bound = start_grpc_server(store, host, grpc_port, grpc_workers)
+        click.echo(f"gRPC {host}:{bound}")
+    logger.info(f"Serving {len(store.files)} files")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if rest is not None:
+            rest.shutdown()
+        if grpc_server is not None:
+            grpc_server.stop(None)
+
+
+if __name__ == '__main__':
+    file_server()
@@ -0,0 +1,235 @@
+import contextvars
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+FORMATS = ('json', 'prom')
+
+_subscribers = []
+_current_transfer = contextvars.ContextVar('current_transfer', default=None)
+
+
+def subscribe(callback):
+    """Call callback(event) for every metrics event, returning callback.
+
+    Events are dicts with an 'event' key: 'transfer' for a file client stat or
+    read, 'query' for a DatabaseManager query. Nothing is measured while there
+    are no subscribers.
+    """
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+def enabled():
+    return bool(_subscribers)
+
+
+def emit(event, **fields):
+    record = {'event': event, **fields}
+    for callback in list(_subscribers):
+        callback(record)
+
+
+class Transfer:
+    """Phase timings of one file client call, emitted as a 'transfer' event when it ends.
+
+    connect_s is the time spent opening connections (DNS included), zero
+    when a pooled connection was reused. first_byte_s is the time until the
+    response headers (REST) or the first reply (gRPC) arrived.
+    """
+
+    def __init__(self, backend, operation, uuid):
+        self.backend = backend
+        self.operation = operation
+        self.uuid = uuid
+        self.connect = 0.0
+        self.first_byte = None
+        self.bytes = 0
+        self.chunks = 0
+        self.retries = 0
+        self.started = None
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._token = _current_transfer.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        _current_transfer.reset(self._token)
+        emit('transfer', backend=self.backend, operation=self.operation, uuid=self.uuid,
+             ok=exc_type is None, error=None if exc is None else str(exc),
+             seconds=seconds, connect_s=self.connect, first_byte_s=self.first_byte,
+             bytes=self.bytes, chunks=self.chunks, retries=self.retries,
+             throughput_bps=self.bytes / seconds if seconds else 0.0)
+
+    def connected(self, seconds):
+        with self._lock:
+            self.connect += seconds
+
+    def first(self):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.started
+
+    def chunk(self, size):
+        self.first()
+        with self._lock:
+            self.bytes += size
+            self.chunks += 1
+
+    def http_response(self, response):
+        """Record the arrival of a requests response and the retries urllib3 made for it"""
+        self.first()
+        retries = getattr(response.raw, 'retries', None)
+        history = getattr(retries, 'history', None)
+        if isinstance(history, tuple) and history:
+            with self._lock:
+                self.retries += len(history)
+
+
+class NoTransfer:
+    """Stand-in for Transfer while nobody subscribed, every call does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def connected(self, seconds):
+        pass
+
+    def first(self):
+        pass
+
+    def chunk(self, size):
+        pass
+
+    def http_response(self, response):
+        pass
+
+
+NO_TRANSFER = NoTransfer()
+
+
+def transfer(backend, operation, uuid):
+    """Context manager measuring one stat or read"""
+    if not _subscribers:
+        return NO_TRANSFER
+    return Transfer(backend, operation, uuid)
+
+
+def connected(seconds):
+    """Add a connection set-up time to the transfer running in this context, if any"""
+    current = _current_transfer.get()
+    if current is not None:
+        current.connected(seconds)
+
+
+class JsonMetrics:
+    """Write every event as one JSON line as soon as it is emitted"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def close(self):
+        pass
+
+
+def sample_value(value):
+    """A sample value in the Prometheus text format: integers exactly, floats without rounding"""
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class PrometheusMetrics:
+    """Aggregate events and write them in the Prometheus text format on close"""
+
+    METRICS = (
+        # name, type, help, event, labels, value
+        ('file_client_requests_total', 'counter', 'File client calls',
+         'transfer', ('backend', 'operation', 'ok'), lambda e: 1),
+        ('file_client_seconds', 'summary', 'Duration of file client calls',
+         'transfer', ('backend', 'operation'), lambda e: e['seconds']),
+        ('file_client_connect_seconds', 'summary', 'Time spent opening connections',
+         'transfer', ('backend', 'operation'), lambda e: e['connect_s']),
+        ('file_client_first_byte_seconds', 'summary', 'Time to the first response byte or chunk',
+         'transfer', ('backend', 'operation'), lambda e: e['first_byte_s']),
+        ('file_client_bytes_total', 'counter', 'Bytes transferred',
+         'transfer', ('backend', 'operation'), lambda e: e['bytes']),
+        ('file_client_chunks_total', 'counter', 'Chunks transferred',
+         'transfer', ('backend', 'operation'), lambda e: e['chunks']),
+        ('file_client_retries_total', 'counter', 'Requests retried by the HTTP adapter',
+         'transfer', ('backend', 'operation'), lambda e: e['retries']),
+        ('db_query_seconds', 'summary', 'Duration of database queries',
+         'query', ('query',), lambda e: e['seconds']),
+        ('db_query_rows_total', 'counter', 'Rows returned by database queries',
+         'query', ('query',), lambda e: e['rows']),
+    )
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.values = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            for name, _, _, kind, labels, value in self.METRICS:
+                if event['event'] != kind:
+                    continue
+                amount = value(event)
+                if amount is None:
+                    continue
+                entry = self.values[name, tuple((label, str(event[label]).lower()) for label in labels)]
+                entry[0] += 1
+                entry[1] += amount
+
+    def render(self):
+        lines = []
+        for name, kind, description, *_ in self.METRICS:
+            series = sorted((labels, entry) for (metric, labels), entry in self.values.items() if metric == name)
+            if not series:
+                continue
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for labels, (count, total) in series:
+                text = ','.join(f'{label}="{value}"' for label, value in labels)
+                if kind == 'summary':
+                    lines += [f"{name}_sum{{{text}}} {sample_value(total)}", f"{name}_count{{{text}}} {count}"]
+                else:
+                    lines.append(f"{name}{{{text}}} {sample_value(total)}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def close(self):
+        self.stream.write(self.render())
+        self.stream.flush()
+
+
+def start(fmt, stream):
+    """Subscribe a json or prom writer on stream, returning a function that finishes it"""
+    writer = (JsonMetrics if fmt == 'json' else PrometheusMetrics)(stream)
+    subscribe(writer)
+
+    def finish():
+        unsubscribe(writer)
+        writer.close()
+    return finish
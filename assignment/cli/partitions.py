@@ -0,0 +1,194 @@
+import logging
+import re
+from datetime import datetime, timezone
+import click
+from .db import get_db
+
+logger = logging.getLogger(__name__)
+
+PARENT = 'domain_flag'
+DEFAULT_PARTITION = 'domain_flag_default'
+FLAGS = ('EXPIRED', 'OUTZONE', 'DELETE_CANDIDATE')
+PARTITION_NAME = re.compile(r'^domain_flag_(\d{4})_(\d{2})$')
+DEFAULT_AHEAD = 3
+DEFAULT_ARCHIVE_SCHEMA = 'archive'
+
+
+def month_start(value):
+    """First instant (UTC) of the month containing value"""
+    value = value.astimezone(timezone.utc) if value.tzinfo else value
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def partition_month(name):
+    """Month of a partition named by partition_name, None for any other table"""
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def plan_maintenance(existing, default_months, now, ahead=DEFAULT_AHEAD, retain=None):
+    """Decide which monthly partitions to create and which to detach.
+
+    Creates every month that still has rows in the default partition plus the
+    current month and `ahead` months after it. With retain, partitions whose
+    month ended more than retain months before the current one are detached.
+    Returns (months to create, partition names to detach), both sorted.
+    """
+    current = month_start(now)
+    wanted = {month_start(month) for month in default_months}
+    wanted.update(add_months(current, i) for i in range(ahead + 1))
+
+    existing_months = {partition_month(name): name for name in existing if partition_month(name)}
+    create = sorted(month for month in wanted if month not in existing_months)
+
+    detach = []
+    if retain is not None:
+        # Old months just moved out of the default partition are archived right away
+        cutoff = add_months(current, -retain)
+        partitions = dict(existing_months)
+        partitions.update((month, partition_name(month)) for month in create)
+        detach = [name for month, name in sorted(partitions.items()) if month < cutoff]
+    return create, detach
+
+
+def existing_partitions(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (PARENT,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def default_months(cur):
+    """Months (UTC) that have rows sitting in the default partition"""
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    if cur.fetchone()[0] is None:
+        return []
+    cur.execute(f"SELECT DISTINCT date_trunc('month', valid_from, 'UTC') FROM {DEFAULT_PARTITION}")
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_partition(cur, month, by_flag=True):
+    """Create the partition for month, moving its rows out of the default partition.
+
+    A partition cannot be attached while the default partition still holds
+    rows of its range, so the table is built detached, filled from the
+    default partition and attached last. Attaching builds the parent's
+    indexes on it. Returns the number of rows moved.
+    """
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    cur.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                + (" PARTITION BY LIST (flag)" if by_flag else ""))
+    if by_flag:
+        for flag in FLAGS:
+            cur.execute(f"CREATE TABLE {name}_{flag.lower()} PARTITION OF {name} FOR VALUES IN (%s)", (flag,))
+
+    moved = 0
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    if cur.fetchone()[0] is not None:
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE valid_from >= %s AND valid_from < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, (start, end))
+        moved = cur.rowcount
+
+    cur.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    return moved
+
+
+def detach_partition(cur, name, archive_schema=DEFAULT_ARCHIVE_SCHEMA, drop=False):
+    """Detach a partition and move it (with its sub-partitions) to archive_schema, or drop it.
+
+    Partitions still holding open flags (valid_to IS NULL) are kept, since
+    they are part of the current domain state. domain_state is refreshed for
+    the domains whose history was detached. Returns True when detached.
+    """
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE valid_to IS NULL)")
+    if cur.fetchone()[0]:
+        logger.warning(f"Keeping {name}, it still has open flags")
+        return False
+
+    cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+    # The detached history no longer counts towards the ever_* markers
+    cur.execute(f"SELECT refresh_domain_state(ARRAY(SELECT DISTINCT domain_id FROM {name}))")
+    if drop:
+        cur.execute(f"DROP TABLE {name}")
+        return True
+
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+    cur.execute("SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass)", (name,))
+    for (table,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE {table} SET SCHEMA {archive_schema}")
+    return True
+
+
+def maintain(db, ahead=DEFAULT_AHEAD, retain=None, by_flag=True, archive_schema=DEFAULT_ARCHIVE_SCHEMA,
+             drop=False, dry_run=False, now=None):
+    """Create upcoming partitions and detach expired ones, committing after each partition.
+
+    Returns (created months, detached names).
+    """
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            create, detach = plan_maintenance(existing_partitions(cur), default_months(cur),
+                                              now or datetime.now(timezone.utc), ahead, retain)
+        conn.rollback()
+        if dry_run:
+            return create, detach
+
+        detached = []
+        with conn.cursor() as cur:
+            for month in create:
+                moved = create_partition(cur, month, by_flag)
+                conn.commit()
+                logger.info(f"Created {partition_name(month)}, moved {moved} rows from {DEFAULT_PARTITION}")
+            for name in detach:
+                if detach_partition(cur, name, archive_schema, drop):
+                    detached.append(name)
+                conn.commit()
+            if create:
+                cur.execute(f"ANALYZE {PARENT}")
+    return create, detached
+
+
+@click.command('partitions')
+@click.option('--ahead', type=click.IntRange(min=0), default=DEFAULT_AHEAD, show_default=True,
+              help='Months after the current one to create partitions for.')
+@click.option('--retain', type=click.IntRange(min=1),
+              help='Detach monthly partitions older than this many months (default: keep all).')
+@click.option('--by-flag/--no-by-flag', default=True, show_default=True,
+              help='Sub-partition new monthly partitions by flag.')
+@click.option('--archive-schema', default=DEFAULT_ARCHIVE_SCHEMA, show_default=True,
+              help='Schema detached partitions are moved to.')
+@click.option('--drop', is_flag=True, help='Drop detached partitions instead of archiving them.')
+@click.option('--dry-run', is_flag=True, help='Only show what would be created and detached.')
+def partitions_command(ahead, retain, by_flag, archive_schema, drop, dry_run):
+    """Create future domain_flag partitions and archive old ones"""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    created, detached = maintain(get_db(), ahead, retain, by_flag, archive_schema, drop, dry_run)
+
+    for month in created:
+        click.echo(f"{'Would create' if dry_run else 'Created'} {partition_name(month)}")
+    for name in detached:
+        click.echo(f"{'Would detach' if dry_run else 'Detached'} {name}")
+    if not created and not detached:
+        click.echo("Partitions are up to date")
@@ -0,0 +1,94 @@
+import threading
+import time
+import psycopg2
+import psycopg2.pool
+
+DEFAULT_TIMEOUT = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No connection became free within the checkout timeout"""
+
+
+class ConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Thread-safe pool remembering when each connection was last used and what it has prepared.
+
+    A checkout while all maxconn connections are in use waits up to timeout
+    seconds for one to be checked in, instead of failing at once.
+    """
+
+    def __init__(self, minconn, maxconn, dsn, ping_interval, timeout=DEFAULT_TIMEOUT):
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.last_used = {}
+        self.prepared = {}
+        self.users = 0
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, dsn)
+
+    def checkout(self):
+        """Get a connection, replacing those that went away while idle"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no connection free after {self.timeout:g}s, all {self.maxconn} in use")
+        try:
+            while True:
+                conn = self.getconn()
+                last_used = self.last_used.get(id(conn))
+                if last_used is None or (not conn.closed and time.monotonic() - last_used < self.ping_interval):
+                    return conn
+                try:
+                    if conn.closed:
+                        raise psycopg2.InterfaceError("connection already closed")
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                    return conn
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    self._put(conn, close=True)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn, close=False):
+        try:
+            self._put(conn, close)
+        finally:
+            self._slots.release()
+
+    def _put(self, conn, close=False):
+        if close or conn.closed:
+            self.last_used.pop(id(conn), None)
+            self.prepared.pop(id(conn), None)
+            close = True
+        else:
+            self.last_used[id(conn)] = time.monotonic()
+        self.putconn(conn, close=close)
+
+
+def get_pool(db_url, min_connections, max_connections, ping_interval, timeout=DEFAULT_TIMEOUT):
+    """Return the process-wide pool for db_url, creating it on first use.
+
+    Every call counts as a user of the pool, hand it back with release_pool.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_url)
+        if pool is None or pool.closed:
+            pool = ConnectionPool(min_connections, max_connections, db_url, ping_interval, timeout)
+            _pools[db_url] = pool
+        pool.users += 1
+        return pool
+
+
+def release_pool(pool):
+    """Drop one user of a pool from get_pool, closing its connections once nobody uses it"""
+    with _pools_lock:
+        pool.users -= 1
+        if pool.users > 0 or pool.closed:
+            return
+        for url, shared in list(_pools.items()):
+            if shared is pool:
+                del _pools[url]
+        pool.closeall()
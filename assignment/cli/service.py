@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import partial
+import asyncpg
+import click
+from aiohttp import web
+from .db import QUERIES, domain_query, env_flag, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'domain_data_changed'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_TTL = 2.0
+DEFAULT_CACHE_ENTRIES = 256
+# Larger domain lists are streamed on every request instead of being kept
+MAX_CACHED_RESULT = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_PENDING = 512
+STREAM_BATCH = 1000
+RECONNECT_DELAY = 5
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def asyncpg_query(name):
+    """One of the fixed QUERIES with the named psycopg2 parameter written as asyncpg's $1"""
+    return QUERIES[name].replace('%(as_of)s', '$1')
+
+
+def encode_batch(fqdns, fmt, first):
+    """Encode fqdns as NDJSON lines, or as JSON array items following earlier ones unless first"""
+    if fmt == 'ndjson':
+        return ''.join(json.dumps({'fqdn': fqdn}) + '\n' for fqdn in fqdns).encode()
+    return (('' if first else ',') + ','.join(json.dumps(fqdn) for fqdn in fqdns)).encode()
+
+
+def encode_domains(fqdns, fmt):
+    """Encode fqdns as NDJSON lines or a JSON array, in chunks of STREAM_BATCH domains"""
+    chunks = [encode_batch(fqdns[i:i + STREAM_BATCH], fmt, not i) for i in range(0, len(fqdns), STREAM_BATCH)]
+    return chunks if fmt == 'ndjson' else [b'[', *chunks, b']\n']
+
+
+class ResultCache:
+    """Short-lived query results, dropped as a whole on every invalidate().
+
+    While a result is loading, concurrent requests for the same key wait for
+    that one load instead of starting their own. A load that finishes after an
+    invalidation is handed to its waiters but not kept. At most max_entries
+    results are kept, the least recently used go first, and expired ones are
+    dropped whenever a result is added.
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = False
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def invalidate(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _add(self, key, entry):
+        now = time.monotonic()
+        for expired in [k for k, (expires, _) in self._entries.items() if expires is not None and expires <= now]:
+            del self._entries[expired]
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, load):
+        """Return an awaitable for the result of load(), shared while it is fresh"""
+        task = self._fresh(key)
+        if task is not None:
+            return asyncio.shield(task)
+
+        task = asyncio.ensure_future(load())
+        if self.enabled and self.ttl > 0:
+            self._add(key, (None, task))
+            task.add_done_callback(partial(self._loaded, key, self.generation))
+        return asyncio.shield(task)
+
+    def lookup(self, key):
+        """Return the fresh result stored for key by put(), or None"""
+        future = self._fresh(key)
+        return None if future is None else future.result()
+
+    def put(self, key, value, generation):
+        """Keep a result produced outside of get(), unless the cache was invalidated since generation"""
+        if self.enabled and self.ttl > 0 and generation == self.generation:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._add(key, (time.monotonic() + self.ttl, future))
+
+    def _loaded(self, key, generation, task):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] is not task:
+            return
+        if task.cancelled() or task.exception() is not None or generation != self.generation:
+            del self._entries[key]
+        else:
+            self._entries[key] = (time.monotonic() + self.ttl, task)
+
+
+class QueryService:
+    """Domain queries over HTTP on a bounded asyncpg pool.
+
+    At most max_concurrency queries run at once. Requests beyond max_pending
+    waiting ones are turned away with 503. Results are cached for cache_ttl
+    seconds while a LISTEN connection receives the domain_data_changed
+    notifications sent by the triggers on domain and domain_flag. If that
+    connection is lost, caching stops until it is back.
+    """
+
+    def __init__(self, db_url=None, min_connections=None, max_connections=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_pending=DEFAULT_MAX_PENDING,
+                 cache_ttl=DEFAULT_CACHE_TTL, cache_entries=DEFAULT_CACHE_ENTRIES, use_state=None):
+        self.db_url = db_url or os.getenv("DATABASE_URL")
+        if not self.db_url:
+            raise click.UsageError("DATABASE_URL environment variable not set")
+        self.min_connections = min_connections or int(os.getenv("DB_POOL_MIN", "1"))
+        self.max_connections = max_connections or int(os.getenv("DB_POOL_MAX", "5"))
+        self.use_state = env_flag("DB_USE_STATE_TABLE") if use_state is None else use_state
+        self.max_pending = max_pending
+        self.cache = ResultCache(cache_ttl, cache_entries)
+        self.pending = 0
+        self.max_concurrency = max_concurrency
+        self.pool = None
+        self._semaphore = None
+        self._listener = None
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.pool = await asyncpg.create_pool(self.db_url, min_size=self.min_connections,
+                                              max_size=self.max_connections)
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self.pool is not None:
+            await self.pool.close()
+
+    def _notified(self, connection, pid, channel, payload):
+        logger.debug(f"{payload} changed, dropping cached results")
+        self.cache.invalidate()
+
+    async def _listen(self):
+        """Keep a LISTEN connection open, enabling the cache only while it is"""
+        while True:
+            try:
+                conn = await asyncpg.connect(self.db_url)
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"LISTEN connection failed, caching disabled: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _: lost.set())
+            try:
+                await conn.add_listener(NOTIFY_CHANNEL, self._notified)
+                # Anything cached before LISTEN took effect may have missed a change
+                self.cache.invalidate()
+                self.cache.enabled = True
+                await lost.wait()
+                logger.warning("LISTEN connection lost, caching disabled")
+            finally:
+                self.cache.enabled = False
+                self.cache.invalidate()
+                await conn.close()
+
+    async def _fetch(self, name, args):
+        async with self._semaphore:
+            async with self.pool.acquire() as conn:
+                return await conn.fetch(asyncpg_query(name), *args)
+
+    def _admit(self):
+        if self.pending >= self.max_pending:
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'}, text="Too many pending requests\n")
+
+    async def result(self, key, load):
+        """Cached result of load(), or 503 when too many requests are already waiting"""
+        self._admit()
+        self.pending += 1
+        try:
+            return await self.cache.get(key, load)
+        finally:
+            self.pending -= 1
+
+    async def stats(self, approximate=False, as_of=None):
+        if as_of is not None:
+            name = 'stats_as_of'
+        else:
+            name = 'stats_estimate' if approximate else 'stats'
+        args = () if as_of is None else (as_of,)
+
+        async def load():
+            row = (await self._fetch(name, args))[0]
+            return {'total_domains': row[0], 'active_domains': row[1], 'total_flags': row[2]}
+        return await self.result((name, args), load)
+
+    async def domains(self, name, as_of=None, fmt='ndjson'):
+        """Async generator of the encoded chunks of active_domains or flagged_domains.
+
+        A cached result is replayed. Otherwise the rows are read through a
+        cursor STREAM_BATCH at a time and each batch is yielded as soon as it
+        is encoded, so the result is never held as a whole. It is cached when
+        it stays within MAX_CACHED_RESULT bytes. The generator holds a pooled
+        connection until it is exhausted or closed.
+        """
+        name = domain_query(name, as_of, self.use_state)
+        args = () if as_of is None else (as_of,)
+        key = (name, args, fmt)
+        cached = self.cache.lookup(key)
+        if cached is not None:
+            for chunk in cached:
+                yield chunk
+            return
+
+        generation = self.cache.generation
+        kept, size = [], 0
+        async with aclosing(self._stream(name, args, fmt)) as chunks:
+            async for chunk in chunks:
+                if kept is not None:
+                    size += len(chunk)
+                    if size <= MAX_CACHED_RESULT:
+                        kept.append(chunk)
+                    else:
+                        kept = None
+                yield chunk
+        if kept is not None:
+            self.cache.put(key, kept, generation)
+
+    async def _stream(self, name, args, fmt):
+        """Encoded chunks of a domain query read through a server-side cursor"""
+        self._admit()
+        self.pending += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.pending -= 1
+        try:
+            async with self.pool.acquire() as conn, conn.transaction():
+                # The opening bracket goes out with the first rows, once the query is known to run
+                opening = b'[' if fmt == 'json' else b''
+                first, batch = True, []
+                async for row in conn.cursor(asyncpg_query(name), *args, prefetch=STREAM_BATCH):
+                    batch.append(row[0])
+                    if len(batch) == STREAM_BATCH:
+                        yield (opening if first else b'') + encode_batch(batch, fmt, first)
+                        first, batch = False, []
+                if batch or first:
+                    yield (opening if first else b'') + encode_batch(batch, fmt, first)
+        finally:
+            self._semaphore.release()
+        if fmt == 'json':
+            yield b']\n'
+
+
+SERVICE = web.AppKey('service', QueryService)
+
+
+def request_as_of(request):
+    value = request.query.get('as_of')
+    if not value:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"Invalid as_of timestamp: {value}\n") from None
+
+
+async def handle_status(request):
+    service = request.app[SERVICE]
+    approximate = request.query.get('fast', '').lower() in ('1', 'true', 'yes')
+    as_of = request_as_of(request)
+    if approximate and as_of:
+        raise web.HTTPBadRequest(text="fast cannot be combined with as_of\n")
+    stats = await service.stats(approximate, as_of)
+    return web.json_response(dict(stats, approximate=approximate,
+                                  as_of=as_of.isoformat() if as_of else None))
+
+
+async def handle_domains(request):
+    service = request.app[SERVICE]
+    fmt = request.query.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        raise web.HTTPBadRequest(text=f"format must be one of {', '.join(FORMATS)}\n")
+    name = request.match_info['name'].replace('-', '_')
+    chunks = service.domains(name, request_as_of(request), fmt)
+    try:
+        # The first chunk arrives once the query is running, errors before it still get their own status
+        first = await anext(chunks, b'')
+        response = web.StreamResponse(headers={'Content-Type': FORMATS[fmt]})
+        await response.prepare(request)
+        await response.write(first)
+        async for chunk in chunks:
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+    finally:
+        await chunks.aclose()
+
+
+async def handle_health(request):
+    service = request.app[SERVICE]
+    return web.json_response({
+        'cache': {'enabled': service.cache.enabled, 'hits': service.cache.hits, 'misses': service.cache.misses},
+        'pending': service.pending,
+        'pool': {'size': service.pool.get_size(), 'idle': service.pool.get_idle_size()},
+    })
+
+
+def create_app(service):
+    app = web.Application()
+    app[SERVICE] = service
+
+    async def lifecycle(app):
+        await service.start()
+        yield
+        await service.close()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_get('/status', handle_status)
+    app.router.add_get('/{name:active-domains|flagged-domains}', handle_domains)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+@click.command('serve')
+@click.option('--host', default=DEFAULT_HOST, show_default=True, help='Address to listen on.')
+@click.option('--port', type=click.IntRange(1, 65535), default=DEFAULT_PORT, show_default=True,
+              help='Port to listen on.')
+@click.option('--cache-ttl', type=click.FloatRange(min=0), default=DEFAULT_CACHE_TTL, show_default=True,
+              help='Seconds a query result is reused, 0 disables the cache.')
+@click.option('--cache-entries', type=click.IntRange(min=1), default=DEFAULT_CACHE_ENTRIES, show_default=True,
+              help='Query results kept at most, the least recently used are dropped first.')
+@click.option('--max-concurrency', type=click.IntRange(min=1), default=DEFAULT_MAX_CONCURRENCY,
+              show_default=True, help='Queries run against the database at the same time.')
+@click.option('--max-pending', type=click.IntRange(min=1), default=DEFAULT_MAX_PENDING, show_default=True,
+              help='Requests allowed to wait for a result before answering 503.')
+def serve_command(host, port, cache_ttl, cache_entries, max_concurrency, max_pending):
+    """Serve status, active-domains and flagged-domains over HTTP"""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = QueryService(max_concurrency=max_concurrency, max_pending=max_pending, cache_ttl=cache_ttl,
+                           cache_entries=cache_entries)
+    web.run_app(create_app(service), host=host, port=port, print=None)
@@ -0,0 +1,67 @@
+import click
+from .db import get_db
+
+# Domains whose domain_state row is missing, differs from a recomputation over
+# the full history, or exists without a domain
+CHECK_STATE = """
+    SELECT COALESCE(r.domain_id, s.domain_id),
+           CASE WHEN s.domain_id IS NULL THEN 'missing'
+                WHEN r.domain_id IS NULL THEN 'extra'
+                ELSE 'stale' END
+    FROM domain_state_recomputed r
+    FULL JOIN domain_state s ON s.domain_id = r.domain_id
+    WHERE s.domain_id IS NULL
+       OR r.domain_id IS NULL
+       OR (r.fqdn, r.unregistered_at, r.expired_since, r.outzone_since,
+           r.delete_candidate_since, r.ever_expired, r.ever_outzone)
+          IS DISTINCT FROM
+          (s.fqdn, s.unregistered_at, s.expired_since, s.outzone_since,
+           s.delete_candidate_since, s.ever_expired, s.ever_outzone)
+    ORDER BY 1
+"""
+
+PROBLEMS = ('missing', 'stale', 'extra')
+
+
+def check_state(db):
+    """Return (domain_id, 'missing' | 'stale' | 'extra') for every domain_state row that is wrong"""
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CHECK_STATE)
+            return cur.fetchall()
+
+
+def repair_state(db, domain_ids):
+    """Recompute the domain_state rows of domain_ids, removing those whose domain is gone"""
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM domain_state s WHERE s.domain_id = ANY(%s) "
+                        "AND NOT EXISTS (SELECT 1 FROM domain d WHERE d.id = s.domain_id)", (list(domain_ids),))
+            cur.execute("SELECT refresh_domain_state(%s)", (list(domain_ids),))
+
+
+@click.command('state-check')
+@click.option('--repair', is_flag=True, help='Recompute the rows that are out of sync.')
+@click.option('--show', type=click.IntRange(min=0), default=10, show_default=True,
+              help='Number of out of sync domain ids to list.')
+@click.pass_context
+def state_check_command(ctx, repair, show):
+    """Compare domain_state against a full recomputation from history"""
+    db = get_db()
+    mismatches = check_state(db)
+    if not mismatches:
+        click.echo("domain_state is consistent")
+        return
+
+    counts = ', '.join(f"{sum(1 for _, p in mismatches if p == problem)} {problem}" for problem in PROBLEMS)
+    click.echo(f"{len(mismatches)} domains out of sync ({counts})")
+    for domain_id, problem in mismatches[:show]:
+        click.echo(f"  {domain_id} {problem}")
+
+    if repair:
+        repair_state(db, [domain_id for domain_id, _ in mismatches])
+        remaining = check_state(db)
+        click.echo(f"Repaired {len(mismatches) - len(remaining)} domains")
+        if not remaining:
+            return
+    ctx.exit(1)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from .bulk_load import Progress
+from .db import get_db
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Each statement locks one keyset page of candidates, skipping rows another
+# worker holds, changes them and returns their ids so the next page starts
+# after the last one. Only now() is ever written: a flag's valid_to never moves
+# into the past, and valid_from < now() keeps valid_to > valid_from.
+SWEEPS = {
+    # Domains with an open DELETE_CANDIDATE flag older than the grace period
+    # are unregistered. Ending a registration only shortens its range, so
+    # no_overlap_for_fqdn still holds.
+    'unregister': """
+        WITH batch AS (
+            SELECT d.id
+            FROM domain d
+            WHERE d.id > %(after)s
+              AND d.unregistered_at IS NULL
+              AND d.registered_at < now()
+              AND EXISTS (
+                SELECT 1 FROM domain_flag df
+                WHERE df.domain_id = d.id
+                  AND df.flag = 'DELETE_CANDIDATE'
+                  AND df.valid_to IS NULL
+                  AND df.valid_from <= now() - %(grace)s * interval '1 second'
+              )
+            ORDER BY d.id
+            LIMIT %(batch_size)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE domain d
+        SET unregistered_at = now(), updated_at = now()
+        FROM batch
+        WHERE d.id = batch.id
+        RETURNING d.id
+    """,
+    # Open flags of unregistered domains are closed
+    'close-flags': """
+        WITH batch AS (
+            SELECT df.id, df.valid_from, df.flag
+            FROM domain_flag df
+            JOIN domain d ON d.id = df.domain_id
+            WHERE df.id > %(after)s
+              AND df.valid_to IS NULL
+              AND df.valid_from < now()
+              AND d.unregistered_at <= now()
+            ORDER BY df.id
+            LIMIT %(batch_size)s
+            FOR UPDATE OF df SKIP LOCKED
+        )
+        UPDATE domain_flag df
+        SET valid_to = now()
+        FROM batch
+        WHERE df.id = batch.id AND df.valid_from = batch.valid_from AND df.flag = batch.flag
+        RETURNING df.id
+    """,
+}
+
+
+class SharedProgress(Progress):
+    """Progress fed by several workers"""
+
+    def __init__(self, label):
+        super().__init__(label)
+        self._lock = threading.Lock()
+
+    def add(self, rows):
+        with self._lock:
+            super().add(rows)
+
+
+class Throttle:
+    """Sleep just enough to keep the rows processed so far at or below rate rows/s"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.rows = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, rows):
+        if not self.rate:
+            return
+        with self._lock:
+            self.rows += rows
+            delay = self.rows / self.rate - (time.monotonic() - self.started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def sweep(db, name, batch_size=DEFAULT_BATCH_SIZE, grace=0, throttle=None, progress=None):
+    """Run one of the SWEEPS page by page, committing every page. Returns the rows changed."""
+    throttle = throttle or Throttle()
+    progress = progress or Progress(name)
+    after = 0
+    changed = 0
+    while True:
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SWEEPS[name], {'after': after, 'batch_size': batch_size, 'grace': grace})
+                ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            return changed
+        after = max(ids)
+        changed += len(ids)
+        progress.add(len(ids))
+        throttle.add(len(ids))
+
+
+def run_sweeps(db, names, batch_size=DEFAULT_BATCH_SIZE, grace=0, max_rate=None, workers=1):
+    """Run sweeps in order, each by workers threads sharing one rate limit. Returns {name: rows}."""
+    results = {}
+    for name in names:
+        throttle = Throttle(max_rate)
+        progress = SharedProgress(name)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(sweep, db, name, batch_size, grace, throttle, progress)
+                       for _ in range(workers)]
+            results[name] = sum(future.result() for future in futures)
+    return results
+
+
+@click.command('sweep')
+@click.option('--task', 'tasks', multiple=True, type=click.Choice(list(SWEEPS)),
+              help='Sweep to run (repeatable, default: unregister then close-flags).')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows locked, changed and committed per statement.')
+@click.option('--grace', type=click.FloatRange(min=0), default=0, show_default=True,
+              help='Seconds a DELETE_CANDIDATE flag must be open before the domain is unregistered.')
+@click.option('--max-rate', type=click.FloatRange(min=0, min_open=True),
+              help='Upper bound on rows changed per second (default: unthrottled).')
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Parallel workers, coordinated through SKIP LOCKED.')
+def sweep_command(tasks, batch_size, grace, max_rate, workers):
+    """Unregister DELETE_CANDIDATE domains and close flags of unregistered ones"""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = get_db(max_connections=workers)
+    started = time.monotonic()
+    results = run_sweeps(db, tasks or list(SWEEPS), batch_size, grace, max_rate, workers)
+    elapsed = time.monotonic() - started
+    for name, rows in results.items():
+        click.echo(f"{name}: {rows} rows")
+    total = sum(results.values())
+    click.echo(f"Total: {total} rows in {elapsed:.1f}s, {total / elapsed if elapsed else 0:.0f} rows/s")
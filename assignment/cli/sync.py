@@ -0,0 +1,175 @@
+import logging
+import os
+import sqlite3
+import time
+from .batch import bounded_map
+from .client import DEFAULT_RETRIES
+from .download import download
+from .errors import FileClientError
+from .file_client import validate_uuid
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.manifest.sqlite3'
+DEFAULT_DOWNLOADS = 4
+DEFAULT_BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    uuid TEXT PRIMARY KEY,
+    name TEXT,
+    size INTEGER,
+    mimetype TEXT,
+    create_datetime TEXT,
+    path TEXT NOT NULL,
+    sha256 TEXT,
+    synced_at REAL NOT NULL
+)
+"""
+COLUMNS = ('uuid', 'name', 'size', 'mimetype', 'create_datetime', 'path', 'sha256', 'synced_at')
+
+
+class Manifest:
+    """SQLite index of a mirror directory: uuid -> stat, local path and sha256.
+
+    Changes are buffered and written batch_size at a time, each batch in one
+    transaction, so a sync over many files does not pay a commit (and an
+    fsync) per file.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(SCHEMA)
+        self._puts = []
+        self._removes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def entries(self):
+        """Return {uuid: entry dict} of every file in the manifest"""
+        cursor = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM files")
+        return {row[0]: dict(zip(COLUMNS, row)) for row in cursor}
+
+    def put(self, uuid, stat, path, sha256):
+        self._puts.append((uuid, stat.get('name'), stat.get('size'), stat.get('mimetype'),
+                           stat.get('create_datetime'), path, sha256, time.time()))
+        self._flush_if_full()
+
+    def remove(self, uuid):
+        self._removes.append((uuid,))
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._puts) + len(self._removes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered changes in one transaction"""
+        if not self._puts and not self._removes:
+            return
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) "
+                                  f"VALUES ({', '.join('?' * len(COLUMNS))})", self._puts)
+            self.conn.executemany("DELETE FROM files WHERE uuid = ?", self._removes)
+        self._puts = []
+        self._removes = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def content_changed(entry, stat, directory):
+    """Whether the mirrored copy of entry no longer matches stat.
+
+    Content is identified by size and create_datetime. A local file that is
+    missing or has the wrong size is fetched again as well.
+    """
+    if entry is None or entry['sha256'] is None:
+        return True
+    if (entry['size'], entry['create_datetime']) != (stat.get('size'), stat.get('create_datetime')):
+        return True
+    try:
+        return os.stat(os.path.join(directory, entry['path'])).st_size != entry['size']
+    except OSError:
+        return True
+
+
+def sync(client, uuids, directory, workers, downloads=DEFAULT_DOWNLOADS, retries=DEFAULT_RETRIES,
+         batch_size=DEFAULT_BATCH_SIZE, on_error=None):
+    """Mirror uuids into directory, returning counts of what was done.
+
+    Every UUID is stat'ed (workers at a time) and compared with the manifest.
+    Only new files and files whose size or create_datetime changed are
+    downloaded, downloads at a time, through cli.download. Changes of only
+    the name or mimetype just update the manifest. Files that are no longer
+    listed or no longer exist on the server are deleted. on_error(uuid, error)
+    is called for every failed UUID, whose manifest entry is kept as it was.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {'unchanged': 0, 'updated': 0, 'downloaded': 0, 'removed': 0, 'failed': 0}
+
+    def failed(uuid, error):
+        counts['failed'] += 1
+        if on_error is not None:
+            on_error(uuid, error)
+
+    def stat_one(uuid):
+        if not validate_uuid(uuid):
+            raise FileClientError("Invalid UUID format")
+        return client.stat(uuid)
+
+    with Manifest(os.path.join(directory, MANIFEST_NAME), batch_size) as manifest:
+        entries = manifest.entries()
+        # UUIDs to keep: listed ones the server still has, or did not answer for
+        keep = set()
+        fetch = []
+        for uuid, result, error in bounded_map(stat_one, dict.fromkeys(uuids), workers):
+            if error is not None and str(error) == "File not found":
+                continue
+            keep.add(uuid)
+            if error is not None:
+                if not isinstance(error, (FileClientError, OSError)):
+                    raise error
+                failed(uuid, error)
+                continue
+            entry = entries.get(uuid)
+            if content_changed(entry, result, directory):
+                fetch.append((uuid, result))
+            elif (entry['name'], entry['mimetype']) != (result.get('name'), result.get('mimetype')):
+                manifest.put(uuid, result, entry['path'], entry['sha256'])
+                counts['updated'] += 1
+            else:
+                counts['unchanged'] += 1
+
+        def fetch_one(item):
+            uuid, remote = item
+            return download(client, uuid, os.path.join(directory, uuid), retries, stat=remote)
+
+        for (uuid, _), result, error in bounded_map(fetch_one, fetch, downloads):
+            if error is not None:
+                if not isinstance(error, (FileClientError, OSError)):
+                    raise error
+                failed(uuid, error)
+                continue
+            manifest.put(uuid, result, uuid, result['sha256'])
+            counts['downloaded'] += 1
+
+        for uuid in entries.keys() - keep:
+            try:
+                os.unlink(os.path.join(directory, entries[uuid]['path']))
+            except FileNotFoundError:
+                pass
+            manifest.remove(uuid)
+            counts['removed'] += 1
+
+    logger.info(f"Sync of {directory}: {counts}")
+    return counts
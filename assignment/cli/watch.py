@@ -0,0 +1,161 @@
+import json
+import select
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+NOTIFY_CHANNEL = 'domain_state_changed'
+
+ACTIVE_STATE = """
+    SELECT domain_id, fqdn
+    FROM domain_state
+    WHERE registered AND NOT expired
+"""
+
+DOMAIN_STATE = """
+    SELECT domain_id, fqdn, registered AND NOT expired
+    FROM domain_state
+    WHERE domain_id = ANY(%s)
+"""
+
+
+class ActiveSet:
+    """Active fqdns tracked per domain id.
+
+    An fqdn can have several registrations over time, so it only counts as
+    added when its first active registration appears and as removed when
+    its last one goes.
+    """
+
+    def __init__(self):
+        self.domains = {}
+        self.fqdns = Counter()
+
+    def __len__(self):
+        return len(self.fqdns)
+
+    def set(self, domain_id, fqdn):
+        """Record the active fqdn of domain_id (None when it is not active).
+
+        Returns (added fqdn or None, removed fqdn or None).
+        """
+        old = self.domains.get(domain_id)
+        if old == fqdn:
+            return None, None
+        removed = added = None
+        if old is not None:
+            del self.domains[domain_id]
+            self.fqdns[old] -= 1
+            if not self.fqdns[old]:
+                del self.fqdns[old]
+                removed = old
+        if fqdn is not None:
+            self.domains[domain_id] = fqdn
+            self.fqdns[fqdn] += 1
+            if self.fqdns[fqdn] == 1:
+                added = fqdn
+        return added, removed
+
+    def update(self, states):
+        """Apply (domain_id, fqdn or None) pairs, returning the sorted added and removed fqdns"""
+        added, removed = set(), set()
+        for domain_id, fqdn in states:
+            a, r = self.set(domain_id, fqdn)
+            if a is not None:
+                if a in removed:
+                    removed.discard(a)
+                else:
+                    added.add(a)
+            if r is not None:
+                if r in added:
+                    added.discard(r)
+                else:
+                    removed.add(r)
+        return sorted(added), sorted(removed)
+
+    def replace(self, active):
+        """Replace the whole set with (domain_id, fqdn) pairs, returning the changes"""
+        active = dict(active)
+        states = [(domain_id, None) for domain_id in self.domains if domain_id not in active]
+        return self.update(states + list(active.items()))
+
+
+def delta_lines(added, removed):
+    """NDJSON lines describing a change of the active set"""
+    at = datetime.now(timezone.utc).isoformat()
+    return ([json.dumps({'event': 'added', 'fqdn': fqdn, 'at': at}) for fqdn in added]
+            + [json.dumps({'event': 'removed', 'fqdn': fqdn, 'at': at}) for fqdn in removed])
+
+
+class ActiveDomainWatcher:
+    """Keep the active domain set in memory, updated from domain_state notifications.
+
+    LISTEN is issued before the set is loaded, so a change committed while
+    loading is seen again as a notification. Reapplying it is harmless
+    because only the new state of the notified domains is read.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.active = ActiveSet()
+        self.listener = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.listener is not None and not self.listener.closed:
+            self.listener.close()
+
+    def start(self):
+        """LISTEN and load the current active set, returning its fqdns as (added, removed)"""
+        import psycopg2
+        import psycopg2.extensions
+        self.listener = psycopg2.connect(self.db.db_url)
+        self.listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.listener.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return self.resync()
+
+    def resync(self):
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(ACTIVE_STATE)
+                return self.active.replace(cur.fetchall())
+
+    def refresh(self, domain_ids):
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DOMAIN_STATE, (list(domain_ids),))
+                states = {domain_id: fqdn if active else None for domain_id, fqdn, active in cur.fetchall()}
+        # Domains without a state row were deleted
+        return self.active.update((domain_id, states.get(domain_id)) for domain_id in domain_ids)
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds for notifications and apply them, returning (added, removed)"""
+        if select.select([self.listener], [], [], timeout) == ([], [], []):
+            return [], []
+        self.listener.poll()
+        ids = set()
+        resync = False
+        while self.listener.notifies:
+            payload = json.loads(self.listener.notifies.pop(0).payload)
+            resync = resync or payload.get('resync', False)
+            ids.update(payload.get('ids', ()))
+        if resync:
+            return self.resync()
+        if ids:
+            return self.refresh(sorted(ids))
+        return [], []
+
+    def watch(self, duration=None, poll_interval=1.0):
+        """Yield (added, removed) for every change until duration seconds have passed"""
+        deadline = None if duration is None else time.monotonic() + duration
+        while deadline is None or time.monotonic() < deadline:
+            timeout = poll_interval if deadline is None else max(0, min(poll_interval, deadline - time.monotonic()))
+            added, removed = self.poll(timeout)
+            if added or removed:
+                yield added, removed
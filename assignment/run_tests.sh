@@ -72,7 +72,7 @@ echo "$ python cli.py file-client --backend rest stat 123e4567-e89b-12d3-a456-42
 docker-compose exec -T app python cli.py file-client --backend rest stat 123e4567-e89b-12d3-a456-426614174000 || echo "✓ Expected error occurred"
 
 echo ""
-echo "8. Testing gRPC backend (should show not implemented):"
+echo "8. Testing gRPC backend with no server (should show error):"
 echo "$ python cli.py file-client --backend grpc stat 123e4567-e89b-12d3-a456-426614174000"
 docker-compose exec -T app python cli.py file-client --backend grpc stat 123e4567-e89b-12d3-a456-426614174000 || echo "✓ Expected error occurred"
 
@@ -21,13 +21,19 @@ EXCLUDE USING gist (
     tstzrange(registered_at, COALESCE(unregistered_at, 'infinity')) WITH &&
 );
 
+-- Flag history is append-only (new rows, closing valid_to), so it is range
+-- partitioned by valid_from. Monthly partitions are created and archived with
+-- `cli.py partitions`, optionally list sub-partitioned by flag. Rows outside
+-- every monthly partition land in domain_flag_default. The primary key has to
+-- include the partition keys.
 CREATE TABLE domain_flag (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     domain_id INTEGER NOT NULL REFERENCES domain(id) ON DELETE CASCADE,
     flag VARCHAR(32) NOT NULL,
     valid_from TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
     valid_to TIMESTAMP WITH TIME ZONE,
 
+    PRIMARY KEY (id, valid_from, flag),
     CONSTRAINT domain_flag_flag_not_empty CHECK (LENGTH(TRIM(flag)) > 0),
     CONSTRAINT domain_flag_validity_order CHECK (
         valid_to IS NULL OR valid_to > valid_from
@@ -36,11 +42,255 @@ CREATE TABLE domain_flag (
         flag IN ('EXPIRED', 'OUTZONE', 'DELETE_CANDIDATE')
     )
 
-);
+) PARTITION BY RANGE (valid_from);
+
+CREATE TABLE domain_flag_default PARTITION OF domain_flag DEFAULT;
 
 -- Indexes for performance
 CREATE INDEX idx_domain_fqdn ON domain(fqdn);
 CREATE INDEX idx_domain_unregistered ON domain(unregistered_at);
 CREATE INDEX idx_flag_domain_id ON domain_flag(domain_id);
-CREATE INDEX idx_flag_type ON domain_flag(flag);
-CREATE INDEX idx_flag_validity ON domain_flag(valid_from, valid_to);
\ No newline at end of file
+-- Semi-joins of flagged-domains: "does this domain have a flag of this type"
+CREATE INDEX idx_flag_type_domain ON domain_flag(flag, domain_id);
+-- Anti-join of active-domains: only currently open EXPIRED flags
+CREATE INDEX idx_flag_open_expired ON domain_flag(domain_id)
+    WHERE flag = 'EXPIRED' AND valid_to IS NULL;
+-- Active-domains scan in fqdn order over registered domains only
+CREATE INDEX idx_domain_registered_fqdn ON domain(fqdn)
+    WHERE unregistered_at IS NULL;
+CREATE INDEX idx_flag_validity ON domain_flag(valid_from, valid_to);
+-- Point-in-time (--as-of) lookups: "registered at T" / "flag valid at T" as
+-- GiST range containment instead of scanning all history
+CREATE INDEX idx_domain_registration_range ON domain
+    USING gist (tstzrange(registered_at, unregistered_at));
+CREATE INDEX idx_flag_validity_range ON domain_flag
+    USING gist (tstzrange(valid_from, valid_to));
+
+-- Current state of every domain, kept up to date by statement-level triggers
+-- on domain and domain_flag. Open flags (valid_to IS NULL) are stored as the
+-- start of their oldest open period, the ever_* markers cover all history.
+-- Active and flagged lookups then only touch their partial index.
+CREATE TABLE domain_state (
+    domain_id INTEGER PRIMARY KEY REFERENCES domain(id) ON DELETE CASCADE,
+    fqdn VARCHAR(255) NOT NULL,
+    unregistered_at TIMESTAMP WITH TIME ZONE,
+    expired_since TIMESTAMP WITH TIME ZONE,
+    outzone_since TIMESTAMP WITH TIME ZONE,
+    delete_candidate_since TIMESTAMP WITH TIME ZONE,
+    ever_expired BOOLEAN NOT NULL DEFAULT FALSE,
+    ever_outzone BOOLEAN NOT NULL DEFAULT FALSE,
+    registered BOOLEAN GENERATED ALWAYS AS (unregistered_at IS NULL) STORED,
+    expired BOOLEAN GENERATED ALWAYS AS (expired_since IS NOT NULL) STORED,
+    outzone BOOLEAN GENERATED ALWAYS AS (outzone_since IS NOT NULL) STORED,
+    delete_candidate BOOLEAN GENERATED ALWAYS AS (delete_candidate_since IS NOT NULL) STORED
+);
+
+CREATE INDEX idx_state_active ON domain_state(fqdn) WHERE registered AND NOT expired;
+CREATE INDEX idx_state_flagged ON domain_state(fqdn) WHERE ever_expired AND ever_outzone;
+
+-- The state recomputed from the full history: source of the triggers and of
+-- `cli.py state-check`
+CREATE VIEW domain_state_recomputed AS
+SELECT d.id AS domain_id,
+       d.fqdn,
+       d.unregistered_at,
+       f.expired_since,
+       f.outzone_since,
+       f.delete_candidate_since,
+       COALESCE(f.ever_expired, FALSE) AS ever_expired,
+       COALESCE(f.ever_outzone, FALSE) AS ever_outzone
+FROM domain d
+LEFT JOIN LATERAL (
+    SELECT MIN(df.valid_from) FILTER (WHERE df.flag = 'EXPIRED' AND df.valid_to IS NULL) AS expired_since,
+           MIN(df.valid_from) FILTER (WHERE df.flag = 'OUTZONE' AND df.valid_to IS NULL) AS outzone_since,
+           MIN(df.valid_from) FILTER (WHERE df.flag = 'DELETE_CANDIDATE' AND df.valid_to IS NULL)
+               AS delete_candidate_since,
+           BOOL_OR(df.flag = 'EXPIRED') AS ever_expired,
+           BOOL_OR(df.flag = 'OUTZONE') AS ever_outzone
+    FROM domain_flag df
+    WHERE df.domain_id = d.id
+) f ON TRUE;
+
+-- Tells `cli.py watch` which domains changed state. NOTIFY payloads are
+-- limited to 8000 bytes, so large statements ask listeners to resync instead.
+CREATE FUNCTION notify_domain_state(ids INTEGER[]) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    IF cardinality(ids) > 500 THEN
+        PERFORM pg_notify('domain_state_changed', '{"resync": true}');
+    ELSIF cardinality(ids) > 0 THEN
+        PERFORM pg_notify('domain_state_changed', json_build_object('ids', ids)::text);
+    END IF;
+END;
+$$;
+
+-- Rows whose state did not change are neither rewritten nor notified.
+-- The domains are locked first, in id order, so a concurrent writer of the
+-- same domains has committed before the recompute takes its snapshot, and
+-- the last refresh sees every flag. FOR NO KEY UPDATE does not conflict with
+-- the KEY SHARE locks that flag writes take on their domain.
+CREATE FUNCTION refresh_domain_state(ids INTEGER[]) RETURNS VOID LANGUAGE sql AS $$
+    SELECT id FROM domain WHERE id = ANY(ids) ORDER BY id FOR NO KEY UPDATE;
+    WITH changed AS (
+        INSERT INTO domain_state (domain_id, fqdn, unregistered_at, expired_since, outzone_since,
+                                  delete_candidate_since, ever_expired, ever_outzone)
+        SELECT domain_id, fqdn, unregistered_at, expired_since, outzone_since,
+               delete_candidate_since, ever_expired, ever_outzone
+        FROM domain_state_recomputed
+        WHERE domain_id = ANY(ids)
+        ON CONFLICT (domain_id) DO UPDATE SET
+            fqdn = EXCLUDED.fqdn,
+            unregistered_at = EXCLUDED.unregistered_at,
+            expired_since = EXCLUDED.expired_since,
+            outzone_since = EXCLUDED.outzone_since,
+            delete_candidate_since = EXCLUDED.delete_candidate_since,
+            ever_expired = EXCLUDED.ever_expired,
+            ever_outzone = EXCLUDED.ever_outzone
+        WHERE (domain_state.fqdn, domain_state.unregistered_at, domain_state.expired_since,
+               domain_state.outzone_since, domain_state.delete_candidate_since,
+               domain_state.ever_expired, domain_state.ever_outzone)
+              IS DISTINCT FROM
+              (EXCLUDED.fqdn, EXCLUDED.unregistered_at, EXCLUDED.expired_since,
+               EXCLUDED.outzone_since, EXCLUDED.delete_candidate_since,
+               EXCLUDED.ever_expired, EXCLUDED.ever_outzone)
+        RETURNING domain_id
+    )
+    SELECT notify_domain_state(ARRAY(SELECT domain_id FROM changed));
+$$;
+
+-- Recomputes every row in one pass over the flag history, for bulk loads that
+-- run with the triggers below deferred. Listeners are asked to resync.
+CREATE FUNCTION rebuild_domain_state() RETURNS VOID LANGUAGE sql AS $$
+    DELETE FROM domain_state s WHERE NOT EXISTS (SELECT 1 FROM domain d WHERE d.id = s.domain_id);
+    INSERT INTO domain_state (domain_id, fqdn, unregistered_at, expired_since, outzone_since,
+                              delete_candidate_since, ever_expired, ever_outzone)
+    SELECT d.id, d.fqdn, d.unregistered_at, f.expired_since, f.outzone_since, f.delete_candidate_since,
+           COALESCE(f.ever_expired, FALSE), COALESCE(f.ever_outzone, FALSE)
+    FROM domain d
+    LEFT JOIN (
+        SELECT domain_id,
+               MIN(valid_from) FILTER (WHERE flag = 'EXPIRED' AND valid_to IS NULL) AS expired_since,
+               MIN(valid_from) FILTER (WHERE flag = 'OUTZONE' AND valid_to IS NULL) AS outzone_since,
+               MIN(valid_from) FILTER (WHERE flag = 'DELETE_CANDIDATE' AND valid_to IS NULL)
+                   AS delete_candidate_since,
+               BOOL_OR(flag = 'EXPIRED') AS ever_expired,
+               BOOL_OR(flag = 'OUTZONE') AS ever_outzone
+        FROM domain_flag
+        GROUP BY domain_id
+    ) f ON f.domain_id = d.id
+    ON CONFLICT (domain_id) DO UPDATE SET
+        fqdn = EXCLUDED.fqdn,
+        unregistered_at = EXCLUDED.unregistered_at,
+        expired_since = EXCLUDED.expired_since,
+        outzone_since = EXCLUDED.outzone_since,
+        delete_candidate_since = EXCLUDED.delete_candidate_since,
+        ever_expired = EXCLUDED.ever_expired,
+        ever_outzone = EXCLUDED.ever_outzone
+    WHERE (domain_state.fqdn, domain_state.unregistered_at, domain_state.expired_since,
+           domain_state.outzone_since, domain_state.delete_candidate_since,
+           domain_state.ever_expired, domain_state.ever_outzone)
+          IS DISTINCT FROM
+          (EXCLUDED.fqdn, EXCLUDED.unregistered_at, EXCLUDED.expired_since,
+           EXCLUDED.outzone_since, EXCLUDED.delete_candidate_since,
+           EXCLUDED.ever_expired, EXCLUDED.ever_outzone);
+    SELECT pg_notify('domain_state_changed', '{"resync": true}');
+    SELECT pg_notify('domain_data_changed', 'domain_state');
+$$;
+
+-- `SET domain_state.deferred = on` makes the triggers below skip the
+-- statements of that session only. Bulk loads set it and call
+-- rebuild_domain_state() when done. Nothing persistent changes, so a load
+-- that dies halfway cannot leave the triggers off for other sessions.
+CREATE FUNCTION domain_state_deferred() RETURNS BOOLEAN LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(current_setting('domain_state.deferred', true), '') = 'on';
+$$;
+
+-- Transition tables make one refresh per statement, so COPY and bulk
+-- INSERT ... SELECT recompute each touched domain once, not once per row.
+CREATE FUNCTION domain_state_new_domains() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_domain_state(ARRAY(SELECT id FROM new_rows));
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION domain_state_new_flags() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_domain_state(ARRAY(SELECT DISTINCT domain_id FROM new_rows));
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION domain_state_deleted_domains() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    -- Their state rows went with them (ON DELETE CASCADE)
+    PERFORM notify_domain_state(ARRAY(SELECT id FROM old_rows));
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION domain_state_changed_flags() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_domain_state(ARRAY(
+        SELECT domain_id FROM old_rows UNION SELECT domain_id FROM new_rows
+    ));
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION domain_state_deleted_flags() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_domain_state(ARRAY(SELECT DISTINCT domain_id FROM old_rows));
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER domain_state_insert AFTER INSERT ON domain
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_new_domains();
+CREATE TRIGGER domain_state_update AFTER UPDATE ON domain
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_new_domains();
+CREATE TRIGGER domain_state_delete AFTER DELETE ON domain
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_deleted_domains();
+CREATE TRIGGER domain_flag_state_insert AFTER INSERT ON domain_flag
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_new_flags();
+CREATE TRIGGER domain_flag_state_update AFTER UPDATE ON domain_flag
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_changed_flags();
+CREATE TRIGGER domain_flag_state_delete AFTER DELETE ON domain_flag
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION domain_state_deleted_flags();
+
+-- One notification per changing statement (and at most one per transaction,
+-- NOTIFY folds duplicates) so listeners can drop cached query results
+CREATE FUNCTION notify_domain_data_changed() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF domain_state_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('domain_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER domain_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON domain
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_domain_data_changed();
+CREATE TRIGGER domain_flag_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON domain_flag
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_domain_data_changed();
@@ -19,18 +19,23 @@ INSERT INTO domain_flag (domain_id, flag, valid_from, valid_to) VALUES
 SELECT d.fqdn
 FROM domain d
 WHERE d.unregistered_at IS NULL
-  AND d.id NOT IN (
-    SELECT df.domain_id 
-    FROM domain_flag df 
-    WHERE df.flag = 'EXPIRED' 
-        AND df.valid_to IS NULL
+  AND NOT EXISTS (
+    SELECT 1
+    FROM domain_flag df
+    WHERE df.domain_id = d.id
+      AND df.flag = 'EXPIRED'
+      AND df.valid_to IS NULL
   )
 ORDER BY d.fqdn;
 
 SELECT DISTINCT d.fqdn
 FROM domain d
-JOIN domain_flag df1 ON d.id = df1.domain_id
-JOIN domain_flag df2 ON d.id = df2.domain_id
-WHERE df1.flag = 'EXPIRED'
-  AND df2.flag = 'OUTZONE'
+WHERE EXISTS (
+    SELECT 1 FROM domain_flag df
+    WHERE df.domain_id = d.id AND df.flag = 'EXPIRED'
+  )
+  AND EXISTS (
+    SELECT 1 FROM domain_flag df
+    WHERE df.domain_id = d.id AND df.flag = 'OUTZONE'
+  )
 ORDER BY d.fqdn;
\ No newline at end of file
@@ -0,0 +1,47 @@
+import pytest
+from cli.file_server import FileStore, start_grpc_server, start_rest_server
+
+
+class FileServers:
+    """The reference REST and gRPC servers over the files of a directory, on free local ports"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        store = FileStore.from_directory(directory)
+        self.uuids = {stored.name: uuid for uuid, stored in store.files.items()}
+        self._rest = start_rest_server(store, port=0)
+        self._grpc, port = start_grpc_server(store, port=0, workers=4)
+        self.rest = f'http://127.0.0.1:{self._rest.server_address[1]}/'
+        self.grpc = f'127.0.0.1:{port}'
+
+    def options(self, backend):
+        """FileClient keyword arguments pointing backend at these servers"""
+        return dict(base_url=self.rest) if backend == 'rest' else dict(grpc_server=self.grpc)
+
+    def stop(self):
+        self._rest.shutdown()
+        self._rest.server_close()
+        self._grpc.stop(None)
+
+
+def serve(request, directory):
+    """Write the test module's SERVED_FILES ({name: bytes}) to directory and serve them"""
+    for name, content in request.module.SERVED_FILES.items():
+        (directory / name).write_bytes(content)
+    servers = FileServers(directory)
+    request.addfinalizer(servers.stop)
+    return servers
+
+
+@pytest.fixture(scope='module')
+def served(request, tmp_path_factory):
+    """Servers for SERVED_FILES shared by all tests of the module"""
+    return serve(request, tmp_path_factory.mktemp('served'))
+
+
+@pytest.fixture
+def served_fresh(request, tmp_path):
+    """Servers for SERVED_FILES in a directory of the test's own, for tests that change the files"""
+    directory = tmp_path / 'served'
+    directory.mkdir()
+    return serve(request, directory)
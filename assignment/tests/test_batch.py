@@ -0,0 +1,76 @@
+import io
+import json
+import pytest
+from unittest.mock import patch
+from click.testing import CliRunner
+from cli.batch import iter_uuids, bounded_map
+from cli.errors import FileClientError
+from cli.file_client import file_client
+
+
+UUID_A = '123e4567-e89b-12d3-a456-426614174000'
+UUID_B = '00000000-0000-0000-0000-000000000000'
+
+
+class TestBatch:
+    """Test batch mode of the file client"""
+
+    def test_iter_uuids_sources(self):
+        """Test UUIDs are taken from arguments and then from a file, skipping blanks"""
+        uuid_file = io.StringIO(f"{UUID_B}\n\n  # comment\n{UUID_A}  \n")
+
+        assert list(iter_uuids((UUID_A,), uuid_file)) == [UUID_A, UUID_B, UUID_A]
+
+    def test_bounded_map_isolates_failures(self):
+        """Test that one failing item does not abort the others"""
+        def func(item):
+            if item == 3:
+                raise FileClientError("boom")
+            return item * 2
+
+        results = {item: (result, error) for item, result, error in bounded_map(func, iter(range(10)), 2)}
+
+        assert len(results) == 10
+        assert results[4] == (8, None)
+        assert isinstance(results[3][1], FileClientError)
+
+    @patch('cli.client.FileClient.stat')
+    def test_batch_stat_ndjson(self, mock_stat):
+        """Test batch stat prints one JSON object per UUID, including failures"""
+        def stat(uuid):
+            if uuid == UUID_B:
+                raise FileClientError("File not found")
+            return {'name': 'a.txt', 'size': 1}
+        mock_stat.side_effect = stat
+
+        runner = CliRunner()
+        result = runner.invoke(file_client, ['--backend', 'rest', '--uuid-file', '-', 'stat', 'not-a-uuid'],
+                               input=f"{UUID_A}\n{UUID_B}\n")
+
+        assert result.exit_code == 1
+        records = {r['uuid']: r for r in map(json.loads, result.output.splitlines())}
+        assert records[UUID_A] == {'uuid': UUID_A, 'name': 'a.txt', 'size': 1}
+        assert records[UUID_B]['error'] == 'File not found'
+        assert records['not-a-uuid']['error'] == 'Invalid UUID format'
+
+    @patch('cli.client.FileClient.read')
+    def test_batch_read_one_file_per_uuid(self, mock_download, tmp_path):
+        """Test batch read stores each file under its UUID and drops failed ones"""
+        def download(uuid, out, regular_file):
+            if uuid == UUID_B:
+                raise FileClientError("File not found")
+            out.write(b'content')
+            return 7
+        mock_download.side_effect = download
+
+        runner = CliRunner()
+        result = runner.invoke(file_client, ['--backend', 'rest', '--output', str(tmp_path),
+                                             'read', UUID_A, UUID_B])
+
+        assert result.exit_code == 1
+        assert (tmp_path / UUID_A).read_bytes() == b'content'
+        assert not (tmp_path / UUID_B).exists()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
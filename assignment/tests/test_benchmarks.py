@@ -0,0 +1,180 @@
+import os
+import pytest
+from benchmarks.generate_data import generate, parse_rows, chunks
+from cli.db import DatabaseManager
+from cli.state import check_state
+from benchmarks.query_bench import compare, run_benchmark, summarize_plan
+from benchmarks.transfer_bench import csv_block, parse_size, percentile
+from benchmarks.startup_bench import SCENARIOS, check, import_total, parse_importtime, run_scenario
+
+
+def report(**medians):
+    return {'benchmarks': {name: {'warm': {'median': median}} for name, median in medians.items()}}
+
+
+class TestGenerateData:
+    """Test the helpers of the synthetic data generator"""
+
+    @pytest.mark.parametrize("value,expected", [
+        ("50000", 50000),
+        ("1M", 1000000),
+        ("2.5k", 2500),
+        (" 10m ", 10000000),
+    ])
+    def test_parse_rows(self, value, expected):
+        """Test row counts with and without a suffix"""
+        assert parse_rows(value) == expected
+
+    def test_chunks_cover_range(self):
+        """Test chunks are inclusive, contiguous and end exactly at the total"""
+        assert list(chunks(10, 4)) == [(1, 4), (5, 8), (9, 10)]
+        assert list(chunks(3, 10)) == [(1, 3)]
+
+    @pytest.mark.integration
+    @pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+    def test_flags_go_to_generated_domains(self):
+        """Test flags only reference the generated domains when the id sequence is ahead of MAX(id)"""
+        db = DatabaseManager()
+        try:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT setval(pg_get_serial_sequence('domain', 'id'), "
+                                "(SELECT MAX(id) FROM domain) + 100)")
+                    cur.execute("SELECT COUNT(*) FROM domain_flag")
+                    before = cur.fetchone()[0]
+            flags = generate(db, 20, 2, chunk=8, rebuild_indexes=False)
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE d.fqdn LIKE 'bench-%%') "
+                                "FROM domain_flag f JOIN domain d ON d.id = f.domain_id")
+                    assert cur.fetchone() == (before + flags, flags)
+            assert check_state(db) == []
+        finally:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM domain WHERE fqdn LIKE 'bench-%%'")
+            db.close()
+
+
+class TestQueryBench:
+    """Test timing and report comparison of the query benchmark"""
+
+    def test_compare_flags_regression(self):
+        """Test only medians slower than baseline beyond the tolerance are reported"""
+        baseline = report(get_stats=0.010, get_active_domains=0.100)
+        current = report(get_stats=0.0115, get_active_domains=0.150, get_flagged_domains=1.0)
+
+        assert compare(current, baseline, 0.2) == [('get_active_domains', 0.100, 0.150)]
+        assert [name for name, _, _ in compare(current, baseline, 0)] == ['get_stats', 'get_active_domains']
+
+    def test_summarize_plan(self):
+        """Test the headline numbers are lifted out of an EXPLAIN JSON plan"""
+        plan = {'Plan': {'Node Type': 'Aggregate', 'Shared Hit Blocks': 12, 'Shared Read Blocks': 3},
+                'Planning Time': 0.1, 'Execution Time': 2.5}
+
+        summary = summarize_plan(plan)
+
+        assert summary['execution_ms'] == 2.5
+        assert summary['shared_hit_blocks'] == 12
+        assert summary['shared_read_blocks'] == 3
+        assert summary['plan'] is plan
+
+    @pytest.mark.integration
+    @pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+    def test_cold_run_on_own_backend(self):
+        """Test the cold run does not reuse the warm pool's backend and closes its connection"""
+        def backend_pid(db):
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_backend_pid()")
+                    pids.append(cur.fetchone()[0])
+            return pids[-1]
+
+        pids = []
+        db = DatabaseManager()
+        try:
+            backend_pid(db)
+            run_benchmark(db, 'pid', backend_pid, 2)
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE application_name = 'query_bench_pid'")
+                    left = cur.fetchone()[0]
+        finally:
+            db.close()
+
+        warm, cold = pids[0], pids[1]
+        assert cold != warm
+        assert pids[2:] == [warm, warm]
+        assert left == 0
+
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       300 |        400 | io
+import time:       200 |        200 |     json.decoder
+import time:       500 |        700 |   json
+import time:      1000 |       1700 | cli.file_client
+"""
+
+
+def startup_report(median, budget_ms=100, forbidden=()):
+    return {'benchmarks': {'help': {'import': {'median': median}, 'budget_ms': budget_ms,
+                                    'forbidden': list(forbidden)}}}
+
+
+class TestStartupBench:
+    """Test the import time benchmark of the CLI entry points"""
+
+    def test_parse_importtime(self):
+        """Test self/cumulative times and nesting depth are read from -X importtime output"""
+        modules = parse_importtime(IMPORTTIME)
+
+        assert modules['io'] == (300, 400, 0)
+        assert modules['_io'] == (100, 100, 1)
+        assert modules['json.decoder'] == (200, 200, 2)
+        assert import_total(modules) == pytest.approx(0.0021)
+
+    def test_check(self):
+        """Test budgets, forbidden imports and baseline regressions are all reported"""
+        assert check(startup_report(0.05)) == []
+        assert len(check(startup_report(0.15))) == 1
+        assert len(check(startup_report(0.05, forbidden=['grpc']))) == 1
+        assert len(check(startup_report(0.07), startup_report(0.05), tolerance=0.2)) == 1
+        assert check(startup_report(0.055), startup_report(0.05), tolerance=0.2) == []
+
+    @pytest.mark.parametrize("name", ['file-client --help', 'domains --help', 'file-client rest client'])
+    def test_entry_points_skip_heavy_imports(self, name):
+        """Test --help and a REST client never import the unused backends or database drivers"""
+        args, forbidden, _ = SCENARIOS[name]
+
+        assert run_scenario(args, forbidden, repeat=1)['forbidden'] == []
+
+
+class TestTransferBench:
+    """Test the helpers of the transfer benchmark"""
+
+    @pytest.mark.parametrize("value,expected", [
+        ("4096", 4096),
+        ("4K", 4096),
+        ("1M", 1024 ** 2),
+        ("1.5G", 3 * 1024 ** 3 // 2),
+        (" 64MiB ", 64 * 1024 ** 2),
+    ])
+    def test_parse_size(self, value, expected):
+        """Test byte counts with binary suffixes"""
+        assert parse_size(value) == expected
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([7], 0.99) == 7
+
+    def test_csv_block(self):
+        """Test the CSV content has the requested size and whole-looking rows"""
+        block = csv_block(10000)
+
+        assert len(block) == 10000
+        assert block.split(b'\n')[0].count(b',') == 4
@@ -0,0 +1,125 @@
+import json
+import os
+import pytest
+from cli.bulk_load import (secondary_indexes, read_rows, batches, bulk_load, defer_state_triggers,
+                           resume_state_triggers, FLAG_COLUMNS)
+from cli.db import DatabaseManager
+
+
+class TestBulkLoadInput:
+    """Test input parsing of the bulk loader"""
+
+    def test_secondary_indexes_from_schema(self):
+        """Test every CREATE INDEX of schema.sql is picked up with its full statement"""
+        indexes = dict(secondary_indexes())
+
+        assert 'idx_flag_open_expired' in indexes
+        assert indexes['idx_flag_open_expired'].endswith("WHERE flag = 'EXPIRED' AND valid_to IS NULL;")
+        # domain_state refreshes and cascading deletes look flags up by domain_id
+        assert 'idx_flag_domain_id' not in indexes
+
+    def test_read_rows_csv_and_ndjson(self, tmp_path):
+        """Test CSV and NDJSON give the same tuples, empty values becoming NULL"""
+        csv_file = tmp_path / 'flags.csv'
+        csv_file.write_text("fqdn,flag,valid_from,valid_to\na.com,EXPIRED,2024-01-01,\n")
+        ndjson_file = tmp_path / 'flags.ndjson'
+        ndjson_file.write_text(json.dumps({'fqdn': 'a.com', 'flag': 'EXPIRED', 'valid_from': '2024-01-01'}) + "\n\n")
+
+        expected = [('a.com', 'EXPIRED', '2024-01-01', None)]
+        assert list(read_rows(str(csv_file), FLAG_COLUMNS)) == expected
+        assert list(read_rows(str(ndjson_file), FLAG_COLUMNS)) == expected
+
+    def test_batches(self):
+        """Test rows are grouped into bounded batches"""
+        assert [len(b) for b in batches(iter(range(7)), 3)] == [3, 3, 1]
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+class TestBulkLoad:
+    """Test COPY loading against the database"""
+
+    def test_flags_resolve_to_latest_registration(self, tmp_path):
+        """Test a flag is attached to the registration of its fqdn current at valid_from"""
+        domains = tmp_path / 'domains.csv'
+        domains.write_text(
+            "fqdn,registered_at,unregistered_at\n"
+            "bulk-test.cz,2020-01-01 00:00:00+00,2021-01-01 00:00:00+00\n"
+            "bulk-test.cz,2022-01-01 00:00:00+00,\n")
+        flags = tmp_path / 'flags.csv'
+        flags.write_text(
+            "fqdn,flag,valid_from,valid_to\n"
+            "bulk-test.cz,EXPIRED,2020-06-01 00:00:00+00,2020-07-01 00:00:00+00\n"
+            "bulk-test.cz,OUTZONE,2022-06-01 00:00:00+00,\n"
+            "missing.cz,OUTZONE,2022-06-01 00:00:00+00,\n")
+
+        db = DatabaseManager()
+        try:
+            bulk_load(db, str(domains), str(flags), batch_size=1)
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT df.flag, d.registered_at::date::text
+                        FROM domain_flag df JOIN domain d ON d.id = df.domain_id
+                        WHERE d.fqdn = 'bulk-test.cz'
+                        ORDER BY df.valid_from
+                    """)
+                    assert cur.fetchall() == [('EXPIRED', '2020-01-01'), ('OUTZONE', '2022-01-01')]
+        finally:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM domain WHERE fqdn = 'bulk-test.cz'")
+            db.close()
+
+    def test_state_rebuilt_after_load(self, tmp_path):
+        """Test domain_state is rebuilt after the load and the session's triggers work again"""
+        domains = tmp_path / 'domains.csv'
+        domains.write_text("fqdn,registered_at,unregistered_at\nbulk-state.cz,2022-01-01 00:00:00+00,\n")
+        flags = tmp_path / 'flags.csv'
+        flags.write_text("fqdn,flag,valid_from,valid_to\nbulk-state.cz,EXPIRED,2022-06-01 00:00:00+00,\n")
+
+        db = DatabaseManager()
+        try:
+            bulk_load(db, str(domains), str(flags), batch_size=1)
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT s.expired, s.ever_expired FROM domain_state s "
+                                "JOIN domain d ON d.id = s.domain_id WHERE d.fqdn = 'bulk-state.cz'")
+                    assert cur.fetchall() == [(True, True)]
+                    cur.execute("SELECT domain_state_deferred()")
+                    assert cur.fetchone() == (False,)
+        finally:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM domain WHERE fqdn = 'bulk-state.cz'")
+            db.close()
+
+    def test_deferred_triggers_only_skip_own_session(self):
+        """Test a deferring session writes no domain_state rows while other sessions still do"""
+        db = DatabaseManager(min_connections=1, max_connections=2)
+        try:
+            with db.get_connection() as loading, db.get_connection() as other:
+                with loading.cursor() as cur:
+                    defer_state_triggers(cur)
+                    cur.execute("INSERT INTO domain (fqdn) VALUES ('bulk-deferred.cz') RETURNING id")
+                    deferred = cur.fetchone()[0]
+                    cur.execute("SELECT COUNT(*) FROM domain_state WHERE domain_id = %s", (deferred,))
+                    assert cur.fetchone() == (0,)
+                loading.commit()
+                with other.cursor() as cur:
+                    cur.execute("INSERT INTO domain (fqdn) VALUES ('bulk-other.cz') RETURNING id")
+                    cur.execute("SELECT COUNT(*) FROM domain_state WHERE domain_id = %s", (cur.fetchone()[0],))
+                    assert cur.fetchone() == (1,)
+                resume_state_triggers(loading)
+                with loading.cursor() as cur:
+                    cur.execute("SELECT domain_state_deferred()")
+                    assert cur.fetchone() == (False,)
+        finally:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM domain WHERE fqdn IN ('bulk-deferred.cz', 'bulk-other.cz')")
+            db.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,134 @@
+import os
+import time
+import pytest
+from cli.cache import FileCache, CachingClient
+from cli.client import FileClient
+
+
+VALID_UUID = '123e4567-e89b-12d3-a456-426614174000'
+OTHER_UUID = '00000000-0000-0000-0000-000000000000'
+
+
+class FakeClient:
+    """FileClient stand-in counting backend calls"""
+
+    def __init__(self, files):
+        self.files = files
+        self.stat_calls = 0
+        self.read_calls = 0
+        self.remembered = []
+        self.regular_file = None
+
+    def stat(self, uuid):
+        self.stat_calls += 1
+        content, created = self.files[uuid]
+        return {'name': uuid, 'size': len(content), 'create_datetime': created}
+
+    def remember_stat(self, uuid, stat):
+        self.remembered.append(uuid)
+
+    def read(self, uuid, out, regular_file=False):
+        self.read_calls += 1
+        self.regular_file = regular_file
+        content = self.files[uuid][0]
+        out.write(content)
+        return len(content)
+
+    def close(self):
+        pass
+
+
+class TestFileCache:
+    """Test the on-disk file client cache"""
+
+    def test_stat_served_from_cache_until_ttl(self, tmp_path):
+        """Test stat results are reused until they expire"""
+        backend = FakeClient({VALID_UUID: (b'data', '2025-01-01T00:00:00Z')})
+        cache = FileCache(str(tmp_path), stat_ttl=60)
+        client = CachingClient(backend, cache)
+
+        assert client.stat(VALID_UUID) == client.stat(VALID_UUID)
+        assert backend.stat_calls == 1
+        assert cache.hits['stat'] == 1 and cache.misses['stat'] == 1
+
+        cache.stat_ttl = 0
+        client.stat(VALID_UUID)
+        assert backend.stat_calls == 2
+
+    def test_read_hit_copies_cached_content(self, tmp_path):
+        """Test a second read is served from the cache into the output file"""
+        backend = FakeClient({VALID_UUID: (b'x' * 100000, '2025-01-01T00:00:00Z')})
+        client = CachingClient(backend, FileCache(str(tmp_path / 'cache')))
+
+        for name in ('first', 'second'):
+            with open(tmp_path / name, 'wb') as out:
+                assert client.read(VALID_UUID, out) == 100000
+
+        assert backend.read_calls == 1
+        assert (tmp_path / 'second').read_bytes() == b'x' * 100000
+        assert client.cache.hits['read'] == 1
+
+    def test_read_revalidated_against_stat(self, tmp_path):
+        """Test cached content is not used when the file metadata changed"""
+        files = {VALID_UUID: (b'old', '2025-01-01T00:00:00Z')}
+        backend = FakeClient(files)
+        client = CachingClient(backend, FileCache(str(tmp_path / 'cache'), stat_ttl=0))
+
+        with open(tmp_path / 'out', 'wb') as out:
+            client.read(VALID_UUID, out)
+        files[VALID_UUID] = (b'new content', '2025-02-01T00:00:00Z')
+        with open(tmp_path / 'out', 'wb') as out:
+            client.read(VALID_UUID, out)
+
+        assert backend.read_calls == 2
+        assert (tmp_path / 'out').read_bytes() == b'new content'
+
+    def test_lru_eviction(self, tmp_path):
+        """Test the least recently used content is evicted over the byte budget"""
+        backend = FakeClient({
+            VALID_UUID: (b'a' * 600, '2025-01-01T00:00:00Z'),
+            OTHER_UUID: (b'b' * 600, '2025-01-01T00:00:00Z'),
+        })
+        cache = FileCache(str(tmp_path / 'cache'), max_bytes=1000)
+        client = CachingClient(backend, cache)
+
+        with open(os.devnull, 'wb') as out:
+            client.read(VALID_UUID, out)
+            old = time.time() - 100
+            for blob in os.scandir(tmp_path / 'cache' / 'blobs'):
+                os.utime(blob.path, (old, old))
+            client.read(OTHER_UUID, out)
+
+        stat = backend.stat(VALID_UUID)
+        assert cache.get_content(VALID_UUID, stat) is None
+        assert cache.get_content(OTHER_UUID, backend.stat(OTHER_UUID)) is not None
+
+
+    def test_regular_file_passed_through(self, tmp_path):
+        """Test a read into a regular file downloads into the cache file and copies it to the output"""
+        backend = FakeClient({VALID_UUID: (b'y' * 5000, '2025-01-01T00:00:00Z')})
+        client = CachingClient(backend, FileCache(str(tmp_path / 'cache')))
+
+        for name in ('first', 'second'):
+            with open(tmp_path / name, 'wb') as out:
+                assert client.read(VALID_UUID, out, regular_file=True) == 5000
+
+        assert backend.regular_file is True and backend.read_calls == 1
+        assert (tmp_path / 'first').read_bytes() == (tmp_path / 'second').read_bytes() == b'y' * 5000
+
+    def test_cached_stat_reused_for_auto_compression(self, tmp_path, monkeypatch):
+        """Test a stat served from the cache spares --compression auto its own stat"""
+        backend = FakeClient({VALID_UUID: (b'data', '2025-01-01T00:00:00Z')})
+        client = CachingClient(backend, FileCache(str(tmp_path), stat_ttl=60))
+        client.stat(VALID_UUID)
+        client.stat(VALID_UUID)
+        assert backend.remembered == [VALID_UUID]
+
+        file_client = FileClient('rest', compression='auto')
+        monkeypatch.setattr(FileClient, 'stat', lambda *args: pytest.fail("stat called"))
+        file_client.remember_stat(VALID_UUID, {'mimetype': 'text/csv'})
+        assert file_client._encoding(VALID_UUID) in ('gzip', 'zstd')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,119 @@
+import io
+import time
+import pytest
+import requests
+from cli import compression, metrics
+from cli.client import FileClient
+from cli.file_server import accepted_encodings
+from benchmarks.transfer_bench import csv_block, wire_bytes
+
+CSV = csv_block(512 * 1024)
+RANDOM = bytes(range(256)) * 2048
+SERVED_FILES = {'data.csv': CSV, 'data.bin': RANDOM}
+
+
+class TestChoice:
+    """Test how --compression is resolved for a mimetype"""
+
+    @pytest.mark.parametrize("mimetype,expected", [
+        ('text/csv', True),
+        ('application/json', True),
+        ('text/plain; charset=utf-8', True),
+        ('application/vnd.api+json', True),
+        ('image/png', False),
+        ('application/zip', False),
+        ('application/octet-stream', False),
+        (None, False),
+    ])
+    def test_compressible(self, mimetype, expected):
+        """Test text-like types are compressed and binary ones are not"""
+        assert compression.compressible(mimetype) is expected
+
+    def test_auto(self, monkeypatch):
+        """Test auto prefers zstd when it can be decoded"""
+        monkeypatch.setattr(compression, 'zstd_available', lambda: True)
+        assert compression.choose('auto', 'text/csv') == 'zstd'
+        assert compression.choose('auto', 'image/png') is None
+        monkeypatch.setattr(compression, 'zstd_available', lambda: False)
+        assert compression.choose('auto', 'text/csv') == 'gzip'
+
+    def test_explicit(self):
+        """Test explicit choices ignore the mimetype"""
+        assert compression.choose('gzip', 'image/png') == 'gzip'
+        assert compression.choose('none', 'text/csv') is None
+
+    def test_accepted_encodings(self):
+        """Test Accept-Encoding parsing drops codings refused with q=0"""
+        assert accepted_encodings('gzip, zstd;q=0.5, br;q=0, identity') == {'gzip', 'zstd', 'identity'}
+        assert accepted_encodings(None) == set()
+
+
+@pytest.mark.parametrize("backend", ['rest', 'grpc'])
+class TestCompressedReads:
+    """Test compressed reads against the reference file server"""
+
+    @pytest.mark.parametrize("choice", [None, 'none', 'gzip', 'auto'])
+    def test_content_unchanged(self, served, backend, choice):
+        """Test every setting writes the same bytes"""
+        for name, content in (('data.csv', CSV), ('data.bin', RANDOM)):
+            address = served.options(backend)
+            with FileClient(backend, chunk_size=16384, compression=choice, **address) as client:
+                out = io.BytesIO()
+                assert client.read(served.uuids[name], out) == len(content)
+            assert out.getvalue() == content
+
+    def test_wire_bytes(self, served, backend):
+        """Test gzip shrinks text on the wire and auto leaves binary content alone"""
+        address = getattr(served, backend)
+        csv, binary = served.uuids['data.csv'], served.uuids['data.bin']
+
+        plain, _ = wire_bytes(backend, address, csv, 65536, 'none')
+        gzipped, written = wire_bytes(backend, address, csv, 65536, 'gzip')
+        auto_binary, _ = wire_bytes(backend, address, binary, 65536, 'auto')
+
+        assert written == len(CSV)
+        assert gzipped < plain * 0.7
+        assert auto_binary >= len(RANDOM)
+
+    def test_auto_stat_measured_separately(self, served, backend, monkeypatch):
+        """Test the stat behind auto is its own stat event and not part of the read's timings"""
+        slow_stat = getattr(FileClient, f'_stat_{backend}')
+
+        def stat(self, *args, **kwargs):
+            time.sleep(0.2)
+            return slow_stat(self, *args, **kwargs)
+        monkeypatch.setattr(FileClient, f'_stat_{backend}', stat)
+        events = []
+        metrics.subscribe(events.append)
+        try:
+            address = served.options(backend)
+            with FileClient(backend, compression='auto', **address) as client:
+                client.read(served.uuids['data.csv'], io.BytesIO())
+        finally:
+            metrics.unsubscribe(events.append)
+
+        assert [event['operation'] for event in events] == ['stat', 'read']
+        assert events[0]['seconds'] >= 0.2
+        assert events[1]['seconds'] < 0.2
+
+
+class TestRestEncoding:
+    """Test the Content-Encoding of REST responses"""
+
+    def test_gzip_response(self, served):
+        """Test a client accepting gzip gets a gzip body without Content-Length"""
+        response = requests.get(f"{served.rest}file/{served.uuids['data.csv']}/read/",
+                                headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        assert response.content == CSV
+
+    def test_ranges_not_compressed(self, served):
+        """Test Range requests are answered with plain bytes"""
+        response = requests.get(f"{served.rest}file/{served.uuids['data.csv']}/read/",
+                                headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=100-199'})
+
+        assert response.status_code == 206
+        assert 'Content-Encoding' not in response.headers
+        assert response.content == CSV[100:200]
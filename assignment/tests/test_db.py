@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import pytest
+from cli import metrics
+from cli.db import DatabaseManager
+from cli.pool import PoolTimeout
+
+
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set'),
+]
+
+
+@pytest.fixture
+def db():
+    manager = DatabaseManager(min_connections=1, max_connections=2)
+    yield manager
+    manager.close()
+
+
+def private_url(name):
+    """The test database URL, but different enough to get a pool of its own"""
+    url = os.environ['DATABASE_URL']
+    return f"{url}{'&' if '?' in url else '?'}application_name={name}"
+
+
+class TestConnectionPool:
+    """Test pooled connections of DatabaseManager against the seeded database"""
+
+    def test_connection_reused(self, db):
+        """Test consecutive queries share one pooled backend connection"""
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_backend_pid()")
+                first_pid = cur.fetchone()[0]
+        db.get_stats()
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_backend_pid()")
+                assert cur.fetchone()[0] == first_pid
+
+    def test_broken_connection_replaced(self, db):
+        """Test a connection closed while idle is swapped for a fresh one on checkout"""
+        with db.get_connection() as conn:
+            stale = conn
+        stale.close()
+        db.pool.last_used[id(stale)] = 0
+
+        with db.get_connection() as conn:
+            assert not conn.closed
+            assert conn is not stale
+
+    def test_shared_pool_closed_by_last_user(self):
+        """Test closing one manager leaves the pool it shares with another open"""
+        url = private_url('refcount')
+        first, second = DatabaseManager(url), DatabaseManager(url)
+        pool = first.pool
+        assert second.pool is pool
+
+        first.close()
+        assert not pool.closed
+        assert second.get_stats()
+        second.close()
+        assert pool.closed
+
+    def test_pool_min_capped_by_max(self, monkeypatch):
+        """Test max_connections below DB_POOL_MIN caps the minimum as well"""
+        monkeypatch.setenv('DB_POOL_MIN', '4')
+        db = DatabaseManager(private_url('capped'), max_connections=2)
+        try:
+            assert (db.min_connections, db.max_connections) == (2, 2)
+            assert db.get_stats()
+        finally:
+            db.close()
+
+    def test_checkout_waits_for_free_connection(self):
+        """Test a checkout from an exhausted pool waits for a checkin, or times out"""
+        db = DatabaseManager(private_url('exhausted'), min_connections=1, max_connections=1)
+        try:
+            held = threading.Event()
+
+            def hold():
+                with db.get_connection():
+                    held.set()
+                    time.sleep(0.3)
+            worker = threading.Thread(target=hold)
+            worker.start()
+            held.wait()
+            started = time.monotonic()
+            with db.get_connection() as conn:
+                assert not conn.closed
+            assert time.monotonic() - started >= 0.2
+            worker.join()
+
+            db.pool.timeout = 0.1
+            with db.get_connection():
+                with pytest.raises(PoolTimeout):
+                    db.pool.checkout()
+        finally:
+            db.close()
+
+    def test_prepared_statements(self):
+        """Test the fixed queries return the same results when prepared"""
+        plain = DatabaseManager()
+        prepared = DatabaseManager(prepare=True)
+        try:
+            assert prepared.get_active_domains() == plain.get_active_domains()
+            assert prepared.get_stats() == plain.get_stats()
+            with prepared.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT name FROM pg_prepared_statements")
+                    assert {'active_domains', 'stats'} <= {row[0] for row in cur.fetchall()}
+        finally:
+            prepared.close()
+
+
+class TestStats:
+    """Test status counts"""
+
+    def test_stats_exact(self, db):
+        """Test the combined aggregate matches individual counts"""
+        stats = db.get_stats()
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM domain WHERE unregistered_at IS NULL")
+                assert stats['active_domains'] == cur.fetchone()[0]
+                cur.execute("SELECT COUNT(*) FROM domain_flag")
+                assert stats['total_flags'] == cur.fetchone()[0]
+        assert stats['total_domains'] >= stats['active_domains']
+
+    def test_stats_approximate_after_analyze(self, db):
+        """Test planner estimates match exact counts on freshly analyzed tables"""
+        with db.get_connection() as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE domain, domain_flag")
+            conn.autocommit = False
+
+        assert db.get_stats(approximate=True) == db.get_stats()
+
+
+class TestStreaming:
+    """Test server-side cursor streaming"""
+
+    def test_streamed_domains_match_lists(self, db):
+        """Test streaming yields the same rows as the list queries, in order"""
+        assert list(db.iter_active_domains(itersize=2)) == db.get_active_domains()
+        assert list(db.iter_flagged_domains(itersize=2)) == db.get_flagged_domains()
+
+    def test_abandoned_stream_returns_connection(self, db):
+        """Test closing a stream early releases its pooled connection"""
+        stream = db.iter_active_domains(itersize=1)
+        next(stream)
+        stream.close()
+
+        assert db.get_stats()['active_domains'] >= 1
+
+
+class TestQueryMetrics:
+    """Test query events emitted to metrics subscribers"""
+
+    def test_query_events(self, db):
+        """Test list and streamed queries report their time and row count"""
+        events = []
+        callback = metrics.subscribe(events.append)
+        try:
+            domains = db.get_active_domains()
+            streamed = list(db.iter_flagged_domains(itersize=1))
+        finally:
+            metrics.unsubscribe(callback)
+
+        listed, iterated = events
+        assert (listed['query'], listed['rows'], listed['streamed']) == ('active_domains', len(domains), False)
+        assert (iterated['query'], iterated['rows'], iterated['streamed']) == ('flagged_domains', len(streamed), True)
+        assert listed['seconds'] > 0 and iterated['seconds'] > 0
+
+
+def plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def index_tree(db, name):
+    """Names of an index and, for a partitioned index, of all its partitions"""
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass)", (name,))
+            return {row[0] for row in cur.fetchall()}
+
+
+def scanned_flag_tables(nodes):
+    return {n['Relation Name'] for n in nodes if n.get('Relation Name', '').startswith('domain_flag')}
+
+
+class TestQueryPlans:
+    """EXPLAIN regression checks: the domain queries keep using their indexes.
+
+    Sequential scans are disabled so the seed-sized tables still show the
+    plan shape the planner picks at production scale.
+    """
+
+    settings = {'enable_seqscan': 'off'}
+
+    def test_active_domains_anti_join(self, db):
+        """Test active-domains is an anti-join on the open-EXPIRED partial index"""
+        nodes = list(plan_nodes(db.explain('active_domains', settings=self.settings)['Plan']))
+
+        assert 'Anti' in {node.get('Join Type') for node in nodes}
+        assert index_tree(db, 'idx_flag_open_expired') & {node.get('Index Name') for node in nodes}
+        assert not [n for n in nodes if n['Node Type'] == 'Seq Scan' and n['Relation Name'].startswith('domain_flag')]
+        # Sub-partitions of the other flags are pruned
+        assert not [t for t in scanned_flag_tables(nodes) if t.endswith(('_outzone', '_delete_candidate'))]
+
+    def test_flagged_domains_semi_joins(self, db):
+        """Test flagged-domains checks flags through the (flag, domain_id) index"""
+        nodes = list(plan_nodes(db.explain('flagged_domains', settings=self.settings)['Plan']))
+
+        assert index_tree(db, 'idx_flag_type_domain') & {node.get('Index Name') for node in nodes}
+        assert not [n for n in nodes if n['Node Type'] == 'Seq Scan' and n['Relation Name'].startswith('domain_flag')]
+        assert not [t for t in scanned_flag_tables(nodes) if t.endswith('_delete_candidate')]
+
+
+class TestAsOf:
+    """Test point-in-time lookups against the seeded history"""
+
+    def test_active_domains_as_of(self, db):
+        """Test registrations and EXPIRED periods are evaluated at the given time"""
+        assert db.get_active_domains(as_of=datetime(2023, 6, 1, tzinfo=timezone.utc)) == ['expired-domain.net']
+        # flagged-domain.org is EXPIRED from 2024-02-15 until 2024-03-01
+        assert db.get_active_domains(as_of=datetime(2024, 2, 20, tzinfo=timezone.utc)) == ['example.com', 'test.org']
+        assert 'flagged-domain.org' in db.get_active_domains(as_of=datetime(2024, 3, 5, tzinfo=timezone.utc))
+
+    def test_flagged_domains_and_stats_as_of(self, db):
+        """Test only flags started by the given time count"""
+        as_of = datetime(2024, 2, 10, tzinfo=timezone.utc)
+
+        assert db.get_flagged_domains(as_of=as_of) == []
+        assert list(db.iter_flagged_domains(as_of=datetime(2024, 2, 20, tzinfo=timezone.utc))) == ['flagged-domain.org']
+        assert db.get_stats(as_of=datetime(2024, 1, 10, tzinfo=timezone.utc)) == {
+            'total_domains': 2, 'active_domains': 1, 'total_flags': 2,
+        }
+
+    def test_as_of_uses_range_indexes(self, db):
+        """Test "registered at T" is a GiST range lookup, not a scan of all domains"""
+        params = {'as_of': datetime(2024, 2, 20, tzinfo=timezone.utc)}
+        for name in ('active_domains_as_of', 'flagged_domains_as_of', 'stats_as_of'):
+            plan = db.explain(name, settings={'enable_seqscan': 'off'}, params=params)
+
+            assert 'idx_domain_registration_range' in {node.get('Index Name') for node in plan_nodes(plan['Plan'])}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
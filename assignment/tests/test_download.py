@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import pytest
+from click.testing import CliRunner
+from cli.client import FileClient
+from cli.download import download, part_paths
+from cli.errors import FileClientError
+from cli.file_client import file_client
+
+CONTENT = os.urandom(1024 * 1024 + 123)
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+SERVED_FILES = {'data.bin': CONTENT}
+
+
+class LimitedWriter:
+    """Write at most limit bytes, then fail like a dropped connection"""
+
+    def __init__(self, out, limit):
+        self.out = out
+        self.limit = limit
+
+    def write(self, data):
+        if len(data) > self.limit:
+            self.out.write(data[:self.limit])
+            self.limit = 0
+            raise FileClientError("Connection reset")
+        self.limit -= len(data)
+        return self.out.write(data)
+
+
+class FlakyClient:
+    """FileClient wrapper recording read offsets, each read failing after limit bytes"""
+
+    def __init__(self, client, limit=None):
+        self.client = client
+        self.limit = limit
+        self.offsets = []
+
+    def stat(self, uuid):
+        return self.client.stat(uuid)
+
+    def read(self, uuid, out, regular_file=False, offset=0):
+        self.offsets.append(offset)
+        if self.limit is not None:
+            out = LimitedWriter(out, self.limit)
+        return self.client.read(uuid, out, offset=offset)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('cli.download.time.sleep', lambda delay: None)
+
+
+@pytest.mark.parametrize("backend", ['rest', 'grpc'])
+class TestDownload:
+    """Test resumable downloads against the reference file server"""
+
+    def test_download(self, served, backend, tmp_path):
+        """Test the content lands at path with its sha256 and no partial files are left"""
+        path = str(tmp_path / 'data.bin')
+        with FileClient(backend, **served.options(backend)) as client:
+            result = download(client, served.uuids['data.bin'], path)
+
+        assert result['size'] == len(CONTENT)
+        assert result['sha256'] == SHA256
+        assert open(path, 'rb').read() == CONTENT
+        assert os.listdir(tmp_path) == ['data.bin']
+
+    def test_resume_existing_part(self, served, backend, tmp_path):
+        """Test a failed download keeps its part and the next call continues it"""
+        path = str(tmp_path / 'data.bin')
+        with FileClient(backend, chunk_size=65536, **served.options(backend)) as client:
+            with pytest.raises(FileClientError, match='Connection reset'):
+                download(FlakyClient(client, limit=300000), served.uuids['data.bin'], path, retries=0)
+            assert os.path.getsize(part_paths(path)[0]) == 300000
+
+            flaky = FlakyClient(client)
+            result = download(flaky, served.uuids['data.bin'], path)
+
+        assert flaky.offsets == [300000]
+        assert result['sha256'] == SHA256
+        assert open(path, 'rb').read() == CONTENT
+
+    def test_resume_compressed(self, served, backend, tmp_path):
+        """Test the rest of a compressed download is fetched as plain bytes from the offset"""
+        path = str(tmp_path / 'data.bin')
+        with FileClient(backend, chunk_size=65536, compression='gzip', **served.options(backend)) as client:
+            flaky = FlakyClient(client, limit=500000)
+            result = download(flaky, served.uuids['data.bin'], path, retries=1)
+
+        assert flaky.offsets == [0, 500000, 1000000]
+        assert result['sha256'] == SHA256
+
+    def test_retries_from_last_byte(self, served, backend, tmp_path):
+        """Test every failed read is continued where the previous one stopped"""
+        path = str(tmp_path / 'data.bin')
+        with FileClient(backend, chunk_size=65536, **served.options(backend)) as client:
+            flaky = FlakyClient(client, limit=400000)
+            result = download(flaky, served.uuids['data.bin'], path, retries=1)
+
+        assert flaky.offsets == [0, 400000, 800000]
+        assert result['sha256'] == SHA256
+        assert open(path, 'rb').read() == CONTENT
+
+    def test_changed_file_restarts(self, served, backend, tmp_path):
+        """Test a part of a file whose stat changed since is thrown away"""
+        path = str(tmp_path / 'data.bin')
+        part, state = part_paths(path)
+        with open(part, 'wb') as f:
+            f.write(b'x' * 1000)
+        with open(state, 'w') as f:
+            json.dump({'size': len(CONTENT), 'create_datetime': '2000-01-01T00:00:00+00:00'}, f)
+
+        with FileClient(backend, **served.options(backend)) as client:
+            flaky = FlakyClient(client)
+            result = download(flaky, served.uuids['data.bin'], path)
+
+        assert flaky.offsets == [0]
+        assert result['sha256'] == SHA256
+
+    def test_gives_up_without_progress(self, served, backend, tmp_path):
+        """Test reads that keep failing without progress give up after the retries"""
+        path = str(tmp_path / 'data.bin')
+        with FileClient(backend, **served.options(backend)) as client:
+            flaky = FlakyClient(client, limit=0)
+            with pytest.raises(FileClientError):
+                download(flaky, served.uuids['data.bin'], path, retries=2)
+
+        assert flaky.offsets == [0, 0, 0]
+        assert not os.path.exists(path)
+        assert os.path.exists(part_paths(path)[0])
+
+
+class TestResumeOption:
+    """Test --resume of the file client"""
+
+    def test_prints_stat_with_hash(self, served, tmp_path):
+        """Test a resumed read prints the stat and SHA-256 of the stored file"""
+        path = tmp_path / 'data.bin'
+        result = CliRunner().invoke(file_client, [
+            '--backend', 'rest', '--base-url', served.rest, '--resume',
+            '--output', str(path), 'read', served.uuids['data.bin']])
+
+        assert result.exit_code == 0, result.output
+        assert f"Size: {len(CONTENT)} bytes" in result.output
+        assert f"SHA-256: {SHA256}" in result.output
+        assert path.read_bytes() == CONTENT
+
+    def test_batch_records(self, served, tmp_path):
+        """Test batch mode prints one stat record with sha256 per file"""
+        result = CliRunner().invoke(file_client, [
+            '--backend', 'grpc', '--grpc-server', served.grpc, '--resume',
+            '--output', str(tmp_path), 'read', served.uuids['data.bin'], '00000000-0000-0000-0000-000000000000'])
+
+        records = {record['uuid']: record for record in map(json.loads, result.output.splitlines())}
+        assert result.exit_code == 1
+        assert records[served.uuids['data.bin']]['sha256'] == SHA256
+        assert records['00000000-0000-0000-0000-000000000000']['error'] == 'File not found'
+
+    def test_needs_output_file(self):
+        """Test --resume refuses to read to stdout"""
+        result = CliRunner().invoke(file_client, ['--resume', 'read', '123e4567-e89b-12d3-a456-426614174000'])
+
+        assert result.exit_code == 2
+        assert '--resume needs --output' in result.output
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import socket
+import struct
+import time
+import pytest
+import requests
+from cli.client import FileClient, load_grpc_modules
+from cli.errors import FileClientError
+from cli.file_server import FileStore, parse_range
+
+grpc, pb2, pb2_grpc = load_grpc_modules()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPPING = os.path.join(ROOT, 'test_files', 'file_mapping.json')
+MISSING_UUID = '00000000-0000-0000-0000-000000000000'
+
+
+def content(name):
+    with open(os.path.join(ROOT, 'test_files', name), 'rb') as f:
+        return f.read()
+
+
+SERVED_FILES = {'test.csv': content('test.csv'), 'large.bin': bytes(16 * 1024 * 1024)}
+
+
+@pytest.fixture
+def csv_uuid(served):
+    return served.uuids['test.csv']
+
+
+class TestFileStore:
+    """Test the files a server exposes"""
+
+    def test_mapping(self):
+        """Test mapping entries resolve to the files next to the mapping"""
+        with open(MAPPING) as f:
+            mapping = json.load(f)
+        store = FileStore.from_mapping(MAPPING)
+
+        for uuid, entry in mapping.items():
+            assert store.get(uuid).stat()['size'] == entry['size']
+            assert store.get(uuid.upper()).mimetype == entry['mimetype']
+
+    def test_directory_uuids_stable(self, tmp_path):
+        """Test a directory gets the same UUIDs on every load"""
+        (tmp_path / 'a.json').write_text('{}')
+        (tmp_path / 'sub').mkdir()
+        (tmp_path / 'sub' / 'b.csv').write_text('x')
+
+        first, second = FileStore.from_directory(tmp_path), FileStore.from_directory(tmp_path)
+
+        assert set(first.files) == set(second.files)
+        assert sorted(f.mimetype for f in first.files.values()) == ['application/json', 'text/csv']
+
+    @pytest.mark.parametrize("header,expected", [
+        (None, None),
+        ('bytes=0-9', (0, 9)),
+        ('bytes=90-', (90, 92)),
+        ('bytes=-10', (83, 92)),
+        ('bytes=80-1000', (80, 92)),
+        ('items=0-1', None),
+    ])
+    def test_parse_range(self, header, expected):
+        """Test single byte ranges of a 93 byte file"""
+        assert parse_range(header, 93) == expected
+
+    @pytest.mark.parametrize("header", ['bytes=93-', 'bytes=5-1', 'bytes=-0'])
+    def test_unsatisfiable_range(self, header):
+        """Test ranges outside the file are rejected"""
+        with pytest.raises(ValueError):
+            parse_range(header, 93)
+
+
+class TestRestServer:
+    """Test the REST file API against the client"""
+
+    def test_stat_and_read(self, served, csv_uuid):
+        """Test stat metadata and read content served for a mapped file"""
+        with FileClient('rest', base_url=served.rest) as client:
+            stat = client.stat(csv_uuid)
+            out = open(os.devnull, 'wb')
+            with out:
+                assert client.read(csv_uuid, out) == len(content('test.csv'))
+
+        assert (stat['name'], stat['size'], stat['mimetype']) == ('test.csv', 216, 'text/csv')
+
+    def test_read_headers(self, served, csv_uuid):
+        """Test Content-Type, Content-Disposition and the body of a read"""
+        response = requests.get(f'{served.rest}file/{csv_uuid}/read/')
+
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'text/csv'
+        assert response.headers['Content-Disposition'] == 'attachment; filename="test.csv"'
+        assert response.content == content('test.csv')
+
+    def test_range(self, served, csv_uuid):
+        """Test Range requests get 206 with the requested bytes, or 416"""
+        url = f'{served.rest}file/{csv_uuid}/read/'
+
+        partial = requests.get(url, headers={'Range': 'bytes=10-19'})
+        assert partial.status_code == 206
+        assert partial.headers['Content-Range'] == 'bytes 10-19/216'
+        assert partial.content == content('test.csv')[10:20]
+        assert requests.get(url, headers={'Range': 'bytes=500-'}).status_code == 416
+
+    def test_not_found(self, served):
+        """Test unknown and malformed UUIDs answer 404"""
+        assert requests.get(f'{served.rest}file/{MISSING_UUID}/stat/').status_code == 404
+        assert requests.get(f'{served.rest}file/not-a-uuid/read/').status_code == 404
+        with FileClient('rest', base_url=served.rest) as client:
+            with pytest.raises(FileClientError, match='File not found'):
+                client.stat(MISSING_UUID)
+
+    def test_client_disconnect_logged_quietly(self, served, caplog, capsys):
+        """Test a client hanging up mid-body is logged at debug level, without a traceback"""
+        caplog.set_level(logging.DEBUG, logger='cli.file_server')
+        host, port = served.rest.split('//')[1].rstrip('/').split(':')
+        with socket.create_connection((host, int(port))) as sock:
+            sock.sendall(f"GET /file/{served.uuids['large.bin']}/read/ HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            sock.recv(1024)
+            # Reset instead of an orderly close, with most of the body still unsent
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+
+        deadline = time.monotonic() + 5
+        while not any('disconnected' in r.getMessage() for r in caplog.records) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert any('disconnected' in r.getMessage() for r in caplog.records)
+        assert 'Traceback' not in capsys.readouterr().err
+
+
+class TestGrpcServer:
+    """Test the gRPC File service"""
+
+    def test_stat_and_read(self, served, csv_uuid):
+        """Test the client gets the same metadata and content as over REST"""
+        with FileClient('grpc', grpc_server=served.grpc, chunk_size=50) as client:
+            stat = client.stat(csv_uuid)
+            out = open(os.devnull, 'wb')
+            with out:
+                assert client.read(csv_uuid, out) == 216
+
+        assert (stat['name'], stat['size'], stat['mimetype']) == ('test.csv', 216, 'text/csv')
+
+    def test_stat_same_as_rest(self, served, csv_uuid):
+        """Test both backends report identical stats, create_datetime included"""
+        with FileClient('rest', base_url=served.rest) as rest, FileClient('grpc', grpc_server=served.grpc) as grpc_client:
+            stat = rest.stat(csv_uuid)
+            assert grpc_client.stat(csv_uuid) == stat
+        assert stat['create_datetime'].endswith('Z')
+
+    @pytest.mark.parametrize("size,expected", [(50, [50, 50, 50, 50, 16]), (0, [216]), (1000, [216])])
+    def test_chunk_sizes(self, served, csv_uuid, size, expected):
+        """Test replies honour ReadRequest.size, 0 meaning the whole file at once"""
+        with grpc.insecure_channel(served.grpc) as channel:
+            stub = pb2_grpc.FileStub(channel)
+            replies = list(stub.read(pb2.ReadRequest(uuid=pb2.Uuid(value=csv_uuid), size=size)))
+
+        assert [len(reply.data.data) for reply in replies] == expected
+        assert b''.join(reply.data.data for reply in replies) == content('test.csv')
+
+    @pytest.mark.parametrize("uuid,code", [
+        (MISSING_UUID, 'NOT_FOUND'),
+        ('not-a-uuid', 'INVALID_ARGUMENT'),
+    ])
+    def test_errors(self, served, uuid, code):
+        """Test unknown UUIDs get NOT_FOUND and malformed ones INVALID_ARGUMENT"""
+        with grpc.insecure_channel(served.grpc) as channel:
+            stub = pb2_grpc.FileStub(channel)
+            with pytest.raises(grpc.RpcError) as error:
+                stub.stat(pb2.StatRequest(uuid=pb2.Uuid(value=uuid)))
+
+        assert error.value.code().name == code
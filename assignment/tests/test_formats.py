@@ -1,12 +1,14 @@
 import pytest
 from unittest.mock import patch, MagicMock
+from datetime import datetime, timezone
+from cli.client import utc_datetime
 from cli.file_client import stat_rest
 
 
 class TestDataFormats:
     """Test handling of different data formats"""
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     @patch('cli.file_client.write_output')
     def test_stat_output_format(self, mock_write, mock_get):
         """Test that stat output follows expected format"""
@@ -39,7 +41,7 @@ class TestDataFormats:
         for line in expected_lines:
             assert line in output_content
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     @patch('cli.file_client.write_output')
     def test_stat_missing_fields_handling(self, mock_write, mock_get):
         """Test handling of missing fields in API response"""
@@ -64,6 +66,18 @@ class TestDataFormats:
         assert 'MIME Type: Unknown' in output_content  # Default value
         assert 'Created: Unknown' in output_content  # Default value
 
+    @pytest.mark.parametrize("value,expected", [
+        ('2025-01-15T14:30:00Z', '2025-01-15T14:30:00Z'),
+        ('2025-01-15T14:30:00+00:00', '2025-01-15T14:30:00Z'),
+        ('2025-01-15T16:30:00.250000+02:00', '2025-01-15T14:30:00.250000Z'),
+        ('2025-01-15T14:30:00', '2025-01-15T14:30:00Z'),
+        (datetime(2025, 1, 15, 14, 30, tzinfo=timezone.utc), '2025-01-15T14:30:00Z'),
+        ('yesterday', 'yesterday'),
+    ])
+    def test_create_datetime_normalized(self, value, expected):
+        """Test create_datetime is written in UTC with a Z suffix whatever offset it came with"""
+        assert utc_datetime(value) == expected
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
@@ -0,0 +1,159 @@
+import io
+import os
+import shutil
+import time
+import pytest
+from concurrent import futures
+from cli import metrics
+from cli.client import PROTO_DIR, STUB_DIR, FileClient, load_grpc_modules
+from cli.errors import FileClientError
+from cli.file_client import read_grpc, stat_grpc
+
+
+grpc, pb2, pb2_grpc = load_grpc_modules()
+
+VALID_UUID = '123e4567-e89b-12d3-a456-426614174000'
+CONTENT = b'0123456789' * 1000
+
+
+class FakeFileService(pb2_grpc.FileServicer):
+    """In-process File service serving a single file"""
+
+    def __init__(self):
+        self.read_requests = []
+        # Seconds to wait before each chunk after the first, None to stall until cancelled
+        self.pause = 0
+
+    def stat(self, request, context):
+        if request.uuid.value != VALID_UUID:
+            context.abort(grpc.StatusCode.NOT_FOUND, 'File not found')
+        reply = pb2.StatReply()
+        reply.data.name = 'numbers.txt'
+        reply.data.size = len(CONTENT)
+        reply.data.mimetype = 'text/plain'
+        reply.data.create_datetime.FromJsonString('2025-01-15T14:30:00Z')
+        return reply
+
+    def read(self, request, context):
+        self.read_requests.append(request)
+        if request.uuid.value != VALID_UUID:
+            context.abort(grpc.StatusCode.NOT_FOUND, 'File not found')
+        size = request.size or len(CONTENT)
+        for offset in range(0, len(CONTENT), size):
+            if offset and self.pause is None:
+                while context.is_active():
+                    time.sleep(0.05)
+            elif offset:
+                time.sleep(self.pause)
+            yield pb2.ReadReply(data=pb2.ReadReply.Data(data=CONTENT[offset:offset + size]))
+
+
+@pytest.fixture
+def grpc_server():
+    service = FakeFileService()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    pb2_grpc.add_FileServicer_to_server(service, server)
+    port = server.add_insecure_port('localhost:0')
+    server.start()
+    yield f'localhost:{port}', service
+    server.stop(None)
+
+
+class TestGrpcClient:
+    """Test gRPC client against an in-process server"""
+
+    def test_stat_grpc_output(self, grpc_server, tmp_path):
+        """Test that stat output matches the REST format"""
+        address, _ = grpc_server
+        output = tmp_path / 'stat.txt'
+
+        stat_grpc(VALID_UUID, address, str(output))
+
+        content = output.read_text()
+        assert 'Name: numbers.txt' in content
+        assert f'Size: {len(CONTENT)} bytes' in content
+        assert 'MIME Type: text/plain' in content
+        assert 'Created: 2025-01-15T14:30:00' in content
+
+    def test_read_grpc_streams_chunks(self, grpc_server, tmp_path):
+        """Test that chunks are requested with the chunk size and written in order"""
+        address, service = grpc_server
+        output = tmp_path / 'numbers.txt'
+
+        read_grpc(VALID_UUID, address, str(output), chunk_size=128)
+
+        assert output.read_bytes() == CONTENT
+        assert service.read_requests[0].size == 128
+
+    def test_grpc_not_found(self, grpc_server, tmp_path):
+        """Test NOT_FOUND status exits with an error"""
+        address, _ = grpc_server
+
+        with pytest.raises(SystemExit):
+            stat_grpc('00000000-0000-0000-0000-000000000000', address, str(tmp_path / 'out'))
+        with pytest.raises(SystemExit):
+            read_grpc('00000000-0000-0000-0000-000000000000', address, str(tmp_path / 'out'))
+
+    def test_transfer_metrics(self, grpc_server):
+        """Test gRPC reads report the channel connect time and every streamed chunk"""
+        address, _ = grpc_server
+        events = []
+        callback = metrics.subscribe(events.append)
+        try:
+            with FileClient('grpc', grpc_server=address, chunk_size=4000) as client:
+                client.read(VALID_UUID, io.BytesIO())
+                client.stat(VALID_UUID)
+        finally:
+            metrics.unsubscribe(callback)
+
+        read, stat = events
+        assert (read['bytes'], read['chunks']) == (len(CONTENT), 3)
+        assert read['connect_s'] > 0 and stat['connect_s'] == 0
+        assert stat['chunks'] == 1 and stat['first_byte_s'] is not None
+
+    def test_read_timeout_per_message(self, grpc_server):
+        """Test a stream slower than the read timeout overall, but not per chunk, completes"""
+        address, service = grpc_server
+        service.pause = 0.1
+        out = io.BytesIO()
+
+        with FileClient('grpc', grpc_server=address, chunk_size=1000, read_timeout=0.5) as client:
+            assert client.read(VALID_UUID, out) == len(CONTENT)
+        assert out.getvalue() == CONTENT
+
+    def test_stalled_stream_times_out(self, grpc_server):
+        """Test a stream that stops sending is cancelled after the read timeout"""
+        address, service = grpc_server
+        service.pause = None
+        out = io.BytesIO()
+
+        started = time.monotonic()
+        with FileClient('grpc', grpc_server=address, chunk_size=4000, read_timeout=0.3) as client:
+            with pytest.raises(FileClientError, match='No data'):
+                client.read(VALID_UUID, out)
+        assert time.monotonic() - started < 5
+        assert out.getvalue() == CONTENT[:4000]
+
+
+class TestProtoStubs:
+    """Test the precompiled file_service stubs"""
+
+    def test_precompiled_stubs_used(self):
+        """Test the client loads the precompiled stubs from protos/generated/"""
+        assert os.path.dirname(os.path.abspath(pb2.__file__)) == STUB_DIR
+
+    def test_stubs_match_proto(self, tmp_path):
+        """Test the stubs are what protoc generates from protos/file_service.proto"""
+        protoc = pytest.importorskip('grpc_tools.protoc')
+        shutil.copy(os.path.join(PROTO_DIR, 'file_service.proto'), tmp_path)
+
+        assert protoc.main(['protoc', f'-I{tmp_path}', f'-I{os.path.dirname(protoc.__file__)}/_proto',
+                            f'--python_out={tmp_path}', f'--grpc_python_out={tmp_path}',
+                            str(tmp_path / 'file_service.proto')]) == 0
+        for name in ('file_service_pb2.py', 'file_service_pb2_grpc.py'):
+            with open(os.path.join(STUB_DIR, name)) as f:
+                assert (tmp_path / name).read_text() == f.read(), f"{name} is stale, regenerate it"
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
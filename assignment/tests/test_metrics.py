@@ -0,0 +1,87 @@
+import io
+import json
+from cli import metrics
+
+
+class TestMetricsHooks:
+    """Test metrics subscribers and writers"""
+
+    def test_disabled_by_default(self):
+        """Test nothing is measured without subscribers"""
+        assert not metrics.enabled()
+        assert metrics.transfer('rest', 'read', 'x') is metrics.NO_TRANSFER
+
+    def test_transfer_event(self):
+        """Test a transfer reports its phases to subscribers when it ends"""
+        events = []
+        callback = metrics.subscribe(events.append)
+        try:
+            with metrics.transfer('grpc', 'read', 'x') as transfer:
+                metrics.connected(0.25)
+                transfer.chunk(10)
+                transfer.chunk(5)
+        finally:
+            metrics.unsubscribe(callback)
+
+        event, = events
+        assert event['event'] == 'transfer'
+        assert (event['backend'], event['operation'], event['ok']) == ('grpc', 'read', True)
+        assert (event['bytes'], event['chunks'], event['connect_s']) == (15, 2, 0.25)
+        assert event['first_byte_s'] is not None and event['seconds'] >= event['first_byte_s']
+
+    def test_failed_transfer(self):
+        """Test a call ending in an exception is reported as not ok"""
+        events = []
+        callback = metrics.subscribe(events.append)
+        try:
+            try:
+                with metrics.transfer('rest', 'stat', 'x'):
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+        finally:
+            metrics.unsubscribe(callback)
+
+        assert (events[0]['ok'], events[0]['error'], events[0]['first_byte_s']) == (False, 'boom', None)
+
+    def test_json_lines(self):
+        """Test the json writer emits one JSON object per event"""
+        out = io.StringIO()
+        finish = metrics.start('json', out)
+        metrics.emit('query', query='stats', seconds=0.5, rows=1)
+        finish()
+
+        assert json.loads(out.getvalue()) == {'event': 'query', 'query': 'stats', 'seconds': 0.5, 'rows': 1}
+        assert not metrics.enabled()
+
+    def test_prometheus_text(self):
+        """Test the prom writer aggregates events into counters and summaries"""
+        out = io.StringIO()
+        finish = metrics.start('prom', out)
+        for seconds in (0.5, 1.5):
+            metrics.emit('transfer', backend='rest', operation='read', ok=True, seconds=seconds, connect_s=0.1,
+                         first_byte_s=None, bytes=100, chunks=2, retries=1)
+        finish()
+
+        lines = out.getvalue().splitlines()
+        assert '# TYPE file_client_seconds summary' in lines
+        assert 'file_client_requests_total{backend="rest",operation="read",ok="true"} 2' in lines
+        assert 'file_client_seconds_sum{backend="rest",operation="read"} 2.0' in lines
+        assert 'file_client_seconds_count{backend="rest",operation="read"} 2' in lines
+        assert 'file_client_bytes_total{backend="rest",operation="read"} 200' in lines
+        assert 'file_client_retries_total{backend="rest",operation="read"} 2' in lines
+        assert not any(line.startswith('file_client_first_byte_seconds') for line in lines)
+
+    def test_prometheus_values_exact(self):
+        """Test counters are written as exact integers and sums of floats unrounded"""
+        out = io.StringIO()
+        finish = metrics.start('prom', out)
+        for seconds in (0.1, 0.2):
+            metrics.emit('transfer', backend='grpc', operation='read', ok=True, seconds=seconds, connect_s=0.0,
+                         first_byte_s=None, bytes=12345678901, chunks=1, retries=0)
+        finish()
+
+        lines = out.getvalue().splitlines()
+        assert 'file_client_bytes_total{backend="grpc",operation="read"} 24691357802' in lines
+        assert f'file_client_seconds_sum{{backend="grpc",operation="read"}} {0.1 + 0.2!r}' in lines
+        assert metrics.sample_value(float('inf')) == '+Inf'
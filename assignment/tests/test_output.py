@@ -7,7 +7,7 @@ from cli.file_client import stat_rest, read_rest
 class TestRestClient:
     """Test REST client logic and error handling"""
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     def test_stat_rest_url_construction(self, mock_get):
         """Test that URLs are constructed correctly"""
         mock_response = MagicMock()
@@ -33,9 +33,9 @@ class TestRestClient:
             
             with patch('cli.file_client.write_output'):
                 stat_rest(valid_uuid, base_url)
-                mock_get.assert_called_with(expected_url, timeout=30)
+                mock_get.assert_called_with(expected_url, timeout=(5, 30))
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     @patch('cli.file_client.write_output')
     def test_stat_rest_response_parsing(self, mock_write, mock_get):
         """Test parsing of different response formats"""
@@ -66,7 +66,7 @@ class TestRestClient:
             # Should not raise exceptions
             stat_rest(valid_uuid, 'http://localhost/')
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     def test_rest_error_handling(self, mock_get):
         """Test error handling for different HTTP status codes"""
         error_cases = [
@@ -87,7 +87,7 @@ class TestRestClient:
             with pytest.raises(SystemExit):
                 stat_rest(valid_uuid, 'http://localhost/')
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     def test_rest_timeout_handling(self, mock_get):
         """Test timeout handling"""
         mock_get.side_effect = requests.Timeout("Request timed out")
@@ -97,7 +97,7 @@ class TestRestClient:
         with pytest.raises(SystemExit):
             stat_rest(valid_uuid, 'http://localhost/')
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     def test_rest_connection_error(self, mock_get):
         """Test connection error handling"""
         mock_get.side_effect = requests.ConnectionError("Connection refused")
@@ -107,6 +107,41 @@ class TestRestClient:
         with pytest.raises(SystemExit):
             stat_rest(valid_uuid, 'http://localhost/')
 
+    @patch('requests.Session.get')
+    def test_read_rest_streams_to_file(self, mock_get, tmp_path):
+        """Test that the body is streamed in chunks into the output file"""
+        chunks = [b'a' * 10, b'b' * 10, b'c' * 5]
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'Content-Length': '25'}
+        mock_response.iter_content.return_value = iter(chunks)
+        mock_get.return_value = mock_response
+
+        valid_uuid = '123e4567-e89b-12d3-a456-426614174000'
+        output = tmp_path / 'out.bin'
+        read_rest(valid_uuid, 'http://localhost/', str(output), chunk_size=10)
+
+        mock_get.assert_called_with(f'http://localhost/file/{valid_uuid}/read/', timeout=(5, 30), stream=True)
+        mock_response.iter_content.assert_called_with(chunk_size=10)
+        mock_response.close.assert_called_once()
+        assert output.read_bytes() == b''.join(chunks)
+
+    @patch('requests.Session.get')
+    def test_read_rest_incomplete_download(self, mock_get, tmp_path):
+        """Test that a body shorter than Content-Length is reported"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'Content-Length': '100'}
+        mock_response.iter_content.return_value = iter([b'partial'])
+        mock_get.return_value = mock_response
+
+        valid_uuid = '123e4567-e89b-12d3-a456-426614174000'
+        output = tmp_path / 'out.bin'
+
+        with pytest.raises(SystemExit):
+            read_rest(valid_uuid, 'http://localhost/', str(output))
+        assert output.read_bytes() == b'partial'
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
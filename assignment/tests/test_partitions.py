@@ -0,0 +1,67 @@
+import os
+from datetime import datetime, timezone
+import pytest
+from cli.db import DatabaseManager
+from cli.partitions import add_months, partition_name, plan_maintenance, maintain
+
+
+def month(year, number):
+    return datetime(year, number, 1, tzinfo=timezone.utc)
+
+
+class TestPlanMaintenance:
+    """Test which domain_flag partitions the maintenance decides to create and detach"""
+
+    now = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+    def test_month_arithmetic(self):
+        """Test months roll over year boundaries in both directions"""
+        assert add_months(month(2024, 11), 3) == month(2025, 2)
+        assert add_months(month(2025, 1), -1) == month(2024, 12)
+        assert partition_name(month(2024, 3)) == 'domain_flag_2024_03'
+
+    def test_creates_current_ahead_and_default_months(self):
+        """Test future months and months stuck in the default partition are created once"""
+        existing = ['domain_flag_default', 'domain_flag_2025_01']
+        default = [datetime(2023, 6, 1, tzinfo=timezone.utc)]
+
+        create, detach = plan_maintenance(existing, default, self.now, ahead=2)
+
+        assert create == [month(2023, 6), month(2025, 2), month(2025, 3)]
+        assert detach == []
+
+    def test_detaches_beyond_retention(self):
+        """Test only monthly partitions older than the retention window are detached"""
+        existing = ['domain_flag_default', 'domain_flag_2024_10', 'domain_flag_2024_11',
+                    'domain_flag_2024_12', 'domain_flag_2025_01', 'domain_flag_archive_copy']
+
+        create, detach = plan_maintenance(existing, [month(2024, 3)], self.now, ahead=0, retain=2)
+
+        assert create == [month(2024, 3)]
+        assert detach == ['domain_flag_2024_03', 'domain_flag_2024_10']
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+class TestPartitionMaintenance:
+    """Test partition maintenance against the seeded database"""
+
+    def test_rows_move_out_of_default_partition(self):
+        """Test seeded flags end up in monthly flag sub-partitions and queries are unchanged"""
+        db = DatabaseManager()
+        try:
+            before = (db.get_stats(), db.get_active_domains(), db.get_flagged_domains())
+            maintain(db, ahead=0)
+            _, detach = maintain(db, ahead=0, dry_run=True)
+
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT tableoid::regclass::text, flag FROM domain_flag")
+                    rows = cur.fetchall()
+
+            assert rows
+            assert all(table.endswith('_' + flag.lower()) for table, flag in rows)
+            assert (db.get_stats(), db.get_active_domains(), db.get_flagged_domains()) == before
+            assert detach == []
+        finally:
+            db.close()
@@ -1,6 +1,7 @@
 import pytest
 import time
 from unittest.mock import patch, MagicMock
+from cli.client import FileClient
 from cli.file_client import validate_uuid, stat_rest
 
 
@@ -24,10 +25,10 @@ class TestPerformance:
         # Should process 2000 validations in under 1 second
         assert elapsed < 1.0, f"UUID validation took {elapsed:.3f}s for 2000 operations"
     
-    @patch('cli.file_client.requests.get')
+    @patch('requests.Session.get')
     @patch('cli.file_client.write_output')
     def test_rest_client_timeout_configuration(self, mock_write, mock_get):
-        """Test that REST client has appropriate timeout"""
+        """Test that REST client has separate connect and read timeouts"""
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {'name': 'test'}
@@ -39,9 +40,20 @@ class TestPerformance:
         
         stat_rest(valid_uuid, 'http://localhost/')
         
-        # Verify timeout is set to 30 seconds
-        mock_get.assert_called_with(f'http://localhost/file/{valid_uuid}/stat/', timeout=30)
+        # Dead servers fail within 5 seconds, slow responses get 30 seconds
+        mock_get.assert_called_with(f'http://localhost/file/{valid_uuid}/stat/', timeout=(5, 30))
 
+        stat_rest(valid_uuid, 'http://localhost/', connect_timeout=1, read_timeout=300)
+        mock_get.assert_called_with(f'http://localhost/file/{valid_uuid}/stat/', timeout=(1, 300))
+
+    def test_rest_client_reuses_session(self):
+        """Test that the client mounts one pooled, retrying adapter for all requests"""
+        with FileClient('rest', pool_size=32, retries=5) as client:
+            adapter = client.session.get_adapter('http://localhost/')
+
+            assert adapter is client.session.get_adapter('https://example.com/')
+            assert adapter._pool_maxsize == 32
+            assert adapter.max_retries.total == 5
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
@@ -0,0 +1,181 @@
+import gzip
+import json
+import re
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cli import metrics
+from cli.client import FileClient
+
+
+VALID_UUID = '123e4567-e89b-12d3-a456-426614174000'
+CONTENT = bytes(range(256)) * 4000
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Minimal REST file server, optionally answering Range requests or gzipping every file"""
+
+    supports_ranges = True
+    gzip_files = False
+    range_requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == f'/file/{VALID_UUID}/stat/':
+            body = json.dumps({'name': 'data.bin', 'size': len(CONTENT)}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        elif self.path == f'/file/{VALID_UUID}/read/':
+            match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+            if self.supports_ranges and match:
+                start, end = int(match.group(1)), int(match.group(2) or len(CONTENT) - 1)
+                self.range_requests.append((start, end))
+                body = CONTENT[start:end + 1]
+                self.send_response(206)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(CONTENT)}')
+            else:
+                body = CONTENT
+                self.send_response(200)
+            if self.gzip_files:
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+        else:
+            self.send_error(404)
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def rest_server(monkeypatch):
+    monkeypatch.setattr('cli.client.RANGE_MIN_SIZE', 1024)
+    FileHandler.range_requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+class TestRangedDownload:
+    """Test parallel ranged REST downloads against a local server"""
+
+    def test_ranged_download(self, rest_server, tmp_path):
+        """Test a file is fetched as concurrent ranges and reassembled"""
+        output = tmp_path / 'data.bin'
+        with FileClient('rest', base_url=rest_server, ranges=4) as client, open(output, 'wb') as out:
+            assert client.read(VALID_UUID, out, regular_file=True) == len(CONTENT)
+
+        assert output.read_bytes() == CONTENT
+        assert sorted(FileHandler.range_requests) == [
+            (0, 255999), (256000, 511999), (512000, 767999), (768000, 1023999)]
+
+    def test_fallback_without_range_support(self, rest_server, tmp_path, monkeypatch):
+        """Test a server ignoring Range gets a single streamed download"""
+        monkeypatch.setattr(FileHandler, 'supports_ranges', False)
+        output = tmp_path / 'data.bin'
+        with FileClient('rest', base_url=rest_server, ranges=4) as client, open(output, 'wb') as out:
+            assert client.read(VALID_UUID, out, regular_file=True) == len(CONTENT)
+
+        assert output.read_bytes() == CONTENT
+        assert FileHandler.range_requests == []
+
+
+@pytest.fixture
+def transfer_events():
+    events = []
+    callback = metrics.subscribe(events.append)
+    yield events
+    metrics.unsubscribe(callback)
+
+
+class TestTransferMetrics:
+    """Test REST transfer metrics against a local server"""
+
+    def test_stat_and_read(self, rest_server, tmp_path, transfer_events):
+        """Test phases, bytes and chunks of a stat and a streamed read"""
+        with FileClient('rest', base_url=rest_server, chunk_size=65536) as client:
+            client.stat(VALID_UUID)
+            with open(tmp_path / 'data.bin', 'wb') as out:
+                client.read(VALID_UUID, out)
+
+        stat, read = transfer_events
+        assert (stat['operation'], stat['ok'], stat['chunks']) == ('stat', True, 1)
+        # The HTTP/1.0 test server closes every connection, so both calls connect
+        assert stat['connect_s'] > 0 and read['connect_s'] > 0
+        assert read['bytes'] == len(CONTENT)
+        assert read['chunks'] == -(-len(CONTENT) // 65536)
+        assert 0 < read['first_byte_s'] <= read['seconds']
+        assert read['throughput_bps'] > 0 and read['retries'] == 0
+
+    def test_ranged_read(self, rest_server, tmp_path, transfer_events):
+        """Test bytes and connections of concurrent ranges add up to one transfer"""
+        with FileClient('rest', base_url=rest_server, ranges=4) as client, open(tmp_path / 'data.bin', 'wb') as out:
+            client.read(VALID_UUID, out, regular_file=True)
+
+        read, = transfer_events
+        assert read['bytes'] == len(CONTENT)
+        assert read['connect_s'] > 0
+
+    def test_not_found(self, rest_server, transfer_events):
+        """Test a failed call is reported with its error"""
+        with FileClient('rest', base_url=rest_server) as client:
+            with pytest.raises(Exception):
+                client.stat('00000000-0000-0000-0000-000000000000')
+
+        assert (transfer_events[0]['ok'], transfer_events[0]['error']) == (False, 'File not found')
+
+
+class TestOffsetRead:
+    """Test reads starting at an offset"""
+
+    def test_range_request(self, rest_server, tmp_path, monkeypatch):
+        """Test the rest of the file is requested with an open-ended Range"""
+        ranges = []
+        monkeypatch.setattr(FileHandler, 'do_GET', record_header(FileHandler.do_GET, 'Range', ranges))
+        output = tmp_path / 'data.bin'
+        with FileClient('rest', base_url=rest_server) as client, open(output, 'wb') as out:
+            assert client.read(VALID_UUID, out, offset=1000) == len(CONTENT) - 1000
+
+        assert ranges == ['bytes=1000-']
+        assert output.read_bytes() == CONTENT[1000:]
+
+    def test_range_ignored(self, rest_server, tmp_path, monkeypatch):
+        """Test the first bytes of a whole-file 200 answer are dropped"""
+        monkeypatch.setattr(FileHandler, 'supports_ranges', False)
+        output = tmp_path / 'data.bin'
+        with FileClient('rest', base_url=rest_server, chunk_size=300) as client, open(output, 'wb') as out:
+            assert client.read(VALID_UUID, out, offset=1000) == len(CONTENT) - 1000
+
+        assert output.read_bytes() == CONTENT[1000:]
+
+    @pytest.mark.parametrize("compression", [None, 'gzip'])
+    def test_range_ignored_compressed(self, rest_server, tmp_path, monkeypatch, compression):
+        """Test an offset read asks for identity and copes with a gzip 200 answer anyway"""
+        encodings = []
+        monkeypatch.setattr(FileHandler, 'do_GET', record_header(FileHandler.do_GET, 'Accept-Encoding', encodings))
+        monkeypatch.setattr(FileHandler, 'supports_ranges', False)
+        monkeypatch.setattr(FileHandler, 'gzip_files', True)
+        output = tmp_path / 'data.bin'
+        with FileClient('rest', base_url=rest_server, compression=compression) as client, \
+                open(output, 'wb') as out:
+            assert client.read(VALID_UUID, out, offset=1000) == len(CONTENT) - 1000
+
+        assert encodings == ['identity']
+        assert output.read_bytes() == CONTENT[1000:]
+
+
+def record_header(do_get, name, values):
+    def wrapper(self):
+        values.append(self.headers.get(name))
+        return do_get(self)
+    return wrapper
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from cli import service as service_module
+from cli.db import DatabaseManager
+from cli.service import ResultCache, QueryService, create_app, encode_domains
+
+
+class TestResultCache:
+    """Test the short-TTL result cache of the query service"""
+
+    def test_concurrent_misses_share_one_load(self):
+        """Test requests arriving while a result loads wait for that load"""
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ['example.com']
+
+        async def scenario():
+            cache = ResultCache(ttl=60)
+            cache.enabled = True
+            results = await asyncio.gather(*(cache.get('active', load) for _ in range(10)))
+            again = await cache.get('active', load)
+            return results, again, cache
+
+        results, again, cache = asyncio.run(scenario())
+
+        assert calls == [1]
+        assert results == [['example.com']] * 10 and again == ['example.com']
+        assert cache.misses == 1 and cache.hits == 10
+
+    def test_invalidate_and_disabled(self):
+        """Test invalidate() drops results and a disabled cache keeps nothing"""
+        values = iter(range(10))
+
+        async def load():
+            return next(values)
+
+        async def scenario():
+            cache = ResultCache(ttl=60)
+            cache.enabled = True
+            first = await cache.get('stats', load)
+            cached = await cache.get('stats', load)
+            cache.invalidate()
+            fresh = await cache.get('stats', load)
+            cache.enabled = False
+            cache.invalidate()
+            uncached = [await cache.get('stats', load) for _ in range(2)]
+            return first, cached, fresh, uncached
+
+        assert asyncio.run(scenario()) == (0, 0, 1, [2, 3])
+
+    def test_bounded_lru(self, monkeypatch):
+        """Test the least recently used result goes first and expired ones are purged on insert"""
+        now = [0.0]
+        monkeypatch.setattr(service_module.time, 'monotonic', lambda: now[0])
+
+        async def scenario():
+            cache = ResultCache(ttl=10, max_entries=3)
+            cache.enabled = True
+            for key in 'abc':
+                cache.put(key, key, cache.generation)
+            cache.lookup('a')
+            cache.put('d', 'd', cache.generation)
+            kept = list(cache._entries)
+            now[0] = 12
+            cache.put('e', 'e', cache.generation)
+            return kept, list(cache._entries)
+
+        assert asyncio.run(scenario()) == (['c', 'a', 'd'], ['e'])
+
+    def test_encode_domains(self, monkeypatch):
+        """Test NDJSON and JSON array encodings across chunk boundaries"""
+        monkeypatch.setattr(service_module, 'STREAM_BATCH', 2)
+        fqdns = ['a.cz', 'b.cz', 'c.cz']
+
+        ndjson = b''.join(encode_domains(fqdns, 'ndjson')).decode().splitlines()
+        array = b''.join(encode_domains(fqdns, 'json'))
+
+        assert [json.loads(line)['fqdn'] for line in ndjson] == fqdns
+        assert json.loads(array) == fqdns
+        assert json.loads(b''.join(encode_domains([], 'json'))) == []
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+class TestQueryService:
+    """Test the HTTP query service against the seeded database"""
+
+    def test_endpoints_match_database_manager(self):
+        """Test status and domain endpoints answer like DatabaseManager, served from cache when repeated"""
+        db = DatabaseManager()
+        try:
+            expected = (db.get_stats(), db.get_active_domains(), db.get_flagged_domains())
+        finally:
+            db.close()
+
+        async def scenario():
+            service = QueryService(cache_ttl=60)
+            async with TestClient(TestServer(create_app(service))) as client:
+                for _ in range(50):
+                    if service.cache.enabled:
+                        break
+                    await asyncio.sleep(0.05)
+                stats = await (await client.get('/status')).json()
+                active = [json.loads(line)['fqdn'] for line in (await (await client.get('/active-domains')).text()).splitlines()]
+                flagged = await (await client.get('/flagged-domains?format=json')).json()
+                await client.get('/active-domains')
+                bad = await client.get('/active-domains?as_of=yesterday')
+                return stats, active, flagged, service.cache.hits, bad.status
+
+        stats, active, flagged, hits, bad_status = asyncio.run(scenario())
+
+        assert {key: stats[key] for key in expected[0]} == expected[0]
+        assert (active, flagged) == expected[1:]
+        assert hits == 1
+        assert bad_status == 400
+
+    def test_domains_streamed_in_batches(self, monkeypatch):
+        """Test domain lists are written batch by batch and only small ones are cached"""
+        monkeypatch.setattr(service_module, 'STREAM_BATCH', 1)
+        db = DatabaseManager()
+        try:
+            expected = db.get_active_domains()
+        finally:
+            db.close()
+
+        async def scenario():
+            service = QueryService(cache_ttl=60)
+            async with TestClient(TestServer(create_app(service))) as client:
+                for _ in range(50):
+                    if service.cache.enabled:
+                        break
+                    await asyncio.sleep(0.05)
+                response = await client.get('/active-domains?format=json')
+                chunks = [chunk async for chunk, _ in response.content.iter_chunks()]
+                monkeypatch.setattr(service_module, 'MAX_CACHED_RESULT', 10)
+                ndjson = await (await client.get('/active-domains')).text()
+                return json.loads(b''.join(chunks)), len(chunks), ndjson, list(service.cache._entries)
+
+        array, chunk_count, ndjson, cached = asyncio.run(scenario())
+
+        assert array == expected
+        assert chunk_count > 1
+        assert [json.loads(line)['fqdn'] for line in ndjson.splitlines()] == expected
+        assert [key[2] for key in cached] == ['json']
+
+    def test_flag_change_invalidates_cache(self):
+        """Test a committed domain_flag change is visible on the next request"""
+        db = DatabaseManager()
+
+        def set_expired_valid_to(value):
+            # flagged-domain.org was EXPIRED from 2024-02-15 until 2024-03-01
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE domain_flag SET valid_to = %s "
+                                "WHERE domain_id = 5 AND flag = 'EXPIRED'", (value,))
+
+        async def active(client):
+            return [json.loads(line)['fqdn'] for line in (await (await client.get('/active-domains')).text()).splitlines()]
+
+        async def scenario():
+            service = QueryService(cache_ttl=60)
+            async with TestClient(TestServer(create_app(service))) as client:
+                for _ in range(50):
+                    if service.cache.enabled:
+                        break
+                    await asyncio.sleep(0.05)
+                before = await active(client)
+                await asyncio.get_running_loop().run_in_executor(None, set_expired_valid_to, None)
+                for _ in range(50):
+                    if not service.cache._entries:
+                        break
+                    await asyncio.sleep(0.05)
+                return before, await active(client)
+
+        try:
+            before, after = asyncio.run(scenario())
+        finally:
+            set_expired_valid_to('2024-03-01')
+            db.close()
+
+        assert 'flagged-domain.org' in before
+        assert 'flagged-domain.org' not in after
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import pytest
+from click.testing import CliRunner
+from cli.db import DatabaseManager
+from cli.state import check_state, repair_state, state_check_command
+
+
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set'),
+]
+
+
+@pytest.fixture
+def db():
+    manager = DatabaseManager(min_connections=1, max_connections=2)
+    yield manager
+    manager.close()
+
+
+def state_of(cur, domain_id):
+    cur.execute("SELECT registered, expired, outzone, ever_expired FROM domain_state WHERE domain_id = %s",
+                (domain_id,))
+    return cur.fetchone()
+
+
+class TestDomainState:
+    """Test the trigger-maintained domain_state table against the seeded database"""
+
+    def test_consistent_with_history(self, db):
+        """Test every domain has a state row equal to the full recomputation"""
+        assert check_state(db) == []
+
+    def test_lookups_match_full_queries(self, db):
+        """Test use_state answers active and flagged lookups like the history queries"""
+        state = DatabaseManager(use_state=True)
+
+        assert state.get_active_domains() == db.get_active_domains()
+        assert state.get_flagged_domains() == db.get_flagged_domains()
+        assert list(state.iter_flagged_domains()) == db.get_flagged_domains()
+
+    def test_triggers_follow_changes(self, db):
+        """Test flag inserts, closing valid_to and unregistering update the state row"""
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO domain (fqdn, registered_at) VALUES ('state-test.cz', '2024-01-01') "
+                            "RETURNING id")
+                domain_id = cur.fetchone()[0]
+                assert state_of(cur, domain_id) == (True, False, False, False)
+
+                cur.execute("INSERT INTO domain_flag (domain_id, flag, valid_from) VALUES "
+                            "(%s, 'EXPIRED', '2024-02-01'), (%s, 'OUTZONE', '2024-02-02')", (domain_id, domain_id))
+                assert state_of(cur, domain_id) == (True, True, True, True)
+
+                cur.execute("UPDATE domain_flag SET valid_to = '2024-03-01' "
+                            "WHERE domain_id = %s AND flag = 'EXPIRED'", (domain_id,))
+                assert state_of(cur, domain_id) == (True, False, True, True)
+
+                cur.execute("UPDATE domain SET unregistered_at = '2024-04-01' WHERE id = %s", (domain_id,))
+                assert state_of(cur, domain_id) == (False, False, True, True)
+            conn.rollback()
+
+    def test_concurrent_closers_of_one_domain(self, db):
+        """Test two transactions closing different flags of one domain leave its state consistent"""
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO domain (fqdn, registered_at) VALUES ('state-race.cz', '2024-01-01') "
+                            "RETURNING id")
+                domain_id = cur.fetchone()[0]
+                cur.execute("INSERT INTO domain_flag (domain_id, flag, valid_from) VALUES "
+                            "(%s, 'EXPIRED', '2024-02-01'), (%s, 'OUTZONE', '2024-02-02')", (domain_id, domain_id))
+
+        def close(flag):
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE domain_flag SET valid_to = now() WHERE domain_id = %s AND flag = %s",
+                                (domain_id, flag))
+
+        try:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE domain_flag SET valid_to = now() "
+                                "WHERE domain_id = %s AND flag = 'EXPIRED'", (domain_id,))
+                    # The second closer runs its statement while the first is still open
+                    other = threading.Thread(target=close, args=('OUTZONE',))
+                    other.start()
+                    time.sleep(0.5)
+            other.join()
+
+            result = CliRunner().invoke(state_check_command, [])
+            assert result.exit_code == 0, result.output
+            assert 'consistent' in result.output
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    assert state_of(cur, domain_id) == (True, False, False, True)
+        finally:
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM domain WHERE id = %s", (domain_id,))
+
+    def test_check_reports_stale_and_extra_rows(self, db):
+        """Test rows differing from history and rows without a domain are reported and repaired"""
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE domain_state SET ever_expired = NOT ever_expired "
+                            "WHERE domain_id = (SELECT MIN(domain_id) FROM domain_state) RETURNING domain_id")
+                stale = cur.fetchone()[0]
+                # Without the foreign key check, like a row left behind by a broken load
+                cur.execute("SET LOCAL session_replication_role = replica")
+                cur.execute("INSERT INTO domain_state (domain_id, fqdn) VALUES (-1, 'gone.cz')")
+
+        assert check_state(db) == [(-1, 'extra'), (stale, 'stale')]
+        repair_state(db, [-1, stale])
+        assert check_state(db) == []
+
+    def test_active_lookup_uses_partial_index(self, db):
+        """Test the state lookup is a scan of its partial index"""
+        nodes = [db.explain('active_domains_state', settings={'enable_seqscan': 'off'})['Plan']]
+        for node in nodes:
+            nodes.extend(node.get('Plans', []))
+
+        assert 'idx_state_active' in {node.get('Index Name') for node in nodes}
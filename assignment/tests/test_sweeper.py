@@ -0,0 +1,116 @@
+import os
+import time
+import pytest
+from click.testing import CliRunner
+from cli.commands import cli
+from cli.db import DatabaseManager
+from cli.state import check_state
+from cli.sweeper import Throttle, run_sweeps, sweep
+
+
+class TestThrottle:
+    """Test the rows/s throttle of the sweeper"""
+
+    def test_unthrottled(self, monkeypatch):
+        """Test no rate never sleeps"""
+        monkeypatch.setattr(time, 'sleep', lambda delay: pytest.fail("slept"))
+        Throttle().add(1_000_000)
+
+    def test_sleeps_to_target_rate(self, monkeypatch):
+        """Test the delay brings the running average down to the rate"""
+        delays = []
+        monkeypatch.setattr(time, 'sleep', delays.append)
+        throttle = Throttle(100)
+
+        throttle.add(50)
+        throttle.add(50)
+
+        assert delays[0] == pytest.approx(0.5, abs=0.05)
+        assert delays[1] == pytest.approx(1.0, abs=0.05)
+
+    def test_no_sleep_when_behind(self, monkeypatch):
+        """Test a sweep slower than the rate is not delayed further"""
+        monkeypatch.setattr(time, 'sleep', lambda delay: pytest.fail("slept"))
+        throttle = Throttle(100)
+        throttle.started -= 10
+
+        throttle.add(50)
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+class TestSweep:
+    """Test the sweeps against the seeded database, restoring it afterwards"""
+
+    @pytest.fixture
+    def db(self):
+        manager = DatabaseManager(min_connections=1, max_connections=4)
+        with manager.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id FROM domain_flag WHERE valid_to IS NULL")
+                open_flags = [row[0] for row in cur.fetchall()]
+                cur.execute("INSERT INTO domain (fqdn, registered_at) VALUES "
+                            "('sweep-a.cz', '2024-01-01'), ('sweep-b.cz', '2024-01-01'), "
+                            "('sweep-c.cz', '2024-01-01') RETURNING id")
+                self.ids = [row[0] for row in cur.fetchall()]
+                cur.execute("""
+                    INSERT INTO domain_flag (domain_id, flag, valid_from) VALUES
+                        (%(a)s, 'DELETE_CANDIDATE', '2024-03-01'), (%(a)s, 'EXPIRED', '2024-02-01'),
+                        (%(b)s, 'DELETE_CANDIDATE', now() + interval '1 day'),
+                        (%(c)s, 'EXPIRED', '2024-02-01')
+                """, dict(zip('abc', self.ids)))
+        yield manager
+        with manager.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM domain WHERE id = ANY(%s)", (self.ids,))
+                cur.execute("UPDATE domain_flag SET valid_to = NULL WHERE id = ANY(%s)", (open_flags,))
+        manager.close()
+
+    def domains(self, db):
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT d.fqdn, d.unregistered_at IS NOT NULL, COUNT(*) FILTER (WHERE df.valid_to IS NULL)
+                    FROM domain d LEFT JOIN domain_flag df ON df.domain_id = d.id
+                    WHERE d.id = ANY(%s)
+                    GROUP BY d.fqdn, d.unregistered_at
+                    ORDER BY d.fqdn
+                """, (self.ids,))
+                return cur.fetchall()
+
+    def test_unregisters_and_closes_flags(self, db):
+        """Test only due candidates are unregistered and their open flags closed"""
+        results = run_sweeps(db, ['unregister', 'close-flags'], batch_size=1)
+
+        assert results['unregister'] == 1
+        assert results['close-flags'] >= 2
+        assert self.domains(db) == [
+            ('sweep-a.cz', True, 0),
+            ('sweep-b.cz', False, 1),
+            ('sweep-c.cz', False, 1),
+        ]
+        assert check_state(db) == []
+
+    def test_idempotent(self, db):
+        """Test a second pass finds nothing left to do"""
+        run_sweeps(db, ['unregister', 'close-flags'])
+
+        assert sweep(db, 'unregister') == 0
+        assert sweep(db, 'close-flags') == 0
+
+    def test_parallel_workers(self, db):
+        """Test workers skip each other's locked rows and change every row once"""
+        results = run_sweeps(db, ['unregister', 'close-flags'], batch_size=1, workers=3)
+
+        assert results['unregister'] == 1
+        assert self.domains(db)[0] == ('sweep-a.cz', True, 0)
+
+    def test_command_with_fewer_workers_than_pool_min(self, db, monkeypatch):
+        """Test sweep --workers caps the pool of the invocation's manager below DB_POOL_MIN"""
+        monkeypatch.setenv('DB_POOL_MIN', '4')
+
+        result = CliRunner().invoke(cli, ['sweep', '--workers', '2', '--batch-size', '1'])
+
+        assert result.exit_code == 0, result.output
+        assert 'unregister: 1 rows' in result.output
+        assert self.domains(db)[0] == ('sweep-a.cz', True, 0)
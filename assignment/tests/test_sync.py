@@ -0,0 +1,132 @@
+import os
+import sqlite3
+from contextlib import closing
+import pytest
+from click.testing import CliRunner
+from cli.client import FileClient
+from cli.errors import FileClientError
+from cli.file_client import file_client
+from cli.sync import MANIFEST_NAME, Manifest, sync
+
+MISSING_UUID = '00000000-0000-0000-0000-000000000000'
+SERVED_FILES = {name: f'content of {name}\n'.encode() for name in ('a.txt', 'b.txt', 'c.json')}
+
+
+def rows(mirror):
+    with closing(sqlite3.connect(mirror / MANIFEST_NAME)) as conn:
+        return {row[0]: row[1:] for row in conn.execute("SELECT uuid, name, size, path, sha256 FROM files")}
+
+
+def mtimes(mirror):
+    return {path.name: path.stat().st_mtime_ns for path in mirror.iterdir() if not path.name.startswith(MANIFEST_NAME)}
+
+
+class FailingClient:
+    """Client whose stat fails for some UUIDs"""
+
+    def __init__(self, client, failing):
+        self.client = client
+        self.failing = failing
+
+    def stat(self, uuid):
+        if uuid in self.failing:
+            raise FileClientError("HTTP 503 Service Unavailable")
+        return self.client.stat(uuid)
+
+    def read(self, *args, **kwargs):
+        return self.client.read(*args, **kwargs)
+
+
+class TestSync:
+    """Test mirroring against the reference file server"""
+
+    def test_initial_and_unchanged(self, served_fresh, tmp_path):
+        """Test the first sync downloads every file and the second touches nothing"""
+        mirror = tmp_path / 'mirror'
+        uuids = list(served_fresh.uuids.values())
+        with FileClient('rest', base_url=served_fresh.rest) as client:
+            first = sync(client, uuids, str(mirror), workers=4)
+            before = mtimes(mirror)
+            second = sync(client, uuids, str(mirror), workers=4)
+
+        assert first['downloaded'] == 3
+        assert second == {'unchanged': 3, 'updated': 0, 'downloaded': 0, 'removed': 0, 'failed': 0}
+        assert mtimes(mirror) == before
+        uuid = served_fresh.uuids['a.txt']
+        assert (mirror / uuid).read_text() == 'content of a.txt\n'
+        assert rows(mirror)[uuid][:3] == ('a.txt', 17, uuid)
+
+    def test_only_changed_downloaded(self, served_fresh, tmp_path):
+        """Test a changed file and a deleted local copy are fetched again, nothing else"""
+        mirror = tmp_path / 'mirror'
+        uuids = served_fresh.uuids
+        with FileClient('rest', base_url=served_fresh.rest) as client:
+            sync(client, uuids.values(), str(mirror), workers=4)
+            (served_fresh.directory / 'a.txt').write_text('changed and longer\n')
+            os.unlink(mirror / uuids['b.txt'])
+            before = mtimes(mirror)
+            counts = sync(client, uuids.values(), str(mirror), workers=4)
+
+        assert counts['downloaded'] == 2 and counts['unchanged'] == 1
+        assert (mirror / uuids['a.txt']).read_text() == 'changed and longer\n'
+        assert mtimes(mirror)[uuids['c.json']] == before[uuids['c.json']]
+
+    def test_prune(self, served_fresh, tmp_path):
+        """Test files no longer listed or gone from the server are deleted"""
+        mirror = tmp_path / 'mirror'
+        uuids = served_fresh.uuids
+        with FileClient('rest', base_url=served_fresh.rest) as client:
+            sync(client, uuids.values(), str(mirror), workers=4)
+            os.unlink(served_fresh.directory / 'b.txt')
+            counts = sync(client, [uuids['a.txt'], uuids['b.txt'], MISSING_UUID], str(mirror), workers=4)
+
+        assert counts['removed'] == 2
+        assert set(rows(mirror)) == {uuids['a.txt']}
+        assert mtimes(mirror).keys() == {uuids['a.txt']}
+
+    def test_failed_stat_keeps_entry(self, served_fresh, tmp_path):
+        """Test a UUID whose stat fails is reported and its copy kept"""
+        mirror = tmp_path / 'mirror'
+        uuids = served_fresh.uuids
+        errors = []
+        with FileClient('rest', base_url=served_fresh.rest) as client:
+            sync(client, uuids.values(), str(mirror), workers=4)
+            counts = sync(FailingClient(client, {uuids['a.txt']}), uuids.values(), str(mirror), workers=4,
+                          on_error=lambda uuid, error: errors.append(uuid))
+
+        assert counts['failed'] == 1 and counts['removed'] == 0
+        assert errors == [uuids['a.txt']]
+        assert uuids['a.txt'] in rows(mirror)
+
+    def test_manifest_batches(self, tmp_path):
+        """Test changes reach the database batch_size at a time"""
+        path = str(tmp_path / MANIFEST_NAME)
+        stat = {'name': 'x', 'size': 1, 'mimetype': 'text/plain', 'create_datetime': 'now'}
+        with Manifest(path, batch_size=2) as manifest:
+            for uuid in ('u1', 'u2', 'u3'):
+                manifest.put(uuid, stat, uuid, 'hash')
+            with Manifest(path) as reader:
+                assert len(reader.entries()) == 2
+        with Manifest(path) as reader:
+            assert len(reader.entries()) == 3
+
+
+class TestSyncCommand:
+    """Test the sync command of the file client"""
+
+    def test_sync_summary(self, served_fresh, tmp_path):
+        """Test the counts are printed and failures set the exit code"""
+        result = CliRunner().invoke(file_client, [
+            '--backend', 'rest', '--base-url', served_fresh.rest, '--output', str(tmp_path / 'mirror'),
+            'sync', *served_fresh.uuids.values(), 'not-a-uuid'])
+
+        assert result.exit_code == 1
+        assert 'Error: not-a-uuid: Invalid UUID format' in result.output
+        assert '0 unchanged, 0 updated, 3 downloaded, 0 removed, 1 failed' in result.output
+
+    def test_needs_output_directory(self):
+        """Test sync refuses to run without --output"""
+        result = CliRunner().invoke(file_client, ['sync', MISSING_UUID])
+
+        assert result.exit_code == 2
+        assert 'sync needs --output' in result.output
@@ -0,0 +1,61 @@
+import os
+import pytest
+from cli.db import DatabaseManager
+from cli.watch import ActiveSet, ActiveDomainWatcher
+
+
+class TestActiveSet:
+    """Test delta computation of the in-memory active set"""
+
+    def test_added_and_removed(self):
+        """Test domains entering and leaving the set are reported once"""
+        active = ActiveSet()
+
+        assert active.replace([(1, 'a.cz'), (2, 'b.cz')]) == (['a.cz', 'b.cz'], [])
+        assert active.update([(2, None), (3, 'c.cz'), (1, 'a.cz')]) == (['c.cz'], ['b.cz'])
+        assert active.replace([(3, 'c.cz')]) == ([], ['a.cz'])
+        assert len(active) == 1
+
+    def test_fqdn_with_several_registrations(self):
+        """Test an fqdn stays active while any of its registrations is"""
+        active = ActiveSet()
+        active.replace([(1, 'a.cz')])
+
+        # re-registration replaces the old one within one change
+        assert active.update([(1, None), (7, 'a.cz')]) == ([], [])
+        assert active.update([(7, None)]) == ([], ['a.cz'])
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL not set')
+class TestActiveDomainWatcher:
+    """Test the watcher against notifications from the seeded database"""
+
+    def test_flag_change_emits_delta(self):
+        """Test opening and closing an EXPIRED flag removes and re-adds the domain"""
+        db = DatabaseManager()
+
+        def set_expired_valid_to(value):
+            # flagged-domain.org was EXPIRED from 2024-02-15 until 2024-03-01
+            with db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE domain_flag SET valid_to = %s "
+                                "WHERE domain_id = 5 AND flag = 'EXPIRED'", (value,))
+
+        try:
+            with ActiveDomainWatcher(db) as watcher:
+                added, removed = watcher.start()
+                assert added == db.get_active_domains() and removed == []
+
+                set_expired_valid_to(None)
+                assert watcher.poll(5) == ([], ['flagged-domain.org'])
+                set_expired_valid_to('2024-03-01')
+                assert watcher.poll(5) == (['flagged-domain.org'], [])
+                # unrelated updates that leave the state alone are not notified
+                with db.get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("UPDATE domain SET updated_at = updated_at")
+                assert watcher.poll(0.2) == ([], [])
+        finally:
+            set_expired_valid_to('2024-03-01')
+            db.close()